@@ -17,6 +17,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django.contrib.sites',
+    'django.contrib.postgres',
     'corsheaders',
     'rest_framework',
     'rest_framework.authtoken',
@@ -166,3 +167,113 @@ SESSION_COOKIE_PATH = '/'
 
 # Trust reverse proxy headers (nginx sets X-Forwarded-Proto)
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
+
+# Barcode scanning
+# Seconds before a worker rebuilds its in-memory brand index even without a
+# local invalidation (picks up writes made by other processes). 0 = never.
+BRAND_INDEX_TTL = config('BRAND_INDEX_TTL', default=300, cast=int)
+# "parallel" queries every barcode provider at once; "sequential" tries
+# them in chain order. In parallel mode the deadline caps each provider call,
+# from when it begins (not while it waits for a free lookup thread).
+BARCODE_LOOKUP_MODE = config('BARCODE_LOOKUP_MODE', default='parallel')
+BARCODE_LOOKUP_DEADLINE = config('BARCODE_LOOKUP_DEADLINE', default=12.0, cast=float)
+# Negative caching of barcodes no provider knows, in seconds. The retry TTL
+# applies when a provider errored or timed out instead of answering. 0 = off.
+BARCODE_MISS_TTL = config('BARCODE_MISS_TTL', default=7 * 24 * 3600, cast=int)
+BARCODE_MISS_RETRY_TTL = config('BARCODE_MISS_RETRY_TTL', default=15 * 60, cast=int)
+# Process-local LRU of ProductInfo in front of BarcodeCache. 0 = off.
+BARCODE_LRU_SIZE = config('BARCODE_LRU_SIZE', default=2048, cast=int)
+BARCODE_LRU_TTL = config('BARCODE_LRU_TTL', default=3600, cast=int)
+# Keep-alive HTTP sessions used by the Open*Facts barcode providers.
+BARCODE_HTTP_POOL_SIZE = config('BARCODE_HTTP_POOL_SIZE', default=10, cast=int)
+BARCODE_CONNECT_TIMEOUT = config('BARCODE_CONNECT_TIMEOUT', default=3.05, cast=float)
+BARCODE_READ_TIMEOUT = config('BARCODE_READ_TIMEOUT', default=10.0, cast=float)
+BARCODE_HTTP_RETRIES = config('BARCODE_HTTP_RETRIES', default=2, cast=int)
+BARCODE_HTTP_BACKOFF = config('BARCODE_HTTP_BACKOFF', default=0.5, cast=float)
+# POST /api/scan/batch/: max barcodes per request, and how many cache-miss
+# barcodes are sent to the providers at once.
+BARCODE_BATCH_MAX = config('BARCODE_BATCH_MAX', default=50, cast=int)
+BARCODE_BATCH_CONCURRENCY = config('BARCODE_BATCH_CONCURRENCY', default=4, cast=int)
+
+# How many ranked alternatives core.alternatives stores per company.
+ALTERNATIVES_STORED = config('ALTERNATIVES_STORED', default=10, cast=int)
+
+# Response cache for /api/companies/ list and detail (core.response_cache).
+# Entries are keyed by the data version, so imports never need to purge it.
+# Any Django cache backend works, e.g. FileBasedCache (LOCATION=/var/tmp/
+# alonovo-api) or RedisCache (LOCATION=redis://127.0.0.1:6379) to share it
+# between workers. Shared backends are pre-warmed when an import finishes.
+API_CACHE_ALIAS = 'api'
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    API_CACHE_ALIAS: {
+        'BACKEND': config('API_CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('API_CACHE_LOCATION', default='alonovo-api'),
+        'TIMEOUT': config('API_CACHE_TIMEOUT', default=24 * 3600, cast=int),
+    },
+}
+
+# Receipt OCR text and Claude parses by content digest (core.receipt_cache),
+# so a re-uploaded receipt skips both. The default file cache survives
+# restarts and is shared by the web and job processes; entries expire after
+# TIMEOUT seconds and a share of them is culled past MAX_ENTRIES.
+RECEIPT_CACHE_ALIAS = 'receipts'
+CACHES[RECEIPT_CACHE_ALIAS] = {
+    'BACKEND': config('RECEIPT_CACHE_BACKEND', default='django.core.cache.backends.filebased.FileBasedCache'),
+    'LOCATION': config('RECEIPT_CACHE_LOCATION', default=str(BASE_DIR / '.receipt-cache')),
+    'TIMEOUT': config('RECEIPT_CACHE_TIMEOUT', default=30 * 24 * 3600, cast=int),
+    'OPTIONS': {
+        'MAX_ENTRIES': config('RECEIPT_CACHE_MAX_ENTRIES', default=10000, cast=int),
+    },
+}
+
+# Claude receipt parsing (core.receipt_parser). Only item lines not resolved
+# locally are sent; more than CHUNK_LINES of them are split into chunks parsed
+# CONCURRENCY requests at a time over one shared client. ANTHROPIC_BASE_URL
+# points the client elsewhere, e.g. a proxy or a local stand-in.
+CLAUDE_PARSE_CHUNK_LINES = config('CLAUDE_PARSE_CHUNK_LINES', default=40, cast=int)
+CLAUDE_PARSE_CONCURRENCY = config('CLAUDE_PARSE_CONCURRENCY', default=4, cast=int)
+CLAUDE_TIMEOUT = config('CLAUDE_TIMEOUT', default=60.0, cast=float)
+ANTHROPIC_BASE_URL = config('ANTHROPIC_BASE_URL', default=None)
+
+# Receipt analysis jobs (core.receipt_jobs, `manage.py process_receipt_jobs`).
+# Jobs each runner processes at once; a job running longer than the timeout is
+# failed; finished jobs are deleted after the retention period (seconds).
+RECEIPT_JOB_WORKERS = config('RECEIPT_JOB_WORKERS', default=2, cast=int)
+RECEIPT_JOB_TIMEOUT = config('RECEIPT_JOB_TIMEOUT', default=300, cast=int)
+RECEIPT_JOB_RETENTION = config('RECEIPT_JOB_RETENTION', default=24 * 3600, cast=int)
+# Longest ?wait= a status request may long-poll for. Each long-poll holds a
+# sync worker for its whole wait, so keep this small.
+RECEIPT_JOB_MAX_WAIT = config('RECEIPT_JOB_MAX_WAIT', default=10.0, cast=float)
+# Multipart receipt uploads are streamed to this directory until their job
+# finishes. Larger uploads are rejected.
+RECEIPT_UPLOAD_DIR = config('RECEIPT_UPLOAD_DIR', default=str(BASE_DIR / '.receipt-uploads'))
+RECEIPT_UPLOAD_MAX_BYTES = config('RECEIPT_UPLOAD_MAX_BYTES', default=20 * 1024 * 1024, cast=int)
+
+# EasyOCR process pool (core.receipt_ocr.OCRPool). Each worker process loads
+# a reader once; 0 = run OCR in the calling process. At most MAX_PENDING
+# images are queued or running; callers wait QUEUE_TIMEOUT seconds for a
+# slot. OCR_TIMEOUT caps a single image.
+OCR_POOL_WORKERS = config('OCR_POOL_WORKERS', default=2, cast=int)
+OCR_POOL_MAX_PENDING = config('OCR_POOL_MAX_PENDING', default=8, cast=int)
+OCR_TIMEOUT = config('OCR_TIMEOUT', default=60.0, cast=float)
+OCR_QUEUE_TIMEOUT = config('OCR_QUEUE_TIMEOUT', default=30.0, cast=float)
+# Photos are downscaled until characters are about this many pixels tall
+# (core.receipt_image); 0 = hand EasyOCR the original image.
+OCR_TEXT_HEIGHT = config('OCR_TEXT_HEIGHT', default=32, cast=int)
+
+# Processes extracting page ranges of long PDF receipts in parallel
+# (core.receipt_pdf); 0 = extract pages in the calling thread. Only worth
+# enabling with spare cores.
+PDF_EXTRACT_WORKERS = config('PDF_EXTRACT_WORKERS', default=0, cast=int)
+
+# NZDPU emissions fetch (`manage.py import_ghg_data`). After the first page
+# reveals the total, the remaining search pages are fetched FETCH_WORKERS at a
+# time. Raw pages are kept in a gzipped snapshot, so reruns (and --dry-run
+# iterations) read it instead of the API until --refresh.
+NZDPU_SEARCH_URL = config('NZDPU_SEARCH_URL', default='https://nzdpu.com/wis/search')
+NZDPU_FETCH_WORKERS = config('NZDPU_FETCH_WORKERS', default=4, cast=int)
+NZDPU_TIMEOUT = config('NZDPU_TIMEOUT', default=30.0, cast=float)
+NZDPU_SNAPSHOT_PATH = config('NZDPU_SNAPSHOT_PATH', default=str(BASE_DIR / '.nzdpu-snapshot.jsonl.gz'))
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from .models import (Claim, Company, CompanyScore, CompanyBadge, CompanyVote, Value, ScoringRule,
                      CompanyValueSnapshot, UserValueWeight, BrandMapping, BarcodeCache,
-                     Product, UnmatchedProduct)
+                     Product, UnmatchedProduct, PendingRescore, ReceiptJob)
 
 
 # ── Inlines ──────────────────────────────────────────────────────────
@@ -57,10 +57,10 @@ class ClaimAdmin(admin.ModelAdmin):
 
 @admin.register(Company)
 class CompanyAdmin(admin.ModelAdmin):
-    list_display = ['ticker', 'name', 'sector', 'website', 'snapshot_count', 'badge_count', 'created_at']
-    list_filter = ['sector']
+    list_display = ['ticker', 'name', 'sector', 'website', 'overall_grade', 'snapshot_count', 'badge_count', 'created_at']
+    list_filter = ['sector', 'overall_grade', 'is_disqualified']
     search_fields = ['ticker', 'name', 'uri']
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['overall_grade', 'average_score', 'is_disqualified', 'created_at', 'updated_at']
     list_per_page = 50
     inlines = [CompanyValueSnapshotInline, CompanyBadgeInline, BrandMappingInline]
 
@@ -195,13 +195,29 @@ class BrandMappingAdmin(admin.ModelAdmin):
 
 @admin.register(BarcodeCache)
 class BarcodeCacheAdmin(admin.ModelAdmin):
-    """Cached barcode lookups from external APIs."""
-    list_display = ['barcode', 'product_name', 'brands', 'owner', 'provider', 'created_at']
-    list_filter = ['provider']
+    """Cached barcode lookups from external APIs, including cached misses."""
+    list_display = ['barcode', 'product_name', 'brands', 'owner', 'provider',
+                    'is_miss', 'expires_at', 'created_at']
+    list_filter = ['provider', 'is_miss']
     search_fields = ['barcode', 'product_name', 'brands', 'owner']
-    readonly_fields = ['raw_response', 'created_at']
+    readonly_fields = ['raw_response', 'provider_results', 'created_at']
     date_hierarchy = 'created_at'
     list_per_page = 50
+    actions = ['purge_misses', 'purge_expired_misses']
+
+    def purge_misses(self, request, queryset):
+        """Delete selected miss entries so those barcodes are looked up again."""
+        deleted, _ = queryset.filter(is_miss=True).delete()
+        self.message_user(request, f"Purged {deleted} cached misses.")
+    purge_misses.short_description = "Purge selected misses"
+
+    def purge_expired_misses(self, request, queryset):
+        """Delete every expired miss entry, regardless of selection."""
+        from django.utils import timezone
+        deleted, _ = BarcodeCache.objects.filter(
+            is_miss=True, expires_at__lte=timezone.now()).delete()
+        self.message_user(request, f"Purged {deleted} expired misses.")
+    purge_expired_misses.short_description = "Purge all expired misses"
 
 
 @admin.register(Product)
@@ -225,3 +241,20 @@ class UnmatchedProductAdmin(admin.ModelAdmin):
         """Mark selected items as reviewed."""
         queryset.update(reviewed=True)
     mark_as_reviewed.short_description = "Mark selected as reviewed"
+
+
+@admin.register(PendingRescore)
+class PendingRescoreAdmin(admin.ModelAdmin):
+    list_display = ['company', 'value', 'reason', 'enqueued_at']
+    list_filter = ['reason', 'value']
+    search_fields = ['company__ticker', 'company__name']
+    list_select_related = ['company', 'value']
+    raw_id_fields = ['company']
+
+
+@admin.register(ReceiptJob)
+class ReceiptJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'status', 'created_at', 'started_at', 'finished_at']
+    list_filter = ['status']
+    readonly_fields = ['id', 'result', 'error', 'created_at', 'started_at', 'finished_at']
+    exclude = ['image_base64', 'upload']
@@ -0,0 +1,122 @@
+"""Precomputed "better alternatives" per company.
+
+Alternatives are companies in the same sector with a higher average
+snapshot score, ranked by animal welfare bonus first and then by
+average score. Rankings are stored in CompanyAlternative and refreshed a
+sector at a time whenever a company's snapshots change (see
+core.derived), so request handlers only read them.
+"""
+from typing import Dict, Iterable, List, Tuple
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Company, CompanyAlternative, CompanyValueSnapshot
+
+
+ANIMAL_WELFARE_VALUES = {'farm_animal_welfare', 'cage_free_eggs', 'cruelty_free'}
+
+
+def rank_alternatives(
+    company_ids: List[int],
+    scores: Dict[int, List[Tuple[str, float]]],
+    limit: int,
+) -> Dict[int, List[Tuple[int, float, float]]]:
+    """Rank alternatives within one sector.
+
+    company_ids is the sector in Company default (name) order; scores maps
+    company id to its (value slug, score) snapshot pairs. Returns
+    {company_id: [(alternative_id, average_score, animal_bonus), ...]}.
+    Companies without snapshots count as average 0 and are never
+    offered as alternatives.
+    """
+    averages = {}
+    bonuses = {}
+    for cid in company_ids:
+        snaps = scores.get(cid)
+        if not snaps:
+            continue
+        averages[cid] = sum(score for _, score in snaps) / len(snaps)
+        # Bonus for animal welfare values
+        bonuses[cid] = sum(
+            0.2 for slug, score in snaps
+            if slug in ANIMAL_WELFARE_VALUES and score > 0.3
+        )
+
+    # Sort once by animal welfare bonus, then overall score; the sort is
+    # stable so ties keep name order.
+    ordered = sorted(averages, key=lambda cid: (bonuses[cid], averages[cid]), reverse=True)
+
+    ranked = {}
+    for cid in company_ids:
+        own_avg = averages.get(cid, 0)
+        picks = []
+        for alt in ordered:
+            if alt != cid and averages[alt] > own_avg:
+                picks.append((alt, averages[alt], bonuses[alt]))
+                if len(picks) >= limit:
+                    break
+        ranked[cid] = picks
+    return ranked
+
+
+def refresh_sectors(sectors: Iterable[str]) -> int:
+    """Recompute stored alternatives for every company in the given sectors.
+
+    Returns the number of CompanyAlternative rows written.
+    """
+    sectors = {s for s in sectors if s}
+    if not sectors:
+        return 0
+
+    members: Dict[str, List[int]] = {}
+    for cid, sector in Company.objects.filter(sector__in=sectors).values_list('id', 'sector'):
+        members.setdefault(sector, []).append(cid)
+
+    scores: Dict[int, List[Tuple[str, float]]] = {}
+    for cid, slug, score in CompanyValueSnapshot.objects.filter(
+        company__sector__in=sectors
+    ).values_list('company_id', 'value_id', 'score'):
+        scores.setdefault(cid, []).append((slug, score))
+
+    rows = []
+    for company_ids in members.values():
+        ranked = rank_alternatives(company_ids, scores, settings.ALTERNATIVES_STORED)
+        for cid, picks in ranked.items():
+            for rank, (alt, avg, bonus) in enumerate(picks):
+                rows.append(CompanyAlternative(
+                    company_id=cid, alternative_id=alt, rank=rank,
+                    average_score=avg, animal_welfare_bonus=bonus,
+                ))
+
+    with transaction.atomic():
+        CompanyAlternative.objects.filter(company__sector__in=sectors).delete()
+        CompanyAlternative.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def refresh_for_companies(company_ids: Iterable[int]) -> int:
+    """Recompute the sectors affected by changes to these companies.
+
+    Covers each company's current sector and any sector where it is
+    still listed as an alternative (e.g. after moving sectors).
+    """
+    company_ids = set(company_ids)
+    if not company_ids:
+        return 0
+    # Companies without a sector get no alternatives
+    CompanyAlternative.objects.filter(
+        company_id__in=company_ids, company__sector__isnull=True
+    ).delete()
+    sectors = set(Company.objects.filter(pk__in=company_ids).values_list('sector', flat=True))
+    sectors |= set(CompanyAlternative.objects.filter(
+        alternative_id__in=company_ids
+    ).values_list('company__sector', flat=True))
+    return refresh_sectors(sectors)
+
+
+def rebuild_all() -> int:
+    """Recompute alternatives for every sector."""
+    CompanyAlternative.objects.filter(company__sector__isnull=True).delete()
+    sectors = Company.objects.exclude(sector__isnull=True).values_list('sector', flat=True).distinct()
+    return refresh_sectors(sectors)
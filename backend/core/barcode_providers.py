@@ -1,24 +1,39 @@
 """Barcode lookup provider chain.
 
-Tries multiple product databases in order until one returns a result.
-Caches results in BarcodeCache to avoid repeated external API calls.
+Tries multiple product databases until one returns a result. In the
+default "parallel" mode all providers are queried at once and the hit
+from the earliest provider in the chain wins; "sequential" mode tries
+them one after another. Caches results in BarcodeCache to avoid
+repeated external API calls, including misses (negative caching) so
+unknown store-brand items don't hit every provider on each scan. A
+bounded process-local LRU (product_cache) sits in front of the table so
+popular barcodes skip the database entirely.
 
 To add a new provider:
     1. Subclass BarcodeProvider
     2. Implement lookup() and name property
     3. Append instance to PROVIDER_CHAIN
 """
+import threading
+import time
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from dataclasses import dataclass
-from typing import Optional, List
+from datetime import timedelta
+from typing import Dict, Optional, List, Tuple
 
 import requests
+from django.conf import settings
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from .models import BarcodeCache
 
 
 USER_AGENT = "Alonovo/1.0 (contact@cooperation.org)"
-REQUEST_TIMEOUT = 10
+RETRY_STATUSES = (429, 500, 502, 503, 504)
 
 
 @dataclass
@@ -48,26 +63,60 @@ class BarcodeProvider(ABC):
 
 
 class OpenProductOpenerProvider(BarcodeProvider):
-    """Provider for any Open *  Facts API (all use the same Product Opener system)."""
+    """Provider for any Open *  Facts API (all use the same Product Opener system).
+
+    Each provider owns a keep-alive requests.Session, created on first use
+    in each worker process, so TCP/TLS setup is paid once rather than per
+    scan. 5xx and 429 responses are retried with exponential backoff.
+    """
 
     def __init__(self, base_url: str, provider_name: str):
         self._base_url = base_url.rstrip('/')
         self._name = provider_name
+        self._session: Optional[requests.Session] = None
+        self._session_lock = threading.Lock()
 
     @property
     def name(self) -> str:
         return self._name
 
+    @property
+    def session(self) -> requests.Session:
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    self._session = self._build_session()
+        return self._session
+
+    def _build_session(self) -> requests.Session:
+        retry = Retry(
+            total=settings.BARCODE_HTTP_RETRIES,
+            backoff_factor=settings.BARCODE_HTTP_BACKOFF,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=["GET"],
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=settings.BARCODE_HTTP_POOL_SIZE,
+            max_retries=retry,
+        )
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers["User-Agent"] = USER_AGENT
+        return session
+
     def lookup(self, barcode: str) -> Optional[ProductInfo]:
         url = f"{self._base_url}/api/v2/product/{barcode}"
         params = {
             "fields": "product_name,brands,owner,categories,image_url,ecoscore_grade"
         }
-        resp = requests.get(
+        resp = self.session.get(
             url,
             params=params,
-            headers={"User-Agent": USER_AGENT},
-            timeout=REQUEST_TIMEOUT,
+            timeout=(settings.BARCODE_CONNECT_TIMEOUT, settings.BARCODE_READ_TIMEOUT),
         )
         if resp.status_code != 200:
             return None
@@ -94,7 +143,7 @@ class OpenProductOpenerProvider(BarcodeProvider):
         )
 
 
-# Provider chain — tried in order, first hit wins
+# Provider chain — earlier providers win when several have the product
 PROVIDER_CHAIN: List[BarcodeProvider] = [
     OpenProductOpenerProvider("https://world.openfoodfacts.net", "open_food_facts"),
     OpenProductOpenerProvider("https://world.openbeautyfacts.org", "open_beauty_facts"),
@@ -103,45 +152,312 @@ PROVIDER_CHAIN: List[BarcodeProvider] = [
 ]
 
 
+# Shared by all parallel lookups in this process. Sized so that losing
+# requests still draining after a winner was picked don't starve new scans.
+_executor = ThreadPoolExecutor(
+    max_workers=len(PROVIDER_CHAIN) * 4,
+    thread_name_prefix="barcode-lookup",
+)
+
+
+class ProductLRU:
+    """Bounded, thread-safe in-process LRU of barcode -> ProductInfo.
+
+    Also holds None for barcodes known to be misses. Entries live for at
+    most BARCODE_LRU_TTL seconds (or until a miss entry's own expiry) and
+    are evicted by core.signals when a BarcodeCache row changes.
+    """
+    _ABSENT = object()
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[Optional[ProductInfo], float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, barcode: str):
+        """Return the cached ProductInfo/None, or ProductLRU._ABSENT."""
+        with self._lock:
+            entry = self._entries.get(barcode)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(barcode)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[barcode]
+            self.misses += 1
+            return self._ABSENT
+
+    def put(self, barcode: str, info: Optional[ProductInfo], ttl: Optional[float] = None) -> None:
+        size = settings.BARCODE_LRU_SIZE
+        ttl = settings.BARCODE_LRU_TTL if ttl is None else min(ttl, settings.BARCODE_LRU_TTL)
+        if size <= 0 or ttl <= 0:
+            return
+        with self._lock:
+            self._entries[barcode] = (info, time.monotonic() + ttl)
+            self._entries.move_to_end(barcode)
+            while len(self._entries) > size:
+                self._entries.popitem(last=False)
+
+    def evict(self, barcode: str) -> None:
+        with self._lock:
+            self._entries.pop(barcode, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+product_cache = ProductLRU()
+
+
 def lookup_barcode(barcode: str) -> Optional[ProductInfo]:
-    """Look up a barcode, checking cache first, then trying each provider.
+    """Look up a barcode, checking caches first, then querying the providers.
 
     Returns ProductInfo or None if no provider has the product.
-    Caches successful lookups in BarcodeCache.
+    Checks the in-process product_cache, then BarcodeCache. Caches
+    successful lookups in both. Misses are cached too, as is_miss rows
+    that short-circuit repeat scans until they expire.
     """
-    # Check cache first
+    local = product_cache.get(barcode)
+    if local is not ProductLRU._ABSENT:
+        return local
+
     cached = BarcodeCache.objects.filter(barcode=barcode).first()
     if cached:
-        return ProductInfo(
-            barcode=cached.barcode,
-            product_name=cached.product_name,
-            brands=cached.brands,
-            owner=cached.owner,
-            categories=cached.categories,
-            image_url=cached.image_url,
-            ecoscore_grade=cached.raw_response.get("product", {}).get("ecoscore_grade", ""),
-            provider=cached.provider,
-            raw_response=cached.raw_response,
-        )
+        found = _use_cache_row(cached)
+        if found is not ProductLRU._ABSENT:
+            return found
+
+    result, outcomes = _query_providers(barcode)
+    _store_lookup(barcode, result, outcomes)
+    return result
+
+
+def lookup_barcodes(barcodes: List[str]) -> Dict[str, Optional[ProductInfo]]:
+    """Batch version of lookup_barcode.
+
+    Resolves what it can from product_cache and a single BarcodeCache
+    query, then queries the providers for the remaining barcodes
+    concurrently (BARCODE_BATCH_CONCURRENCY at a time). Cache writes
+    happen on the calling thread so worker threads never open DB
+    connections. Returns {barcode: ProductInfo or None}.
+    """
+    results: Dict[str, Optional[ProductInfo]] = {}
+    unresolved = []
+    for barcode in dict.fromkeys(barcodes):
+        local = product_cache.get(barcode)
+        if local is ProductLRU._ABSENT:
+            unresolved.append(barcode)
+        else:
+            results[barcode] = local
+
+    to_query = []
+    if unresolved:
+        rows = {row.barcode: row for row in BarcodeCache.objects.filter(barcode__in=unresolved)}
+        for barcode in unresolved:
+            found = _use_cache_row(rows[barcode]) if barcode in rows else ProductLRU._ABSENT
+            if found is ProductLRU._ABSENT:
+                to_query.append(barcode)
+            else:
+                results[barcode] = found
+
+    if to_query:
+        with ThreadPoolExecutor(
+            max_workers=max(1, min(settings.BARCODE_BATCH_CONCURRENCY, len(to_query))),
+            thread_name_prefix="barcode-batch",
+        ) as pool:
+            answers = list(pool.map(_query_providers, to_query))
+        for barcode, (result, outcomes) in zip(to_query, answers):
+            _store_lookup(barcode, result, outcomes)
+            results[barcode] = result
+
+    return results
 
-    # Try each provider in order
+
+def _use_cache_row(cached: BarcodeCache):
+    """Turn a BarcodeCache row into a lookup answer and warm product_cache.
+
+    Returns ProductInfo for a hit, None for an unexpired miss, or
+    ProductLRU._ABSENT when the row is an expired miss and the providers
+    need to be asked again.
+    """
+    if not cached.is_miss:
+        info = _product_info_from_cache(cached)
+        product_cache.put(cached.barcode, info)
+        return info
+    now = timezone.now()
+    if cached.expires_at and cached.expires_at > now:
+        product_cache.put(cached.barcode, None, (cached.expires_at - now).total_seconds())
+        return None
+    return ProductLRU._ABSENT
+
+
+def _query_providers(barcode: str) -> Tuple[Optional[ProductInfo], Dict[str, str]]:
+    if settings.BARCODE_LOOKUP_MODE == "sequential":
+        return _lookup_sequential(barcode)
+    return _lookup_parallel(barcode)
+
+
+def _store_lookup(barcode: str, result: Optional[ProductInfo], outcomes: Dict[str, str]) -> None:
+    if result:
+        _cache_result(result)
+        product_cache.put(barcode, result)
+    else:
+        _cache_miss(barcode, outcomes)
+
+
+def _lookup_sequential(barcode: str) -> Tuple[Optional[ProductInfo], Dict[str, str]]:
+    """Try each provider in chain order, first hit wins.
+
+    Returns (result, outcomes) where outcomes maps provider name to
+    "hit", "miss" or "error".
+    """
+    outcomes: Dict[str, str] = {}
     for provider in PROVIDER_CHAIN:
         try:
             result = provider.lookup(barcode)
             if result:
-                # Cache the result
-                BarcodeCache.objects.create(
-                    barcode=barcode,
-                    product_name=result.product_name,
-                    brands=result.brands,
-                    owner=result.owner,
-                    categories=result.categories,
-                    image_url=result.image_url,
-                    provider=result.provider,
-                    raw_response=result.raw_response,
-                )
-                return result
+                outcomes[provider.name] = "hit"
+                return result, outcomes
+            outcomes[provider.name] = "miss"
         except requests.RequestException:
+            outcomes[provider.name] = "error"
             continue
+    return None, outcomes
+
+
+def _lookup_parallel(barcode: str) -> Tuple[Optional[ProductInfo], Dict[str, str]]:
+    """Query every provider at once and return the highest-priority hit.
+
+    Returns as soon as a provider hits and every provider ahead of it in
+    the chain has missed, so latency is set by the fastest decisive
+    answer rather than the sum of all providers. Each provider gets
+    BARCODE_LOOKUP_DEADLINE seconds from when its call begins, so time
+    spent queued in the shared executor (behind a lookup_barcodes batch)
+    doesn't count; once every provider still running is past it, the best
+    hit so far (or None) is returned. Losing requests are cancelled if they have not started and
+    otherwise left to finish in the background with their results ignored.
+
+    Returns (result, outcomes) like _lookup_sequential, with "timeout" for
+    providers that had not answered by the deadline.
+    """
+    limit = settings.BARCODE_LOOKUP_DEADLINE
+    started: List[Optional[float]] = [None] * len(PROVIDER_CHAIN)
+
+    def call(idx):
+        started[idx] = time.monotonic()
+        return PROVIDER_CHAIN[idx].lookup(barcode)
+
+    futures = [_executor.submit(call, idx) for idx in range(len(PROVIDER_CHAIN))]
+    results: List[Optional[ProductInfo]] = [None] * len(futures)
+    outcomes: Dict[str, str] = {}
+    pending = set(futures)
+
+    try:
+        while pending:
+            # A call that hasn't begun yet is at least `limit` from its deadline
+            now = time.monotonic()
+            deadlines = [now + limit if started[idx] is None else started[idx] + limit
+                         for idx in (futures.index(future) for future in pending)]
+            remaining = max(deadlines) - now
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=min(d for d in deadlines if d > now) - now,
+                                 return_when=FIRST_COMPLETED)
+            for future in done:
+                idx = futures.index(future)
+                name = PROVIDER_CHAIN[idx].name
+                try:
+                    results[idx] = future.result()
+                    outcomes[name] = "hit" if results[idx] else "miss"
+                except requests.RequestException:
+                    outcomes[name] = "error"
+
+            # Walk the chain in priority order: stop at the first provider
+            # that is still running, or return the first hit before it.
+            for idx, provider in enumerate(PROVIDER_CHAIN):
+                if provider.name not in outcomes:
+                    break
+                if results[idx]:
+                    return results[idx], outcomes
+    finally:
+        for future in pending:
+            future.cancel()
+
+    for provider in PROVIDER_CHAIN:
+        outcomes.setdefault(provider.name, "timeout")
+
+    # Deadline hit: fall back to the best answer that did arrive.
+    return next((r for r in results if r), None), outcomes
+
+
+def _product_info_from_cache(cached: BarcodeCache) -> ProductInfo:
+    return ProductInfo(
+        barcode=cached.barcode,
+        product_name=cached.product_name,
+        brands=cached.brands,
+        owner=cached.owner,
+        categories=cached.categories,
+        image_url=cached.image_url,
+        ecoscore_grade=cached.raw_response.get("product", {}).get("ecoscore_grade", ""),
+        provider=cached.provider,
+        raw_response=cached.raw_response,
+    )
+
+
+def _cache_result(result: ProductInfo) -> None:
+    # update_or_create: the barcode may already have an expired miss row
+    BarcodeCache.objects.update_or_create(
+        barcode=result.barcode,
+        defaults={
+            'product_name': result.product_name,
+            'brands': result.brands,
+            'owner': result.owner,
+            'categories': result.categories,
+            'image_url': result.image_url,
+            'provider': result.provider,
+            'raw_response': result.raw_response,
+            'is_miss': False,
+            'provider_results': {},
+            'expires_at': None,
+        },
+    )
+
+
+def _cache_miss(barcode: str, outcomes: Dict[str, str]) -> None:
+    """Record that no provider had the barcode.
+
+    A clean miss from every provider is trusted for BARCODE_MISS_TTL; if
+    any provider errored or timed out the entry uses the shorter
+    BARCODE_MISS_RETRY_TTL so the barcode is retried sooner.
+    """
+    if all(outcome == "miss" for outcome in outcomes.values()):
+        ttl = settings.BARCODE_MISS_TTL
+    else:
+        ttl = settings.BARCODE_MISS_RETRY_TTL
+    if ttl <= 0:
+        return
 
-    return None
+    BarcodeCache.objects.update_or_create(
+        barcode=barcode,
+        defaults={
+            'product_name': '',
+            'brands': '',
+            'owner': '',
+            'categories': '',
+            'image_url': '',
+            'provider': '',
+            'raw_response': {},
+            'is_miss': True,
+            'provider_results': outcomes,
+            'expires_at': timezone.now() + timedelta(seconds=ttl),
+        },
+    )
+    product_cache.put(barcode, None, ttl)
@@ -2,12 +2,229 @@
 
 Given product info from a barcode scan, find the parent company
 in the Alonovo database.
+
+Lookups run against BrandIndex, an in-memory copy of every BrandMapping,
+Product brand and Company name, so resolving a scan does not touch the
+database once the index is warm. Signals in core.signals invalidate it
+on writes.
+
+The index also resolves receipt lines that start with a known brand
+("CHEERIOS 18OZ 3.99"), with an Aho-Corasick automaton over word tokens,
+so the receipt parser need not ask Claude about them.
 """
-from typing import Optional, Tuple
+import re
+import threading
+import time
+import unicodedata
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
 
-from .models import BrandMapping, Company
+from .models import BrandMapping, Company, Product
 from .barcode_providers import ProductInfo
 
+# Shorter brands ("Hu", "V8") are too likely to be receipt abbreviations
+MIN_RECEIPT_BRAND_CHARS = 3
+
+# Single-word brands that are also everyday words on receipts ("ALL PURPOSE
+# FLOUR", "DAWN APPLES", "FRESH BASIL"). They are left out of receipt
+# matching, so those lines go to Claude; longer brands containing them
+# ("All Free Clear") still match.
+COMMON_WORD_BRANDS = frozenset({
+    'ALL', 'BASIC', 'BEST', 'BOUNTY', 'CHEER', 'CHOICE', 'CLASSIC', 'CLEAR',
+    'COUNTRY', 'DAWN', 'DOVE', 'ERA', 'FARM', 'FRESH', 'GAIN', 'GARDEN', 'GLAD',
+    'GOLD', 'GREAT', 'HARVEST', 'HOME', 'HONEST', 'JOY', 'KIND', 'LIFE', 'MARS',
+    'NATURAL', 'OFF', 'ORGANIC', 'ORIGINAL', 'PLEDGE', 'PRIME', 'PURE', 'RAID',
+    'SCOPE', 'SECRET', 'SELECT', 'SIMPLE', 'SIMPLY', 'SMART', 'SPRING', 'SUN',
+    'TIDE', 'TOTAL',
+})
+
+
+def tokenize(text: str) -> Tuple[str, ...]:
+    """Uppercase word tokens, accents and apostrophes dropped.
+
+    "Häagen-Dazs" -> ("HAAGEN", "DAZS"), "M&M's" -> ("M", "MS"), so brand
+    names and receipt lines compare the same however they are punctuated.
+    """
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    text = text.upper().replace("'", '').replace('\u2019', '')
+    return tuple(re.findall(r'[A-Z0-9]+', text))
+
+
+class TokenAutomaton:
+    """Aho-Corasick automaton over token sequences.
+
+    search() finds every pattern occurrence in one pass over the tokens,
+    however many patterns there are.
+    """
+
+    def __init__(self, patterns: Dict[Tuple[str, ...], object]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # state -> (pattern length, value) for every pattern ending there
+        self._out: List[List[Tuple[int, object]]] = [[]]
+
+        for tokens, value in patterns.items():
+            state = 0
+            for token in tokens:
+                following = self._goto[state].get(token)
+                if following is None:
+                    following = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                    self._goto[state][token] = following
+                state = following
+            self._out[state].append((len(tokens), value))
+
+        # Breadth-first, so every fail target is finished before it is used
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for token, following in self._goto[state].items():
+                queue.append(following)
+                fallback = self._fail[state]
+                while fallback and token not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[following] = self._goto[fallback].get(token, 0)
+                self._out[following] = self._out[following] + self._out[self._fail[following]]
+
+    def search(self, tokens: Iterable[str]):
+        """Yield (start, end, value) for every pattern found in tokens."""
+        state = 0
+        for index, token in enumerate(tokens):
+            while state and token not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(token, 0)
+            for length, value in self._out[state]:
+                yield index - length + 1, index + 1, value
+
+
+@dataclass
+class _BrandTables:
+    # normalized brand name -> best BrandMapping (by -confidence, brand_name)
+    mapping_exact: Dict[str, BrandMapping] = field(default_factory=dict)
+    # every BrandMapping in default ordering, for substring scans
+    mappings: List[BrandMapping] = field(default_factory=list)
+    # lowercased company name -> first Company by name
+    company_exact: Dict[str, Company] = field(default_factory=dict)
+    # (lowercased name, Company) in name order, for substring scans
+    companies: List[Tuple[str, Company]] = field(default_factory=list)
+    # brand tokens -> (brand name, Company), Product brands before BrandMappings
+    receipt_brands: Optional[TokenAutomaton] = None
+
+
+class BrandIndex:
+    """In-memory exact, owner and substring lookups over brand/company names.
+
+    Built lazily on first use. invalidate() drops the tables so the next
+    lookup rebuilds them; BRAND_INDEX_TTL bounds how stale they can get in
+    worker processes that did not see the write themselves.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tables: Optional[_BrandTables] = None
+        self._built_at = 0.0
+        self._generation = 0
+
+    def invalidate(self):
+        self._generation += 1
+        self._tables = None
+
+    def _get_tables(self) -> _BrandTables:
+        tables = self._tables
+        ttl = settings.BRAND_INDEX_TTL
+        if tables is not None and (not ttl or time.monotonic() - self._built_at < ttl):
+            return tables
+
+        with self._lock:
+            if self._tables is not None and self._tables is not tables:
+                return self._tables  # another thread rebuilt while we waited
+            generation = self._generation
+            tables = self._build()
+            if generation == self._generation:
+                self._tables = tables
+                self._built_at = time.monotonic()
+            return tables
+
+    def _build(self) -> _BrandTables:
+        tables = _BrandTables()
+
+        # Default ordering is ['-confidence', 'brand_name'], so the first
+        # mapping seen for a name is the one .first() would have returned.
+        for mapping in BrandMapping.objects.select_related('company'):
+            tables.mappings.append(mapping)
+            tables.mapping_exact.setdefault(mapping.brand_name_normalized, mapping)
+
+        companies = {}
+        for company in Company.objects.order_by('name', 'pk'):
+            lowered = company.name.lower()
+            tables.companies.append((lowered, company))
+            tables.company_exact.setdefault(lowered, company)
+            companies[company.pk] = company
+
+        # Same precedence as receipt_parser.match_items_to_database: Product
+        # brands (first product per brand), then BrandMappings. Products
+        # come as bare pairs; their companies are already loaded above
+        # (one created since then is skipped until the next rebuild).
+        sources = [(brand_name, companies[company_id]) for brand_name, company_id in
+                   Product.objects.values_list('brand_name', 'company_id').distinct()
+                   if company_id in companies]
+        sources += [(mapping.brand_name, mapping.company) for mapping in tables.mappings]
+        brands = {}
+        for brand_name, company in sources:
+            tokens = tokenize(brand_name)
+            if sum(len(token) for token in tokens) < MIN_RECEIPT_BRAND_CHARS:
+                continue
+            if len(tokens) == 1 and tokens[0] in COMMON_WORD_BRANDS:
+                continue
+            brands.setdefault(tokens, (brand_name, company))
+        tables.receipt_brands = TokenAutomaton(brands)
+
+        return tables
+
+    def mapping_exact(self, normalized: str) -> Optional[BrandMapping]:
+        return self._get_tables().mapping_exact.get(normalized)
+
+    def mapping_containing(self, normalized: str) -> Optional[BrandMapping]:
+        for mapping in self._get_tables().mappings:
+            if normalized in mapping.brand_name_normalized:
+                return mapping
+        return None
+
+    def company_exact(self, name: str) -> Optional[Company]:
+        return self._get_tables().company_exact.get(name.lower())
+
+    def company_containing(self, name: str) -> Optional[Company]:
+        needle = name.lower()
+        for lowered, company in self._get_tables().companies:
+            if needle in lowered:
+                return company
+        return None
+
+    def receipt_brand(self, line: str) -> Optional[Tuple[str, Company]]:
+        """(brand name, Company) of the known brand a receipt line starts with.
+
+        Leading quantities and item codes are skipped; the brand must be
+        the first words, and the longest such brand wins. Single-word
+        brands in COMMON_WORD_BRANDS never match.
+        """
+        tokens = tokenize(line)
+        first_word = next((i for i, token in enumerate(tokens)
+                           if not token.isdigit()), None)
+        if first_word is None:
+            return None
+        found = [(end, value) for start, end, value
+                 in self._get_tables().receipt_brands.search(tokens) if start == first_word]
+        return max(found, key=lambda match: match[0])[1] if found else None
+
+
+brand_index = BrandIndex()
+
 
 def match_brand_to_company(product_info: ProductInfo) -> Tuple[Optional[Company], float, str]:
     """Match a product's brand info to a company in the database.
@@ -32,7 +249,7 @@ def match_brand_to_company(product_info: ProductInfo) -> Tuple[Optional[Company]
     # Step 1: Exact match on brand_name_normalized
     for brand in brand_names:
         normalized = brand.lower().strip()
-        mapping = BrandMapping.objects.filter(brand_name_normalized=normalized).first()
+        mapping = brand_index.mapping_exact(normalized)
         if mapping:
             return (mapping.company, mapping.confidence, "brand_mapping_exact")
 
@@ -40,7 +257,7 @@ def match_brand_to_company(product_info: ProductInfo) -> Tuple[Optional[Company]
     for owner_variant in [owner, cleaned_owner]:
         if owner_variant:
             normalized = owner_variant.lower().strip()
-            mapping = BrandMapping.objects.filter(brand_name_normalized=normalized).first()
+            mapping = brand_index.mapping_exact(normalized)
             if mapping:
                 return (mapping.company, mapping.confidence * 0.9, "owner_mapping")
 
@@ -48,29 +265,27 @@ def match_brand_to_company(product_info: ProductInfo) -> Tuple[Optional[Company]
     for brand in brand_names:
         normalized = brand.lower().strip()
         if len(normalized) >= 3:
-            mapping = BrandMapping.objects.filter(
-                brand_name_normalized__icontains=normalized
-            ).first()
+            mapping = brand_index.mapping_containing(normalized)
             if mapping:
                 return (mapping.company, mapping.confidence * 0.7, "brand_mapping_fuzzy")
 
     # Step 4: Direct Company.name exact match (brand IS the company)
     for brand in brand_names:
-        company = Company.objects.filter(name__iexact=brand).first()
+        company = brand_index.company_exact(brand)
         if company:
             return (company, 0.8, "company_name_exact")
 
     # Step 5: Fuzzy Company.name match
     for brand in brand_names:
         if len(brand) >= 3:
-            company = Company.objects.filter(name__icontains=brand).first()
+            company = brand_index.company_containing(brand)
             if company:
                 return (company, 0.5, "company_name_fuzzy")
 
     # Step 6: Try owner as company name
     for owner_variant in [owner, cleaned_owner]:
         if owner_variant:
-            company = Company.objects.filter(name__iexact=owner_variant).first()
+            company = brand_index.company_exact(owner_variant)
             if company:
                 return (company, 0.7, "owner_company_match")
 
@@ -0,0 +1,107 @@
+"""Global data-version stamp for conditional GET responses.
+
+Any write to the read-mostly catalog data (Company, CompanyValueSnapshot,
+CompanyBadge, CompanyScore, Value, Product, BrandMapping) bumps a single DataVersion
+row (core.signals, plus explicit mark_changed() calls after bulk writes
+that skip signals). Views wrapped in @versioned derive a strong ETag and
+Last-Modified from it, so a repeat request with If-None-Match is answered
+with a 304 after one small query instead of a full serialization.
+
+Writes inside deferred() (entered by core.derived.deferred) bump once on
+exit instead of once per row, then pre-warm core.response_cache.
+"""
+import hashlib
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+
+from .models import DataVersion
+
+
+_state = threading.local()
+
+
+def current():
+    """(version, updated_at) of the catalog data; (0, None) before any write."""
+    row = DataVersion.objects.filter(pk=DataVersion.SINGLETON_ID).values_list(
+        'version', 'updated_at').first()
+    return row or (0, None)
+
+
+def bump() -> None:
+    updated = DataVersion.objects.filter(pk=DataVersion.SINGLETON_ID).update(
+        version=F('version') + 1, updated_at=timezone.now())
+    if not updated:
+        DataVersion.objects.get_or_create(pk=DataVersion.SINGLETON_ID, defaults={'version': 1})
+
+
+def mark_changed() -> None:
+    """Bump the version once the current transaction commits."""
+    if getattr(_state, 'deferring', False):
+        _state.changed = True
+    else:
+        transaction.on_commit(bump)
+
+
+@contextmanager
+def deferred():
+    """Collapse every mark_changed() inside the block into one bump on exit."""
+    if getattr(_state, 'deferring', False):
+        yield
+        return
+    _state.deferring, _state.changed = True, False
+    try:
+        yield
+        changed = _state.changed
+    finally:
+        _state.deferring = False
+    if changed:
+        transaction.on_commit(_bump_and_warm)
+
+
+def _bump_and_warm():
+    from .response_cache import warm
+
+    bump()
+    warm()
+
+
+def for_request(request):
+    """current(), read once per request and reused by every caller."""
+    if not hasattr(request, '_data_version'):
+        request._data_version = current()
+    return request._data_version
+
+
+def _etag(request, *args, **kwargs):
+    version, _ = for_request(request)
+    # Same URL can render as JSON or the browsable API
+    key = f"{version}|{request.get_full_path()}|{request.META.get('HTTP_ACCEPT', '')}"
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def _last_modified(request, *args, **kwargs):
+    return for_request(request)[1]
+
+
+def versioned(view_func):
+    """ETag/Last-Modified + If-None-Match/304 for a view over catalog data.
+
+    Responses are marked no-cache so clients revalidate every time rather
+    than serving heuristically cached copies after an import.
+    """
+    conditional = condition(etag_func=_etag, last_modified_func=_last_modified)(view_func)
+
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        response = conditional(request, *args, **kwargs)
+        patch_cache_control(response, no_cache=True)
+        patch_vary_headers(response, ['Accept'])
+        return response
+    return wrapper
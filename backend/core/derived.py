@@ -0,0 +1,134 @@
+"""Per-company data derived from value snapshots.
+
+Keeps the denormalized Company.overall_grade / average_score /
+is_disqualified columns and the CompanyAlternative rankings in sync
+with CompanyValueSnapshot. Signals (core.signals) mark companies dirty;
+their derived data is refreshed when the transaction commits.
+
+Bulk writers (import commands) should run inside deferred(), usable as a
+context manager or decorator, so dirty companies are refreshed once at
+the end instead of on every saved snapshot.
+"""
+import threading
+from contextlib import contextmanager
+from typing import Iterable, List, Optional, Set, Tuple
+
+from django.db import transaction
+
+from . import alternatives, data_version
+from .models import Company, CompanyValueSnapshot, Value
+
+
+_state = threading.local()
+
+
+def summarize_snapshots(
+    snapshots: List[Tuple[str, float, str]],
+    disqualifying_slugs: Set[str],
+) -> Tuple[Optional[str], Optional[float], bool]:
+    """Overall grade for one company's (value slug, score, grade) snapshots.
+
+    Mirrors frontend/src/lib/utils.ts:computeOverallGrade() without user
+    weights. Returns (overall_grade, average_score, is_disqualified);
+    grade and average are None when there are no snapshots.
+    """
+    if not snapshots:
+        return None, None, False
+
+    avg = sum(score for _, score, _ in snapshots) / len(snapshots)
+
+    # If any disqualifying value has F grade -> overall F
+    if any(slug in disqualifying_slugs and grade.startswith('F')
+           for slug, _, grade in snapshots):
+        return 'F', avg, True
+
+    # Average scores, map to grade
+    if avg >= 0.8:
+        return 'A', avg, False
+    if avg >= 0.3:
+        return 'B', avg, False
+    if avg >= -0.1:
+        return 'C', avg, False
+    if avg >= -0.5:
+        return 'D', avg, False
+    return 'F', avg, False
+
+
+def refresh_summaries(company_ids: Iterable[int]) -> int:
+    """Recompute the denormalized grade columns for these companies."""
+    company_ids = set(company_ids)
+    if not company_ids:
+        return 0
+
+    disqualifying = set(Value.objects.filter(is_disqualifying=True).values_list('slug', flat=True))
+    snapshots = {cid: [] for cid in company_ids}
+    for cid, slug, score, grade in CompanyValueSnapshot.objects.filter(
+        company_id__in=company_ids
+    ).values_list('company_id', 'value_id', 'score', 'grade'):
+        snapshots[cid].append((slug, score, grade))
+
+    companies = list(Company.objects.filter(pk__in=company_ids).only(
+        'id', 'overall_grade', 'average_score', 'is_disqualified'))
+    changed = []
+    for company in companies:
+        summary = summarize_snapshots(snapshots[company.pk], disqualifying)
+        if summary != (company.overall_grade, company.average_score, company.is_disqualified):
+            company.overall_grade, company.average_score, company.is_disqualified = summary
+            changed.append(company)
+
+    # bulk_update skips save(), so this doesn't re-trigger the signals
+    Company.objects.bulk_update(
+        changed, ['overall_grade', 'average_score', 'is_disqualified'], batch_size=500)
+    if changed:
+        data_version.mark_changed()
+    return len(changed)
+
+
+def refresh_companies(company_ids: Iterable[int]) -> None:
+    """Refresh every piece of derived data for these companies."""
+    company_ids = set(company_ids)
+    refresh_summaries(company_ids)
+    alternatives.refresh_for_companies(company_ids)
+
+
+def rebuild_all() -> None:
+    """Recompute derived data for every company."""
+    refresh_summaries(Company.objects.values_list('pk', flat=True))
+    alternatives.rebuild_all()
+
+
+def mark_companies_dirty(company_ids: Iterable[int]) -> None:
+    """Schedule a refresh for companies whose snapshots or sector changed."""
+    company_ids = set(company_ids)
+    if company_ids:
+        data_version.mark_changed()
+    pending: Set[int] = getattr(_state, 'pending', None)
+    if pending is not None:
+        pending |= company_ids
+    elif company_ids:
+        transaction.on_commit(lambda: refresh_companies(company_ids))
+
+
+def mark_value_dirty(value_slug: str) -> None:
+    """Schedule a refresh for every company graded on this value."""
+    mark_companies_dirty(CompanyValueSnapshot.objects.filter(
+        value_id=value_slug).values_list('company_id', flat=True))
+
+
+@contextmanager
+def deferred():
+    """Collect dirty companies and refresh them once on exit.
+
+    Also collapses data-version bumps into one, after the refresh.
+    """
+    if getattr(_state, 'pending', None) is not None:
+        yield  # already deferring in an outer block
+        return
+    with data_version.deferred():
+        _state.pending = set()
+        try:
+            yield
+            pending = _state.pending
+        finally:
+            _state.pending = None
+        refresh_companies(pending)
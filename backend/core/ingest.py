@@ -0,0 +1,472 @@
+"""Bulk ingestion of companies and claims for the import commands.
+
+Import commands stage rows with BulkIngest.company() and .claim(), then
+save() writes them in one transaction with a few queries per batch of
+rows instead of several per row:
+
+- companies: IN queries on ticker and URI find the existing ones; new
+  ones are bulk-created, changed ones bulk-updated;
+- claims: one IN query finds the URIs already stored; the rest are
+  bulk-created, skipping any a concurrent import inserted meanwhile.
+
+bulk_create() and bulk_update() skip model signals, so save() does what
+core.signals would have: it queues rescoring for the new claims, marks
+written companies dirty (which bumps the data version) and invalidates
+the brand index.
+
+Large files go through RecordReader, ClaimMapping and ingest_records():
+CSV or JSONL rows (optionally gzipped, or from stdin) are streamed, turned
+into a company and a claim each by a mapping spec, validated, and saved
+one batch of rows at a time, so memory stays bounded by the batch size.
+"""
+import csv
+import gzip
+import io
+import itertools
+import json
+import os
+import re
+import sys
+from dataclasses import dataclass, field
+from decimal import Context, Decimal, InvalidOperation
+from typing import Callable, Dict, Iterable, List, Optional, Set, Union
+
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.utils import timezone
+
+from . import derived, scoring
+from .models import Claim, Company
+
+# Rows per INSERT/UPDATE statement and values per IN query
+BATCH_SIZE = 1000
+
+# Source rows staged before each save() by ingest_records()
+STREAM_BATCH_SIZE = 5000
+
+# Invalid rows described in IngestStats.errors; later ones are only counted
+MAX_REPORTED_ERRORS = 20
+
+
+@dataclass
+class StagedCompany:
+    """A company passed to BulkIngest.company(); instance is set by save()."""
+    uri: str
+    name: str
+    ticker: Optional[str]
+    sector: Optional[str]
+    instance: Optional[Company] = None
+
+
+@dataclass
+class IngestResult:
+    companies_created: int = 0
+    companies_updated: int = 0
+    claims_created: List[Claim] = field(default_factory=list)
+    claims_existing: int = 0
+
+    @property
+    def created_uris(self) -> Set[str]:
+        return {claim.uri for claim in self.claims_created}
+
+
+def _batches(values: Iterable, size: int):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+class BulkIngest:
+    """Stage companies and claims in memory; write them all with save().
+
+    Companies resolve the way the import commands always have: an existing
+    company with the same ticker wins, otherwise the one at
+    urn:company:<slug> is created or updated. With fill_sector, a company
+    found by ticker gets the staged sector if it has none.
+    """
+
+    def __init__(self, fill_sector: bool = False, batch_size: int = BATCH_SIZE):
+        self.fill_sector = fill_sector
+        self.batch_size = batch_size
+        self._by_ticker: Dict[str, StagedCompany] = {}
+        self._by_uri: Dict[str, StagedCompany] = {}
+        self._claims: Dict[str, dict] = {}
+
+    def company(self, slug: str, name: str, ticker: Optional[str], sector: Optional[str]) -> StagedCompany:
+        """Stage a company. Repeats (same ticker or slug) return the first staging."""
+        uri = f'urn:company:{slug}'
+        staged = (ticker and self._by_ticker.get(ticker)) or self._by_uri.get(uri)
+        if staged is None:
+            staged = StagedCompany(uri=uri, name=name, ticker=ticker, sector=sector)
+            self._by_uri[uri] = staged
+        elif self.fill_sector and sector and not staged.sector:
+            staged.sector = sector
+        if ticker:
+            self._by_ticker.setdefault(ticker, staged)
+        return staged
+
+    def claim(self, subject: Union[StagedCompany, str], **fields) -> None:
+        """Stage a Claim about subject: a staged company or a company URI.
+
+        Claims are immutable, so one whose URI already exists (in the
+        database or staged earlier) is skipped.
+        """
+        self._claims.setdefault(fields['uri'], dict(fields, subject=subject))
+
+    def save(self) -> IngestResult:
+        """Write everything staged in one transaction and clear the stage."""
+        result = IngestResult()
+        with transaction.atomic():
+            self._save_companies(result)
+            self._save_claims(result)
+        self._by_ticker, self._by_uri, self._claims = {}, {}, {}
+        return result
+
+    def _existing_companies(self, staged: List[StagedCompany]):
+        tickers = sorted({row.ticker for row in staged if row.ticker})
+        uris = sorted({row.uri for row in staged})
+        found = {}
+        for ticker_batch in _batches(tickers, self.batch_size):
+            found.update((company.pk, company) for company in
+                         Company.objects.filter(ticker__in=ticker_batch))
+        for uri_batch in _batches(uris, self.batch_size):
+            found.update((company.pk, company) for company in
+                         Company.objects.filter(uri__in=uri_batch))
+        # Same pick as Company.objects.filter(ticker=...).first()
+        return sorted(found.values(), key=lambda company: (company.name, company.pk))
+
+    def _save_companies(self, result: IngestResult) -> None:
+        staged = list({id(row): row for row in self._by_uri.values()}.values())
+        if not staged:
+            return
+        by_ticker, by_uri = {}, {}
+        for company in self._existing_companies(staged):
+            if company.ticker:
+                by_ticker.setdefault(company.ticker, company)
+            by_uri[company.uri] = company
+
+        now = timezone.now()
+        to_create, to_update, written = [], {}, set()
+        for row in staged:
+            company = by_ticker.get(row.ticker) if row.ticker else None
+            if company is not None:
+                if self.fill_sector and row.sector and not company.sector:
+                    company.sector = row.sector
+                    to_update[company.pk] = company
+            else:
+                company = by_uri.get(row.uri)
+                if company is None:
+                    company = Company(uri=row.uri, name=row.name, ticker=row.ticker, sector=row.sector)
+                    to_create.append(company)
+                elif (company.name, company.ticker, company.sector) != (row.name, row.ticker, row.sector):
+                    company.name, company.ticker, company.sector = row.name, row.ticker, row.sector
+                    to_update[company.pk] = company
+            row.instance = company
+
+        if to_create:
+            Company.objects.bulk_create(to_create, batch_size=self.batch_size, ignore_conflicts=True)
+            # ignore_conflicts leaves pks unset: load the saved rows
+            saved = {}
+            for uri_batch in _batches([company.uri for company in to_create], self.batch_size):
+                saved.update((company.uri, company) for company in
+                             Company.objects.filter(uri__in=uri_batch))
+            for row in staged:
+                if row.instance.pk is None:
+                    row.instance = saved[row.uri]
+            written.update(company.pk for company in saved.values())
+        if to_update:
+            for company in to_update.values():
+                company.updated_at = now
+            Company.objects.bulk_update(list(to_update.values()), ['name', 'ticker', 'sector', 'updated_at'],
+                                        batch_size=self.batch_size)
+
+        result.companies_created = len(to_create)
+        result.companies_updated = len(to_update)
+        written.update(to_update)
+        if written:
+            from .brand_matcher import brand_index
+
+            derived.mark_companies_dirty(written)
+            transaction.on_commit(brand_index.invalidate)
+
+    def _save_claims(self, result: IngestResult) -> None:
+        if not self._claims:
+            return
+        existing = set()
+        for uri_batch in _batches(self._claims, self.batch_size):
+            existing.update(Claim.objects.filter(uri__in=uri_batch).values_list('uri', flat=True))
+
+        new = []
+        for uri, fields in self._claims.items():
+            if uri in existing:
+                continue
+            subject = fields['subject']
+            if isinstance(subject, StagedCompany):
+                subject = subject.instance.uri
+            new.append(Claim(**dict(fields, subject=subject)))
+        Claim.objects.bulk_create(new, batch_size=self.batch_size, ignore_conflicts=True)
+        scoring.enqueue_claims(new)
+
+        result.claims_created = new
+        result.claims_existing = len(existing)
+
+
+class RecordReader:
+    """Stream (line number, row dict) from a CSV or JSONL file or stdin.
+
+    path '-' reads stdin. A '.gz' suffix is decompressed on the fly. The
+    format comes from the suffix (.csv, .jsonl, .ndjson) unless given.
+    A JSONL line that isn't a JSON object is yielded as a ValueError.
+    """
+
+    FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}
+
+    def __init__(self, path: str, fmt: Optional[str] = None):
+        stem = path[:-3] if path.endswith('.gz') else path
+        self.format = fmt or self.FORMATS.get(os.path.splitext(stem)[1].lower())
+        if self.format not in ('csv', 'jsonl'):
+            raise ValueError(f"Can't tell the format of {path}; pass csv or jsonl")
+        if path == '-':
+            self._raw, self._size = sys.stdin.buffer, None
+        else:
+            self._raw, self._size = open(path, 'rb'), os.path.getsize(path)
+        binary = gzip.GzipFile(fileobj=self._raw) if path.endswith('.gz') else self._raw
+        self._text = io.TextIOWrapper(binary, encoding='utf-8-sig', newline='')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self._raw is not sys.stdin.buffer:
+            self._text.close()
+
+    def progress(self) -> Optional[float]:
+        """Share of the file read so far (compressed bytes for .gz), if known."""
+        if not self._size:
+            return None
+        return min(1.0, self._raw.tell() / self._size)
+
+    def __iter__(self):
+        if self.format == 'csv':
+            reader = csv.DictReader(self._text)
+            for row in reader:
+                yield reader.line_num, row
+            return
+        for number, line in enumerate(self._text, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                row = ValueError(f"invalid JSON: {e.msg}")
+            if not isinstance(row, (dict, ValueError)):
+                row = ValueError("not a JSON object")
+            yield number, row
+
+
+class ClaimMapping:
+    """Turns source rows into a staged company and claim, per a mapping spec.
+
+    The spec is a dict (usually loaded from JSON)::
+
+        {
+            "required": ["ticker", "esgScore.tot"],
+            "fill_sector": true,
+            "company": {"slug": "{ticker|lower}", "name": ["{company}", "{ticker}"],
+                        "ticker": "{ticker}", "sector": "{sector}"},
+            "claim": {"uri": "urn:source:2021:{ticker|lower}:esg",
+                      "claim_type": "ESG_SCORE", "amt": "{esgScore.tot}",
+                      "effective_date": "2021-03-01"}
+        }
+
+    Strings are templates: "{column}" is the stripped value of a column
+    (or a dotted path into nested JSON), optionally piped through filters
+    (lower, upper, underscore: '-' to '_'). A list takes its first
+    non-empty template. Rows missing a "required" column are invalid.
+    Instead of "company", the claim may give a "subject" URI template.
+    Claim values are converted and validated by the Claim model fields
+    (decimal digits, ISO dates, lengths); decimals are rounded to the
+    field's places.
+    """
+
+    TEMPLATE = re.compile(r'\{([^{}|]+)((?:\|\w+)*)\}')
+    FILTERS = {
+        'lower': str.lower,
+        'upper': str.upper,
+        'underscore': lambda value: value.replace('-', '_'),
+    }
+    COMPANY_FIELDS = ('slug', 'name', 'ticker', 'sector')
+
+    def __init__(self, spec: dict):
+        if not isinstance(spec, dict) or not isinstance(spec.get('claim'), dict):
+            raise ValueError("Mapping spec needs a \"claim\" object")
+        self.required = list(spec.get('required', []))
+        self.fill_sector = bool(spec.get('fill_sector', False))
+        self.company = spec.get('company')
+        self.claim = dict(spec['claim'])
+
+        if self.company is not None:
+            if not isinstance(self.company, dict) or not {'slug', 'name'} <= set(self.company):
+                raise ValueError("\"company\" needs at least \"slug\" and \"name\"")
+            unknown = set(self.company) - set(self.COMPANY_FIELDS)
+            if unknown:
+                raise ValueError(f"Unknown company fields: {', '.join(sorted(unknown))}")
+            if 'subject' in self.claim:
+                raise ValueError("Give a \"company\" object or a claim \"subject\", not both")
+        elif 'subject' not in self.claim:
+            raise ValueError("Mapping spec needs a \"company\" object or a claim \"subject\"")
+        claim_fields = {f.name for f in Claim._meta.get_fields() if f.concrete and not f.auto_created}
+        unknown = set(self.claim) - claim_fields
+        if unknown:
+            raise ValueError(f"Unknown claim fields: {', '.join(sorted(unknown))}")
+        if not {'uri', 'claim_type'} <= set(self.claim):
+            raise ValueError("\"claim\" needs at least \"uri\" and \"claim_type\"")
+        for template in list(self.claim.values()) + list((self.company or {}).values()):
+            for option in template if isinstance(template, list) else [template]:
+                if isinstance(option, str):
+                    for _, filters in self.TEMPLATE.findall(option):
+                        for name in filters.split('|')[1:]:
+                            if name not in self.FILTERS:
+                                raise ValueError(f"Unknown template filter: {name}")
+
+    @staticmethod
+    def _lookup(row: dict, key: str) -> str:
+        value = row.get(key)
+        if value is None and '.' in key:
+            value = row
+            for part in key.split('.'):
+                value = value.get(part) if isinstance(value, dict) else None
+        return '' if value is None else str(value).strip()
+
+    def render(self, template, row: dict):
+        if isinstance(template, list):
+            return next((value for value in (self.render(option, row) for option in template) if value), '')
+        if not isinstance(template, str):
+            return template
+
+        def substitute(match):
+            value = self._lookup(row, match.group(1))
+            for name in match.group(2).split('|')[1:]:
+                value = self.FILTERS[name](value)
+            return value
+
+        return self.TEMPLATE.sub(substitute, template)
+
+    def _claim_value(self, name: str, value):
+        """value converted and validated like the Claim field; ValueError if it doesn't fit."""
+        model_field = Claim._meta.get_field(name)
+        if value == '':
+            if model_field.null:
+                return None
+            return value
+        try:
+            value = model_field.to_python(value)
+            if isinstance(model_field, models.DecimalField):
+                # Round extra places as the database would; too many digits raises
+                value = value.quantize(Decimal(1).scaleb(-model_field.decimal_places),
+                                       context=Context(prec=model_field.max_digits))
+            model_field.run_validators(value)
+        except ValidationError as e:
+            raise ValueError(f"{name}: {' '.join(e.messages)}")
+        except InvalidOperation:
+            raise ValueError(f"{name}: more than {model_field.max_digits} digits: {value}")
+        return value
+
+    def stage(self, ingest: 'BulkIngest', row: dict) -> None:
+        """Stage row's company and claim on ingest; ValueError if the row is invalid."""
+        missing = [column for column in self.required if not self._lookup(row, column)]
+        if missing:
+            raise ValueError(f"missing {', '.join(missing)}")
+
+        fields = {name: self._claim_value(name, self.render(template, row))
+                  for name, template in self.claim.items()}
+        if not fields['uri'] or not fields['claim_type']:
+            raise ValueError("empty uri or claim_type")
+        if self.company is None:
+            subject = fields.pop('subject')
+            if not subject:
+                raise ValueError("empty subject")
+        else:
+            company = {name: str(self.render(template, row) or '') or None
+                       for name, template in self.company.items()}
+            if not company['slug'] or not company['name']:
+                raise ValueError("empty company slug or name")
+            slug, name = company['slug'], company['name']
+            ticker, sector = company.get('ticker'), company.get('sector')
+            for field_name, value in (('uri', f'urn:company:{slug}'), ('name', name),
+                                      ('ticker', ticker), ('sector', sector)):
+                max_length = Company._meta.get_field(field_name).max_length
+                if value and len(value) > max_length:
+                    raise ValueError(f"company {field_name}: longer than {max_length} characters")
+            subject = ingest.company(slug, name, ticker, sector)
+        ingest.claim(subject, **fields)
+
+
+@dataclass
+class IngestStats:
+    rows: int = 0
+    invalid: int = 0
+    companies_created: int = 0
+    companies_updated: int = 0
+    claims_created: int = 0
+    claims_existing: int = 0
+    # "line N: reason" for the first MAX_REPORTED_ERRORS invalid rows
+    errors: List[str] = field(default_factory=list)
+
+
+def ingest_records(records: Iterable, mapping: ClaimMapping,
+                   batch_size: int = STREAM_BATCH_SIZE,
+                   on_batch: Optional[Callable[[IngestStats], None]] = None) -> IngestStats:
+    """Stage and save (line number, row) records batch by batch.
+
+    Each batch is saved in its own transaction and then dropped, so
+    memory doesn't grow with the input. on_batch(stats) is called after
+    every batch, e.g. to report progress.
+    """
+    stats = IngestStats()
+    records = iter(records)
+    while True:
+        batch = list(itertools.islice(records, batch_size))
+        if not batch:
+            return stats
+        ingest = BulkIngest(fill_sector=mapping.fill_sector)
+        for number, row in batch:
+            stats.rows += 1
+            try:
+                if isinstance(row, ValueError):
+                    raise row
+                mapping.stage(ingest, row)
+            except ValueError as e:
+                stats.invalid += 1
+                if len(stats.errors) < MAX_REPORTED_ERRORS:
+                    stats.errors.append(f"line {number}: {e}")
+        result = ingest.save()
+        stats.companies_created += result.companies_created
+        stats.companies_updated += result.companies_updated
+        stats.claims_created += len(result.claims_created)
+        stats.claims_existing += result.claims_existing
+        if on_batch is not None:
+            on_batch(stats)
+
+
+def import_with_progress(command, reader, mapping, batch_size=STREAM_BATCH_SIZE):
+    """ingest_records() from a RecordReader, for a management command.
+
+    Writes a progress line per batch to command.stdout, then the invalid
+    rows to command.stderr.
+    """
+    def report(stats):
+        done = reader.progress()
+        share = f" ({done:.0%})" if done is not None else ""
+        command.stdout.write(f"  {stats.rows} rows{share}: {stats.claims_created} new claims, "
+                             f"{stats.invalid} invalid")
+
+    stats = ingest_records(reader, mapping, batch_size, on_batch=report)
+    for error in stats.errors:
+        command.stderr.write(f"  Skipped {error}")
+    if stats.invalid > len(stats.errors):
+        command.stderr.write(f"  ... and {stats.invalid - len(stats.errors)} more invalid rows")
+    return stats
@@ -1,5 +1,7 @@
 from django.core.management.base import BaseCommand
-from core.models import Claim, Company, Value, ScoringRule, CompanyValueSnapshot, CompanyBadge
+from core import derived
+from core.scoring import score_values
+from core.models import Claim, Company, Value, ScoringRule, CompanyBadge
 
 
 # Tobacco companies by ticker — add more as they enter the database
@@ -13,6 +15,7 @@ TOBACCO_COMPANIES = {
 class Command(BaseCommand):
     help = "Add tobacco_products disqualifying value and grade known tobacco companies F"
 
+    @derived.deferred()
     def handle(self, *args, **options):
         # 1. Create the Value via raw SQL since DB has display_group columns not in model
         from django.db import connection
@@ -55,7 +58,7 @@ class Command(BaseCommand):
         )
         self.stdout.write(f"ScoringRule v1 {'created' if created else 'updated'}")
 
-        # 3. Create claims and snapshots for known tobacco companies
+        # 3. Create claims and badges for known tobacco companies
         for ticker, name in TOBACCO_COMPANIES.items():
             company = Company.objects.filter(ticker=ticker).first()
             if not company:
@@ -77,24 +80,6 @@ class Command(BaseCommand):
                 )
                 self.stdout.write(f"  Created claim for {name}")
 
-            # Create/update snapshot — F grade, disqualifying
-            snap, created = CompanyValueSnapshot.objects.update_or_create(
-                company=company,
-                value=value,
-                defaults={
-                    'score': -1.0,
-                    'grade': 'F',
-                    'claim_uris': [claim_uri],
-                    'highlight_on_card': True,
-                    'highlight_priority': 100,
-                    'display_text': 'Tobacco manufacturer',
-                    'display_icon': 'cigarette',
-                    'scoring_rule_version': 1,
-                }
-            )
-            action = "Created" if created else "Updated"
-            self.stdout.write(f"  {action} snapshot for {name}: F")
-
             # Create badge
             badge, created = CompanyBadge.objects.get_or_create(
                 company=company,
@@ -109,4 +94,8 @@ class Command(BaseCommand):
             if created:
                 self.stdout.write(f"  Created badge for {name}")
 
+        # 4. Score snapshots from the claims — F grade, disqualifying
+        count = score_values(['tobacco_products']).get('tobacco_products', 0)
+        self.stdout.write(f"  Scored {count} tobacco snapshots")
+
         self.stdout.write(self.style.SUCCESS("Done! Tobacco companies now get F overall."))
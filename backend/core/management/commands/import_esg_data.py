@@ -1,12 +1,42 @@
-import csv
 from decimal import Decimal
-from django.core.management.base import BaseCommand
-from core.models import Claim, Company, Value, ScoringRule, CompanyValueSnapshot, CompanyBadge
+from django.core.management.base import BaseCommand, CommandError
+from core import derived
+from core.ingest import BulkIngest, ClaimMapping, RecordReader, import_with_progress
+from core.scoring import score_values
+from core.models import Value, ScoringRule, CompanyValueSnapshot, CompanyBadge
+
+DEFAULT_CSV_PATH = '/home/ec2-user/alonovo2/data/sp_esg_stock_data.csv'
+
+# https://github.com/sburstein/ESG-Stock-Data columns -> company and claim
+SUSTAINALYTICS_CSV_MAPPING = {
+    'required': ['ticker', 'esgScore.tot'],
+    'fill_sector': True,
+    'company': {
+        'slug': '{ticker|lower|underscore}',
+        'name': ['{company}', '{ticker}'],
+        'ticker': '{ticker}',
+        'sector': '{sector}',
+    },
+    'claim': {
+        'uri': 'urn:yahoo-sustainalytics:2021:{ticker|lower|underscore}:esg',
+        'claim_type': 'ESG_SCORE',
+        'amt': '{esgScore.tot}',
+        'unit': 'sustainalytics_risk',
+        'effective_date': '2021-03-01',
+        'source_uri': 'https://github.com/sburstein/ESG-Stock-Data',
+        'how_known': 'scraped_yahoo_finance',
+    },
+}
 
 
 class Command(BaseCommand):
     help = "Import ESG scores from multiple sources"
 
+    def add_arguments(self, parser):
+        parser.add_argument('--csv', default=DEFAULT_CSV_PATH,
+                            help="Sustainalytics ESG CSV (optionally .gz, or - for stdin)")
+
+    @derived.deferred()
     def handle(self, *args, **options):
         self.stdout.write("Creating ESG Value...")
         self.create_value()
@@ -15,7 +45,7 @@ class Command(BaseCommand):
         self.create_scoring_rule()
 
         self.stdout.write("Importing GitHub CSV ESG data...")
-        csv_count = self.import_github_csv()
+        csv_count = self.import_github_csv(options['csv'])
 
         self.stdout.write("Importing S&P Global ESG data...")
         sp_count = self.import_spglobal_data()
@@ -31,27 +61,6 @@ class Command(BaseCommand):
             f"{snap_count} snapshots, {badge_count} badges"
         ))
 
-    def get_or_create_company(self, slug, name, ticker, sector):
-        if ticker:
-            existing = Company.objects.filter(ticker=ticker).first()
-            if existing:
-                # Update sector if we have one and they don't
-                if sector and not existing.sector:
-                    existing.sector = sector
-                    existing.save()
-                return existing
-        uri = f'urn:company:{slug}'
-        company, _ = Company.objects.update_or_create(
-            uri=uri,
-            defaults={'name': name, 'ticker': ticker, 'sector': sector}
-        )
-        return company
-
-    def create_claim_safe(self, **kwargs):
-        if Claim.objects.filter(uri=kwargs['uri']).exists():
-            return None
-        return Claim.objects.create(**kwargs)
-
     def create_value(self):
         Value.objects.update_or_create(
             slug='esg_score',
@@ -85,43 +94,22 @@ class Command(BaseCommand):
             }
         )
 
-    def import_github_csv(self):
-        csv_path = '/home/ec2-user/alonovo2/data/sp_esg_stock_data.csv'
-        count = 0
-        with open(csv_path, 'r') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                ticker = row.get('ticker', '').strip()
-                total_esg = row.get('esgScore.tot', '').strip()
-                company_name = row.get('company', '').strip()
-                sector = row.get('sector', '').strip()
-
-                if not ticker or not total_esg:
-                    continue
-
-                try:
-                    esg_value = Decimal(str(total_esg))
-                except Exception:
-                    continue
-
-                slug = ticker.lower().replace('-', '_')
-                company = self.get_or_create_company(slug, company_name or ticker, ticker, sector or None)
-
-                claim = self.create_claim_safe(
-                    uri=f'urn:yahoo-sustainalytics:2021:{slug}:esg',
-                    subject=company.uri,
-                    claim_type='ESG_SCORE',
-                    amt=esg_value,
-                    unit='sustainalytics_risk',
-                    effective_date='2021-03-01',
-                    source_uri='https://github.com/sburstein/ESG-Stock-Data',
-                    how_known='scraped_yahoo_finance',
-                )
-                if claim:
-                    count += 1
-                    self.stdout.write(f"  CSV: {company_name} ({ticker}) ESG={esg_value}")
-
-        return count
+    def import_github_csv(self, csv_path):
+        try:
+            reader = RecordReader(csv_path, 'csv')
+        except OSError as e:
+            raise CommandError(f"Can't read ESG CSV: {e}")
+        with reader:
+            stats = import_with_progress(self, reader, ClaimMapping(SUSTAINALYTICS_CSV_MAPPING))
+        return stats.claims_created
+
+    def save_staged(self, ingest, messages):
+        """Save the staged rows; report and count the new claims."""
+        created = ingest.save().created_uris
+        for uri, message in messages.items():
+            if uri in created:
+                self.stdout.write(message)
+        return len(created)
 
     def import_spglobal_data(self):
         spglobal_data = [
@@ -147,14 +135,16 @@ class Command(BaseCommand):
             ('COST', 'Costco', 'Retail', 44),
         ]
 
-        count = 0
+        ingest = BulkIngest(fill_sector=True)
+        messages = {}
         for ticker, name, sector, sp_score in spglobal_data:
             slug = ticker.lower()
-            company = self.get_or_create_company(slug, name, ticker, sector)
+            company = ingest.company(slug, name, ticker, sector)
 
-            claim = self.create_claim_safe(
-                uri=f'urn:spglobal:2025:{slug}:esg',
-                subject=company.uri,
+            uri = f'urn:spglobal:2025:{slug}:esg'
+            ingest.claim(
+                company,
+                uri=uri,
                 claim_type='ESG_SCORE',
                 amt=Decimal(str(sp_score)),
                 unit='spglobal_score',
@@ -162,70 +152,12 @@ class Command(BaseCommand):
                 source_uri='https://www.spglobal.com/esg/scores/',
                 how_known='official_rating',
             )
-            if claim:
-                count += 1
-                self.stdout.write(f"  S&P Global: {name} ({ticker}) score={sp_score}")
+            messages.setdefault(uri, f"  S&P Global: {name} ({ticker}) score={sp_score}")
 
-        return count
+        return self.save_staged(ingest, messages)
 
     def compute_esg_snapshots(self):
-        rule = ScoringRule.objects.get(value_id='esg_score', version=1)
-        count = 0
-
-        companies_with_esg = Company.objects.filter(
-            uri__in=Claim.objects.filter(claim_type='ESG_SCORE').values_list('subject', flat=True)
-        ).distinct()
-
-        for company in companies_with_esg:
-            esg_claims = Claim.objects.filter(subject=company.uri, claim_type='ESG_SCORE')
-            if not esg_claims.exists():
-                continue
-
-            normalized_scores = []
-            claim_uris = []
-
-            for claim in esg_claims:
-                claim_uris.append(claim.uri)
-                if claim.unit == 'spglobal_score':
-                    # S&P: 0-100, higher = better -> invert to sustainalytics-like scale
-                    normalized = (100 - float(claim.amt)) / 2
-                else:
-                    # Sustainalytics-style: lower = better, already on 0-50 scale
-                    normalized = float(claim.amt)
-                normalized_scores.append(normalized)
-
-            avg_score = sum(normalized_scores) / len(normalized_scores)
-
-            grade = 'F'
-            score = -1.0
-            for threshold in rule.config['thresholds']:
-                if avg_score <= threshold['max']:
-                    grade = threshold['grade']
-                    score = threshold['score']
-                    break
-
-            display_text = f"ESG Risk: {avg_score:.1f}"
-            if len(claim_uris) > 1:
-                display_text += f" ({len(claim_uris)} sources)"
-
-            CompanyValueSnapshot.objects.update_or_create(
-                company=company,
-                value_id='esg_score',
-                defaults={
-                    'score': score,
-                    'grade': grade,
-                    'claim_uris': claim_uris,
-                    'highlight_on_card': True,
-                    'highlight_priority': 3,
-                    'display_text': display_text,
-                    'display_icon': 'leaf',
-                    'scoring_rule_version': 1,
-                }
-            )
-            count += 1
-            self.stdout.write(f"  Snapshot: {company.name} = {grade} (risk: {avg_score:.1f})")
-
-        return count
+        return score_values(['esg_score']).get('esg_score', 0)
 
     def create_badges(self):
         count = 0
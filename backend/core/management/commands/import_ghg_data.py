@@ -3,16 +3,34 @@
 Data source: https://nzdpu.com (Net-Zero Data Public Utility)
 Grades are sector-relative using a curved grading mechanism so that
 energy companies aren't all F and fintech aren't all A.
+
+The search API is paged: the first page gives the total, then the rest
+are fetched settings.NZDPU_FETCH_WORKERS at a time. The raw pages are
+saved to a gzipped JSONL snapshot (settings.NZDPU_SNAPSHOT_PATH) that
+later runs read instead of the API, so --dry-run iterations work
+offline; pass --refresh to fetch again.
 """
+import gzip
 import json
 import math
+import os
+import time
 import urllib.request
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
+from django.conf import settings
 from django.core.management.base import BaseCommand
-from core.models import Claim, Company, Value, ScoringRule, CompanyValueSnapshot, CompanyBadge
+from django.utils import timezone
+from core import derived
+from core.ingest import BulkIngest
+from core.models import Company, Value, ScoringRule, CompanyValueSnapshot, CompanyBadge
 
 
-NZDPU_SEARCH_URL = "https://nzdpu.com/wis/search"
+NZDPU_PAGE_SIZE = 500
+NZDPU_FIELDS = [
+    "company_name", "sics_sector", "total_s1_emissions_ghg",
+    "reporting_year", "jurisdiction", "legal_entity_identifier"
+]
 
 # Name normalization suffixes
 SUFFIXES = [
@@ -23,19 +41,82 @@ SUFFIXES = [
 ]
 
 
+def fetch_page(start):
+    """One raw page of NZDPU search results, from row start."""
+    body = json.dumps({"meta": {}, "fields": NZDPU_FIELDS}).encode()
+    req = urllib.request.Request(
+        f"{settings.NZDPU_SEARCH_URL}?mode=easy&start={start}&limit={NZDPU_PAGE_SIZE}",
+        data=body,
+        headers={"Content-Type": "application/json", "Accept": "application/json"}
+    )
+    with urllib.request.urlopen(req, timeout=settings.NZDPU_TIMEOUT) as resp:
+        return json.loads(resp.read().decode())
+
+
+def fetch_pages(workers):
+    """Every page of search results, in order.
+
+    The first page tells how many rows there are; the rest are fetched by
+    a pool of workers. If one fails, the pages not yet started are dropped.
+    """
+    first = fetch_page(0)
+    starts = range(NZDPU_PAGE_SIZE, first["total_disclosures"], NZDPU_PAGE_SIZE)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [pool.submit(fetch_page, start) for start in starts]
+        try:
+            return [first] + [future.result() for future in futures]
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+def save_snapshot(path, pages):
+    """Write a header line and the raw pages to a gzipped JSONL file, atomically."""
+    header = {
+        "url": settings.NZDPU_SEARCH_URL,
+        "page_size": NZDPU_PAGE_SIZE,
+        "fetched_at": timezone.now().isoformat(timespec='seconds'),
+    }
+    tmp_path = f"{path}.tmp"
+    with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+        for record in [header, *pages]:
+            f.write(json.dumps(record) + "\n")
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(path):
+    """(header, pages) of a complete snapshot of the current search URL, else None."""
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            header, *pages = [json.loads(line) for line in f]
+        expected = max(1, math.ceil(pages[0]["total_disclosures"] / NZDPU_PAGE_SIZE))
+    except FileNotFoundError:
+        return None
+    except (OSError, EOFError, ValueError, IndexError, KeyError):
+        return None  # Truncated or unreadable: fetch again
+    if (header.get("url") != settings.NZDPU_SEARCH_URL
+            or header.get("page_size") != NZDPU_PAGE_SIZE
+            or len(pages) != expected):
+        return None
+    return header, pages
+
+
 class Command(BaseCommand):
     help = "Import GHG Scope 1 emissions from NZDPU and grade relative to sector"
 
     def add_arguments(self, parser):
         parser.add_argument('--dry-run', action='store_true', help="Show what would be imported without saving")
         parser.add_argument('--limit', type=int, default=0, help="Limit number of companies to process (0=all)")
+        parser.add_argument('--refresh', action='store_true',
+                            help="Fetch from the NZDPU API even if a local snapshot exists")
 
+    @derived.deferred()
     def handle(self, *args, **options):
         dry_run = options['dry_run']
         limit = options['limit']
 
         self.stdout.write("Step 1: Fetching emissions data from NZDPU...")
-        nzdpu_data = self.fetch_nzdpu_data()
+        nzdpu_data = self.fetch_nzdpu_data(options['refresh'])
         self.stdout.write(f"  Got {len(nzdpu_data)} unique companies from NZDPU")
 
         self.stdout.write("Step 2: Matching against our companies...")
@@ -72,43 +153,35 @@ class Command(BaseCommand):
             f"Done! {claim_count} claims, {snap_count} snapshots"
         ))
 
-    def fetch_nzdpu_data(self):
-        """Fetch all companies with Scope 1 emissions from NZDPU."""
-        all_companies = {}
-        start = 0
-        limit = 500
-        total = None
-
-        while total is None or start < total:
-            body = json.dumps({
-                "meta": {},
-                "fields": [
-                    "company_name", "sics_sector", "total_s1_emissions_ghg",
-                    "reporting_year", "jurisdiction", "legal_entity_identifier"
-                ]
-            }).encode()
-
-            req = urllib.request.Request(
-                f"{NZDPU_SEARCH_URL}?mode=easy&start={start}&limit={limit}",
-                data=body,
-                headers={"Content-Type": "application/json", "Accept": "application/json"}
-            )
-
-            with urllib.request.urlopen(req, timeout=30) as resp:
-                data = json.loads(resp.read().decode())
+    def fetch_nzdpu_data(self, refresh=False):
+        """Fetch all companies with Scope 1 emissions from NZDPU.
 
-            if total is None:
-                total = data["total_disclosures"]
+        Pages come from the local snapshot when there is a complete one,
+        else from the API, and are then saved as the new snapshot.
+        """
+        path = settings.NZDPU_SNAPSHOT_PATH
+        snapshot = None if refresh else load_snapshot(path)
+        if snapshot:
+            header, pages = snapshot
+            self.stdout.write(f"  Using snapshot {path} from {header['fetched_at']} (--refresh to refetch)")
+        else:
+            started = time.monotonic()
+            pages = fetch_pages(settings.NZDPU_FETCH_WORKERS)
+            self.stdout.write(f"  Fetched {len(pages)} pages in {time.monotonic() - started:.1f}s")
+            try:
+                save_snapshot(path, pages)
+            except OSError as e:
+                self.stdout.write(self.style.WARNING(f"  Couldn't save snapshot {path}: {e}"))
 
-            for item in data["items"]:
+        all_companies = {}
+        for page in pages:
+            for item in page["items"]:
                 name = item["company_name"]
                 yr = item.get("reporting_year", 0)
                 # Keep most recent year's data
                 if name not in all_companies or yr > all_companies[name].get("reporting_year", 0):
                     all_companies[name] = item
 
-            start += limit
-
         return all_companies
 
     def normalize_name(self, name):
@@ -266,7 +339,7 @@ class Command(BaseCommand):
 
     def create_claims_and_snapshots(self, graded):
         """Create Claims and CompanyValueSnapshots for matched companies."""
-        claim_count = 0
+        ingest = BulkIngest()
         snap_count = 0
 
         for item in graded:
@@ -277,20 +350,18 @@ class Command(BaseCommand):
 
             # Create claim
             claim_uri = f"urn:nzdpu:{year}:{company.uri.split(':')[-1]}:ghg_s1"
-            if not Claim.objects.filter(uri=claim_uri).exists():
-                Claim.objects.create(
-                    uri=claim_uri,
-                    subject=company.uri,
-                    claim_type='GHG_SCOPE1_EMISSIONS',
-                    amt=Decimal(str(s1)),
-                    unit='tCO2e',
-                    effective_date=f'{year}-12-31',
-                    source_uri=f'https://nzdpu.com/external/by-nzid?nz_id={nz_id}' if nz_id else 'https://nzdpu.com',
-                    how_known='official_disclosure',
-                    statement=f'Scope 1 GHG emissions: {self.format_emissions(s1)}',
-                    author='NZDPU / CDP',
-                )
-                claim_count += 1
+            ingest.claim(
+                company.uri,
+                uri=claim_uri,
+                claim_type='GHG_SCOPE1_EMISSIONS',
+                amt=Decimal(str(s1)),
+                unit='tCO2e',
+                effective_date=f'{year}-12-31',
+                source_uri=f'https://nzdpu.com/external/by-nzid?nz_id={nz_id}' if nz_id else 'https://nzdpu.com',
+                how_known='official_disclosure',
+                statement=f'Scope 1 GHG emissions: {self.format_emissions(s1)}',
+                author='NZDPU / CDP',
+            )
 
             # Create snapshot (detail card shows emissions, not main card)
             CompanyValueSnapshot.objects.update_or_create(
@@ -313,4 +384,5 @@ class Command(BaseCommand):
                 f"({self.format_emissions(s1)}, sector: {item['sector']})"
             )
 
+        claim_count = len(ingest.save().claims_created)
         return claim_count, snap_count
@@ -1,11 +1,15 @@
 from decimal import Decimal
 from django.core.management.base import BaseCommand
-from core.models import Claim, Company, Value, ScoringRule, CompanyValueSnapshot, CompanyBadge
+from core import derived
+from core.ingest import BulkIngest
+from core.scoring import score_values
+from core.models import Claim, Value, ScoringRule, CompanyValueSnapshot, CompanyBadge
 
 
 class Command(BaseCommand):
     help = "Import values, scoring rules, and new company/claim data"
 
+    @derived.deferred()
     def handle(self, *args, **options):
         self.stdout.write("Creating Values...")
         self.create_values()
@@ -24,25 +28,6 @@ class Command(BaseCommand):
 
         self.stdout.write(self.style.SUCCESS("Done!"))
 
-    def get_or_create_company(self, slug, name, ticker, sector):
-        """Find existing company by ticker or create new one."""
-        if ticker:
-            existing = Company.objects.filter(ticker=ticker).first()
-            if existing:
-                return existing
-        uri = f'urn:company:{slug}'
-        company, _ = Company.objects.update_or_create(
-            uri=uri,
-            defaults={'name': name, 'ticker': ticker, 'sector': sector}
-        )
-        return company
-
-    def create_claim_safe(self, **kwargs):
-        """Create a claim if it doesn't already exist."""
-        if Claim.objects.filter(uri=kwargs['uri']).exists():
-            return Claim.objects.get(uri=kwargs['uri'])
-        return Claim.objects.create(**kwargs)
-
     def create_values(self):
         values_data = [
             {
@@ -202,6 +187,8 @@ class Command(BaseCommand):
         # Migrate existing lobbying claims into value system
         self.migrate_lobbying_data()
 
+        ingest = BulkIngest()
+
         # BBFAW Data (source: https://www.bbfaw.com/media/2190/bbfaw-2024-report.pdf)
         bbfaw_data = [
             ('marks-and-spencer', 'Marks & Spencer', 'MKS.L', 'Retail', '2'),
@@ -220,10 +207,10 @@ class Command(BaseCommand):
         ]
 
         for slug, name, ticker, sector, tier in bbfaw_data:
-            company = self.get_or_create_company(slug, name, ticker, sector)
-            self.create_claim_safe(
+            company = ingest.company(slug, name, ticker, sector)
+            ingest.claim(
+                company,
                 uri=f'urn:bbfaw:2024:{slug}:tier',
-                subject=company.uri,
                 claim_type='FARM_WELFARE_TIER',
                 label=tier,
                 effective_date='2024-04-25',
@@ -246,10 +233,10 @@ class Command(BaseCommand):
         ]
 
         for slug, name, ticker, sector, pct in eggtrack_data:
-            company = self.get_or_create_company(slug, name, ticker, sector)
-            self.create_claim_safe(
+            company = ingest.company(slug, name, ticker, sector)
+            ingest.claim(
+                company,
                 uri=f'urn:eggtrack:2024:{slug}:cagefree',
-                subject=company.uri,
                 claim_type='CAGE_FREE_PERCENT',
                 amt=Decimal(str(pct)),
                 unit='percent',
@@ -273,10 +260,10 @@ class Command(BaseCommand):
         ]
 
         for slug, name, ticker, sector, amt in ice_contracts_data:
-            company = self.get_or_create_company(slug, name, ticker, sector)
-            self.create_claim_safe(
+            company = ingest.company(slug, name, ticker, sector)
+            ingest.claim(
+                company,
                 uri=f'urn:usaspending:2025:{slug}:ice',
-                subject=company.uri,
                 claim_type='ICE_CONTRACT',
                 amt=amt,
                 unit='million_usd',
@@ -293,10 +280,10 @@ class Command(BaseCommand):
         ]
 
         for slug, name, ticker, sector in detention_data:
-            company = self.get_or_create_company(slug, name, ticker, sector)
-            self.create_claim_safe(
+            company = ingest.company(slug, name, ticker, sector)
+            ingest.claim(
+                company,
                 uri=f'urn:ice:2025:{slug}:detention',
-                subject=company.uri,
                 claim_type='ICE_DETENTION_OPERATOR',
                 label='detention_operator',
                 effective_date='2025-12-01',
@@ -305,6 +292,12 @@ class Command(BaseCommand):
             )
             self.stdout.write(f"  ICE Detention: {name}")
 
+        result = ingest.save()
+        self.stdout.write(
+            f"  Saved {result.companies_created} new companies, "
+            f"{len(result.claims_created)} new claims"
+        )
+
     def migrate_lobbying_data(self):
         """Convert existing lobbying claims into the corporate_lobbying value system."""
         lobbying_claims = Claim.objects.filter(claim_type='LOBBYING_SPEND')
@@ -313,148 +306,12 @@ class Command(BaseCommand):
 
     def compute_snapshots(self):
         """Compute CompanyValueSnapshot for each company/value pair with claims."""
-        for company in Company.objects.all():
-            claims = Claim.objects.filter(subject=company.uri)
-
-            # Corporate lobbying
-            lobbying_claims = claims.filter(claim_type='LOBBYING_SPEND')
-            if lobbying_claims.exists():
-                claim = lobbying_claims.first()
-                rule = ScoringRule.objects.get(value_id='corporate_lobbying', version=1)
-                amt_float = float(claim.amt)
-                grade, score = self._apply_threshold_inverse(rule.config['thresholds'], amt_float)
-
-                # Format display amount
-                if amt_float >= 1000000:
-                    display_amt = f"${amt_float / 1000000:.1f}M"
-                elif amt_float >= 1000:
-                    display_amt = f"${amt_float / 1000:.0f}K"
-                else:
-                    display_amt = f"${amt_float:,.0f}"
-
-                CompanyValueSnapshot.objects.update_or_create(
-                    company=company,
-                    value_id='corporate_lobbying',
-                    defaults={
-                        'score': score,
-                        'grade': grade,
-                        'claim_uris': [claim.uri],
-                        'highlight_on_card': True,
-                        'highlight_priority': 3,
-                        'display_text': f"Lobbying: {display_amt} (2024)",
-                        'display_icon': 'megaphone',
-                        'scoring_rule_version': 1,
-                    }
-                )
-                self.stdout.write(f"  Lobbying snapshot: {company.name} = {grade}")
-
-            # BBFAW tier
-            bbfaw_claims = claims.filter(claim_type='FARM_WELFARE_TIER')
-            if bbfaw_claims.exists():
-                claim = bbfaw_claims.first()
-                rule = ScoringRule.objects.get(value_id='farm_animal_welfare', version=1)
-                mapping = rule.config['mapping'].get(claim.label, {'grade': 'F', 'score': -1.0})
-
-                CompanyValueSnapshot.objects.update_or_create(
-                    company=company,
-                    value_id='farm_animal_welfare',
-                    defaults={
-                        'score': mapping['score'],
-                        'grade': mapping['grade'],
-                        'claim_uris': [claim.uri],
-                        'highlight_on_card': True,
-                        'highlight_priority': 1,
-                        'display_text': f"BBFAW Tier {claim.label}",
-                        'display_icon': 'cow',
-                        'scoring_rule_version': 1,
-                    }
-                )
-                self.stdout.write(f"  BBFAW snapshot: {company.name} = {mapping['grade']}")
-
-            # Cage-free
-            cage_claims = claims.filter(claim_type='CAGE_FREE_PERCENT')
-            if cage_claims.exists():
-                claim = cage_claims.first()
-                rule = ScoringRule.objects.get(value_id='cage_free_eggs', version=1)
-                amt_float = float(claim.amt)
-                grade, score = self._apply_threshold(rule.config['thresholds'], amt_float)
-
-                CompanyValueSnapshot.objects.update_or_create(
-                    company=company,
-                    value_id='cage_free_eggs',
-                    defaults={
-                        'score': score,
-                        'grade': grade,
-                        'claim_uris': [claim.uri],
-                        'highlight_on_card': True,
-                        'highlight_priority': 2,
-                        'display_text': f"{int(claim.amt)}% cage-free",
-                        'display_icon': 'egg',
-                        'scoring_rule_version': 1,
-                    }
-                )
-                self.stdout.write(f"  Cage-free snapshot: {company.name} = {grade}")
-
-            # ICE contracts
-            ice_claims = claims.filter(claim_type='ICE_CONTRACT')
-            if ice_claims.exists():
-                claim = ice_claims.first()
-                rule = ScoringRule.objects.get(value_id='ice_contracts', version=1)
-                amt_float = float(claim.amt)
-                grade, score = self._apply_threshold_inverse(rule.config['thresholds'], amt_float)
-
-                CompanyValueSnapshot.objects.update_or_create(
-                    company=company,
-                    value_id='ice_contracts',
-                    defaults={
-                        'score': score,
-                        'grade': grade,
-                        'claim_uris': [claim.uri],
-                        'highlight_on_card': True,
-                        'highlight_priority': 0,
-                        'display_text': f"ICE contracts: ${claim.amt}M",
-                        'display_icon': 'warning',
-                        'scoring_rule_version': 1,
-                    }
-                )
-                self.stdout.write(f"  ICE contract snapshot: {company.name} = {grade}")
-
-            # ICE detention
-            detention_claims = claims.filter(claim_type='ICE_DETENTION_OPERATOR')
-            if detention_claims.exists():
-                claim = detention_claims.first()
-
-                CompanyValueSnapshot.objects.update_or_create(
-                    company=company,
-                    value_id='ice_detention',
-                    defaults={
-                        'score': -1.0,
-                        'grade': 'F',
-                        'claim_uris': [claim.uri],
-                        'highlight_on_card': True,
-                        'highlight_priority': 0,
-                        'display_text': 'ICE detention operator',
-                        'display_icon': 'alert',
-                        'scoring_rule_version': 1,
-                    }
-                )
-                self.stdout.write(f"  ICE detention snapshot: {company.name} = F")
-
-    def _apply_threshold(self, thresholds, value):
-        """Higher value = better grade."""
-        for t in thresholds:
-            if value >= t['min']:
-                return t['grade'], t['score']
-        last = thresholds[-1]
-        return last['grade'], last['score']
-
-    def _apply_threshold_inverse(self, thresholds, value):
-        """Higher value = worse grade."""
-        for t in thresholds:
-            if value >= t['min']:
-                return t['grade'], t['score']
-        last = thresholds[-1]
-        return last['grade'], last['score']
+        written = score_values([
+            'corporate_lobbying', 'farm_animal_welfare', 'cage_free_eggs',
+            'ice_contracts', 'ice_detention',
+        ])
+        for value_slug, count in written.items():
+            self.stdout.write(f"  {value_slug}: {count} snapshots")
 
     def create_badges(self):
         """Create badges from computed snapshots."""
@@ -1,10 +1,14 @@
 from django.core.management.base import BaseCommand
-from core.models import Claim, Company, Value, ScoringRule, CompanyValueSnapshot, CompanyBadge
+from core import derived
+from core.ingest import BulkIngest
+from core.scoring import score_values
+from core.models import Value, ScoringRule, CompanyValueSnapshot, CompanyBadge
 
 
 class Command(BaseCommand):
     help = "Import PETA cruelty-free data"
 
+    @derived.deferred()
     def handle(self, *args, **options):
         self.stdout.write("Creating Cruelty-Free Value...")
         self.create_value()
@@ -25,26 +29,6 @@ class Command(BaseCommand):
             f"Done! {count} claims, {snap_count} snapshots, {badge_count} badges"
         ))
 
-    def get_or_create_company(self, slug, name, ticker, sector):
-        if ticker:
-            existing = Company.objects.filter(ticker=ticker).first()
-            if existing:
-                if sector and not existing.sector:
-                    existing.sector = sector
-                    existing.save()
-                return existing
-        uri = f'urn:company:{slug}'
-        company, _ = Company.objects.update_or_create(
-            uri=uri,
-            defaults={'name': name, 'ticker': ticker, 'sector': sector}
-        )
-        return company
-
-    def create_claim_safe(self, **kwargs):
-        if Claim.objects.filter(uri=kwargs['uri']).exists():
-            return None
-        return Claim.objects.create(**kwargs)
-
     def create_value(self):
         Value.objects.update_or_create(
             slug='cruelty_free',
@@ -78,7 +62,8 @@ class Command(BaseCommand):
         )
 
     def import_peta_data(self):
-        count = 0
+        ingest = BulkIngest(fill_sector=True)
+        messages = {}
 
         cruelty_free_vegan = [
             ('lush', 'Lush', None, 'Consumer Goods'),
@@ -148,87 +133,39 @@ class Command(BaseCommand):
         ]
 
         for slug, name, ticker, sector in cruelty_free_vegan:
-            if self._create_peta_claim(slug, name, ticker, sector, 'cruelty_free_vegan'):
-                count += 1
+            self._stage_peta_claim(ingest, messages, slug, name, ticker, sector, 'cruelty_free_vegan')
 
         for slug, name, ticker, sector in cruelty_free:
-            if self._create_peta_claim(slug, name, ticker, sector, 'cruelty_free'):
-                count += 1
+            self._stage_peta_claim(ingest, messages, slug, name, ticker, sector, 'cruelty_free')
 
         for slug, name, ticker, sector in working_toward:
-            if self._create_peta_claim(slug, name, ticker, sector, 'working_toward'):
-                count += 1
+            self._stage_peta_claim(ingest, messages, slug, name, ticker, sector, 'working_toward')
 
         for slug, name, ticker, sector in tests_on_animals:
-            if self._create_peta_claim(slug, name, ticker, sector, 'tests_on_animals'):
-                count += 1
-
-        return count
-
-    def _create_peta_claim(self, slug, name, ticker, sector, label):
-        company = self.get_or_create_company(slug, name, ticker, sector)
-        claim = self.create_claim_safe(
-            uri=f'urn:peta:2026:{slug}:cruelty-free',
-            subject=company.uri,
+            self._stage_peta_claim(ingest, messages, slug, name, ticker, sector, 'tests_on_animals')
+
+        created = ingest.save().created_uris
+        for uri, message in messages.items():
+            if uri in created:
+                self.stdout.write(message)
+        return len(created)
+
+    def _stage_peta_claim(self, ingest, messages, slug, name, ticker, sector, label):
+        company = ingest.company(slug, name, ticker, sector)
+        uri = f'urn:peta:2026:{slug}:cruelty-free'
+        ingest.claim(
+            company,
+            uri=uri,
             claim_type='CRUELTY_FREE_STATUS',
             label=label,
             effective_date='2026-01-01',
             source_uri='https://crueltyfree.peta.org/',
             how_known='official_certification',
         )
-        if claim:
-            self.stdout.write(f"  PETA: {name} = {label}")
-            return True
-        return False
+        messages.setdefault(uri, f"  PETA: {name} = {label}")
 
     def compute_snapshots(self):
-        rule = ScoringRule.objects.get(value_id='cruelty_free', version=1)
-        mapping = rule.config['mapping']
-        count = 0
-
-        display_text_map = {
-            'cruelty_free_vegan': 'Cruelty-free & Vegan',
-            'cruelty_free': 'Cruelty-free',
-            'working_toward': 'Working toward cruelty-free',
-            'tests_on_animals': 'Tests on animals',
-        }
-
-        display_icon_map = {
-            'cruelty_free_vegan': 'rabbit',
-            'cruelty_free': 'rabbit',
-            'working_toward': 'clock',
-            'tests_on_animals': 'alert',
-        }
-
-        companies_with_claims = Company.objects.filter(
-            uri__in=Claim.objects.filter(claim_type='CRUELTY_FREE_STATUS').values_list('subject', flat=True)
-        ).distinct()
-
-        for company in companies_with_claims:
-            claim = Claim.objects.filter(subject=company.uri, claim_type='CRUELTY_FREE_STATUS').first()
-            if not claim:
-                continue
-
-            grade_info = mapping.get(claim.label, {'grade': 'F', 'score': -1.0})
-
-            CompanyValueSnapshot.objects.update_or_create(
-                company=company,
-                value_id='cruelty_free',
-                defaults={
-                    'score': grade_info['score'],
-                    'grade': grade_info['grade'],
-                    'claim_uris': [claim.uri],
-                    'highlight_on_card': True,
-                    'highlight_priority': 2,
-                    'display_text': display_text_map.get(claim.label, claim.label),
-                    'display_icon': display_icon_map.get(claim.label, 'rabbit'),
-                    'scoring_rule_version': 1,
-                }
-            )
-            count += 1
-            self.stdout.write(f"  Snapshot: {company.name} = {grade_info['grade']}")
-
-        return count
+        return score_values(['cruelty_free']).get('cruelty_free', 0)
 
     def create_badges(self):
         count = 0
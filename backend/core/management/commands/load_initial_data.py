@@ -3,12 +3,14 @@ import uuid
 from decimal import Decimal
 from pathlib import Path
 from django.core.management.base import BaseCommand
+from core import derived
 from core.models import Claim, Company, CompanyScore
 
 
 class Command(BaseCommand):
     help = 'Load initial company data from scored_companies.json'
 
+    @derived.deferred()
     def handle(self, *args, **options):
         data_path = Path(__file__).resolve().parent.parent.parent.parent.parent / 'data' / 'scored_companies.json'
 
@@ -1,5 +1,6 @@
 """Load top ~250 grocery products with brand→company mapping and category."""
 from django.core.management.base import BaseCommand
+from core import derived
 from core.models import Company, Product
 
 # Companies that may need to be created (name, ticker, sector)
@@ -356,6 +357,7 @@ class Command(BaseCommand):
         parser.add_argument('--clear', action='store_true',
             help='Clear existing products before loading')
 
+    @derived.deferred()
     def handle(self, *args, **options):
         if options['clear']:
             deleted, _ = Product.objects.all().delete()
@@ -1,5 +1,6 @@
 """Load additional products to bring total to 300+."""
 from django.core.management.base import BaseCommand
+from core import derived
 from core.models import Company, Product
 
 NEW_COMPANIES = [
@@ -207,6 +208,7 @@ EXTRA_COMPANIES = [
 class Command(BaseCommand):
     help = "Load additional products to reach 300+"
 
+    @derived.deferred()
     def handle(self, *args, **options):
         # Create new companies
         all_new = NEW_COMPANIES + EXTRA_COMPANIES
@@ -4,6 +4,7 @@ import urllib.request
 import urllib.error
 import urllib.parse
 from django.core.management.base import BaseCommand
+from core import derived
 from core.models import Company
 
 # Manual overrides for companies that Clearbit gets wrong or misses
@@ -183,6 +184,7 @@ class Command(BaseCommand):
         parser.add_argument('--delay', type=float, default=0.3, help="Seconds between API calls")
         parser.add_argument('--all', action='store_true', help="Include companies without tickers too")
 
+    @derived.deferred()
     def handle(self, *args, **options):
         dry_run = options['dry_run']
         delay = options['delay']
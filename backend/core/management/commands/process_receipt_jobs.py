@@ -0,0 +1,81 @@
+"""Run queued receipt analysis jobs.
+
+Claims jobs as worker threads free up, so several receipts are analyzed
+at once and web workers only ever enqueue and poll (see core.receipt_jobs).
+The OCR process pool (core.receipt_ocr.OCRPool) is started and warmed
+before the first job, and its queue depth and latency are logged.
+
+Usage:
+    python manage.py process_receipt_jobs               # run until stopped
+    python manage.py process_receipt_jobs --workers 4
+    python manage.py process_receipt_jobs --once        # drain and exit
+"""
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from core import receipt_jobs
+from core.receipt_ocr import get_ocr_pool
+
+# Housekeeping (stale/expired jobs, OCR stats) runs at most this often, in seconds
+HOUSEKEEPING_INTERVAL = 60
+
+
+class Command(BaseCommand):
+    help = "Process queued receipt analysis jobs"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.RECEIPT_JOB_WORKERS,
+                            help="Jobs run at once (default: RECEIPT_JOB_WORKERS)")
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help="Seconds between queue polls when idle")
+        parser.add_argument('--once', action='store_true',
+                            help="Exit once the queue is empty")
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        ocr_pool = get_ocr_pool()
+        if ocr_pool is not None:
+            self.stdout.write(f"Warming {ocr_pool.workers} OCR workers...")
+            ocr_pool.warm()
+
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='receipt-job')
+        running = {}
+        last_housekeeping = 0.0
+        self.stdout.write(f"Processing receipt jobs with {workers} workers")
+        try:
+            while True:
+                close_old_connections()
+                if time.monotonic() - last_housekeeping > HOUSEKEEPING_INTERVAL:
+                    stale = receipt_jobs.fail_stale_jobs()
+                    purged = receipt_jobs.purge_old_jobs()
+                    if stale or purged:
+                        self.stdout.write(f"  Failed {stale} stale jobs, purged {purged} old jobs")
+                    if ocr_pool is not None:
+                        self.stdout.write(f"  OCR pool: {ocr_pool.stats()}")
+                    last_housekeeping = time.monotonic()
+
+                for job_id in receipt_jobs.claim_jobs(workers - len(running)):
+                    running[pool.submit(receipt_jobs.run_job, job_id)] = job_id
+
+                if not running:
+                    if options['once']:
+                        break
+                    time.sleep(options['interval'])
+                    continue
+
+                done, _ = wait(running, timeout=options['interval'], return_when=FIRST_COMPLETED)
+                for future in done:
+                    job_id = running.pop(future)
+                    try:
+                        self.stdout.write(f"  Job {job_id}: {future.result()}")
+                    except Exception as e:
+                        self.stderr.write(f"  Job {job_id} worker error: {e}")
+        except KeyboardInterrupt:
+            pass
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+            if ocr_pool is not None:
+                ocr_pool.shutdown()
@@ -0,0 +1,42 @@
+"""Drain the PendingRescore queue filled by new Claims and ScoringRule versions.
+
+Recomputes only the queued (company, value) snapshots and their badges,
+then refreshes the affected companies' derived data once per batch.
+
+Usage:
+    python manage.py process_rescore_queue              # drain and exit
+    python manage.py process_rescore_queue --loop       # keep polling
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, transaction
+from core import derived
+from core.scoring import process_queue
+
+
+class Command(BaseCommand):
+    help = "Rescore queued company/value pairs"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help="Queued pairs to rescore per transaction")
+        parser.add_argument('--loop', action='store_true',
+                            help="Keep polling the queue instead of exiting when it's empty")
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help="Seconds between polls with --loop")
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            close_old_connections()
+            with derived.deferred(), transaction.atomic():
+                count = process_queue(options['batch_size'])
+            total += count
+            if count:
+                self.stdout.write(f"  Rescored {count} pairs")
+            elif options['loop']:
+                time.sleep(options['interval'])
+            else:
+                break
+        self.stdout.write(self.style.SUCCESS(f"Done! {total} pairs rescored"))
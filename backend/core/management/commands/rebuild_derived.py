@@ -0,0 +1,18 @@
+"""Recompute derived company data: overall grades and ranked alternatives.
+
+Snapshot changes refresh affected companies automatically; run this after
+bulk writes that bypass model signals, or to repair the derived data.
+
+Usage:
+    python manage.py rebuild_derived
+"""
+from django.core.management.base import BaseCommand
+from core.derived import rebuild_all
+
+
+class Command(BaseCommand):
+    help = "Recompute denormalized company grades and alternatives"
+
+    def handle(self, *args, **options):
+        rebuild_all()
+        self.stdout.write(self.style.SUCCESS("Done!"))
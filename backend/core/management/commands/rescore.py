@@ -0,0 +1,31 @@
+"""Recompute CompanyValueSnapshots from Claims with the current ScoringRules.
+
+Scores every value in core.scoring.VALUE_SPECS (or just --value ones) for
+every company in one pass.
+
+Usage:
+    python manage.py rescore
+    python manage.py rescore --value esg_score --value cruelty_free
+"""
+from django.core.management.base import BaseCommand, CommandError
+from core import derived
+from core.scoring import SPECS_BY_VALUE, score_values
+
+
+class Command(BaseCommand):
+    help = "Rescore all company/value snapshots from claims"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--value', action='append', dest='values', default=[],
+                            help="Value slug to rescore (repeatable, default: all)")
+
+    @derived.deferred()
+    def handle(self, *args, **options):
+        unknown = [slug for slug in options['values'] if slug not in SPECS_BY_VALUE]
+        if unknown:
+            raise CommandError(f"No scoring spec for: {', '.join(unknown)}")
+
+        written = score_values(options['values'] or None)
+        for value_slug, count in written.items():
+            self.stdout.write(f"  {value_slug}: {count} snapshots")
+        self.stdout.write(self.style.SUCCESS(f"Done! {sum(written.values())} snapshots"))
@@ -7,6 +7,7 @@ Usage:
     python manage.py seed_brand_mappings
 """
 from django.core.management.base import BaseCommand
+from core import derived
 from core.models import Company, BrandMapping
 
 
@@ -202,6 +203,7 @@ BRAND_MAPPINGS = [
 class Command(BaseCommand):
     help = "Seed brand-to-company mappings for barcode scanning"
 
+    @derived.deferred()
     def handle(self, *args, **options):
         created = 0
         skipped = 0
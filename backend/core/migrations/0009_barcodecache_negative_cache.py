@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_merge_0003_companyvote_0007_company_website'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='barcodecache',
+            name='provider',
+            field=models.CharField(blank=True, help_text='Which API provided this: open_food_facts, open_beauty_facts, etc.', max_length=50),
+        ),
+        migrations.AddField(
+            model_name='barcodecache',
+            name='is_miss',
+            field=models.BooleanField(db_index=True, default=False, help_text='No provider had this barcode (negative cache entry)'),
+        ),
+        migrations.AddField(
+            model_name='barcodecache',
+            name='provider_results',
+            field=models.JSONField(blank=True, default=dict, help_text='Per-provider outcome of the lookup: miss, error or timeout'),
+        ),
+        migrations.AddField(
+            model_name='barcodecache',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, help_text='When a miss entry stops short-circuiting lookups', null=True),
+        ),
+    ]
@@ -0,0 +1,86 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Frozen copy of core.alternatives as of this migration, so later changes
+# to the app code can't change what it builds
+ANIMAL_WELFARE_VALUES = {'farm_animal_welfare', 'cage_free_eggs', 'cruelty_free'}
+
+
+def rank_alternatives(company_ids, scores, limit):
+    averages = {}
+    bonuses = {}
+    for cid in company_ids:
+        snaps = scores.get(cid)
+        if not snaps:
+            continue
+        averages[cid] = sum(score for _, score in snaps) / len(snaps)
+        bonuses[cid] = sum(
+            0.2 for slug, score in snaps
+            if slug in ANIMAL_WELFARE_VALUES and score > 0.3
+        )
+
+    ordered = sorted(averages, key=lambda cid: (bonuses[cid], averages[cid]), reverse=True)
+
+    ranked = {}
+    for cid in company_ids:
+        own_avg = averages.get(cid, 0)
+        picks = []
+        for alt in ordered:
+            if alt != cid and averages[alt] > own_avg:
+                picks.append((alt, averages[alt], bonuses[alt]))
+                if len(picks) >= limit:
+                    break
+        ranked[cid] = picks
+    return ranked
+
+
+def build_alternatives(apps, schema_editor):
+    Company = apps.get_model('core', 'Company')
+    CompanyValueSnapshot = apps.get_model('core', 'CompanyValueSnapshot')
+    CompanyAlternative = apps.get_model('core', 'CompanyAlternative')
+
+    members = {}
+    for cid, sector in Company.objects.exclude(sector__isnull=True).order_by('name').values_list('id', 'sector'):
+        members.setdefault(sector, []).append(cid)
+    scores = {}
+    for cid, slug, score in CompanyValueSnapshot.objects.values_list('company_id', 'value_id', 'score'):
+        scores.setdefault(cid, []).append((slug, score))
+
+    rows = []
+    for company_ids in members.values():
+        for cid, picks in rank_alternatives(company_ids, scores, settings.ALTERNATIVES_STORED).items():
+            for rank, (alt, avg, bonus) in enumerate(picks):
+                rows.append(CompanyAlternative(
+                    company_id=cid, alternative_id=alt, rank=rank,
+                    average_score=avg, animal_welfare_bonus=bonus,
+                ))
+    CompanyAlternative.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_barcodecache_negative_cache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompanyAlternative',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField(help_text='0 = best alternative')),
+                ('average_score', models.FloatField(help_text="Alternative's mean snapshot score")),
+                ('animal_welfare_bonus', models.FloatField(default=0)),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+                ('alternative', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ranked_as_alternative', to='core.company')),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ranked_alternatives', to='core.company')),
+            ],
+            options={
+                'ordering': ['company', 'rank'],
+                'unique_together': {('company', 'rank')},
+            },
+        ),
+        migrations.RunPython(build_alternatives, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,68 @@
+from django.db import migrations, models
+
+
+# Frozen copy of core.derived.summarize_snapshots as of this migration
+def summarize_snapshots(snapshots, disqualifying_slugs):
+    if not snapshots:
+        return None, None, False
+
+    avg = sum(score for _, score, _ in snapshots) / len(snapshots)
+
+    if any(slug in disqualifying_slugs and grade.startswith('F')
+           for slug, _, grade in snapshots):
+        return 'F', avg, True
+
+    if avg >= 0.8:
+        return 'A', avg, False
+    if avg >= 0.3:
+        return 'B', avg, False
+    if avg >= -0.1:
+        return 'C', avg, False
+    if avg >= -0.5:
+        return 'D', avg, False
+    return 'F', avg, False
+
+
+def populate_grades(apps, schema_editor):
+    Company = apps.get_model('core', 'Company')
+    CompanyValueSnapshot = apps.get_model('core', 'CompanyValueSnapshot')
+    Value = apps.get_model('core', 'Value')
+
+    disqualifying = set(Value.objects.filter(is_disqualifying=True).values_list('slug', flat=True))
+    snapshots = {}
+    for cid, slug, score, grade in CompanyValueSnapshot.objects.values_list(
+            'company_id', 'value_id', 'score', 'grade'):
+        snapshots.setdefault(cid, []).append((slug, score, grade))
+
+    companies = list(Company.objects.filter(pk__in=snapshots))
+    for company in companies:
+        (company.overall_grade, company.average_score,
+         company.is_disqualified) = summarize_snapshots(snapshots[company.pk], disqualifying)
+    Company.objects.bulk_update(
+        companies, ['overall_grade', 'average_score', 'is_disqualified'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_companyalternative'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='company',
+            name='overall_grade',
+            field=models.CharField(blank=True, max_length=5, null=True),
+        ),
+        migrations.AddField(
+            model_name='company',
+            name='average_score',
+            field=models.FloatField(blank=True, help_text="Mean score across this company's value snapshots", null=True),
+        ),
+        migrations.AddField(
+            model_name='company',
+            name='is_disqualified',
+            field=models.BooleanField(default=False, help_text='F on a disqualifying value'),
+        ),
+        migrations.RunPython(populate_grades, migrations.RunPython.noop),
+    ]
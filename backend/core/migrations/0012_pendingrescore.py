@@ -0,0 +1,28 @@
+# Generated by Django 4.2.28 on 2026-10-18 01:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_company_denormalized_grade'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingRescore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reason', models.CharField(choices=[('claim', 'New claim'), ('rule', 'New scoring rule')], max_length=10)),
+                ('enqueued_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_rescores', to='core.company')),
+                ('value', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_rescores', to='core.value')),
+            ],
+            options={
+                'ordering': ['enqueued_at'],
+                'unique_together': {('company', 'value')},
+            },
+        ),
+    ]
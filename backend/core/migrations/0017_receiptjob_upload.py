@@ -0,0 +1,17 @@
+import core.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_receiptjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='receiptjob',
+            name='upload',
+            field=models.FileField(blank=True, help_text='Multipart upload; deleted once the job finishes', storage=core.models.receipt_upload_storage, upload_to='%Y/%m/%d/'),
+        ),
+    ]
@@ -1,6 +1,12 @@
+import uuid
+
+from django.conf import settings
 from django.db import models
+from django.db.models.functions import Upper
 from django.contrib.auth.models import User
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.core.exceptions import ValidationError
+from django.core.files.storage import FileSystemStorage
 
 
 class Claim(models.Model):
@@ -44,12 +50,24 @@ class Company(models.Model):
     name = models.CharField(max_length=200)
     sector = models.CharField(max_length=100, null=True, blank=True)
     website = models.URLField(max_length=500, null=True, blank=True)
+
+    # Denormalized from value_snapshots by core.derived; do not edit by hand
+    overall_grade = models.CharField(max_length=5, null=True, blank=True)
+    average_score = models.FloatField(null=True, blank=True,
+        help_text="Mean score across this company's value snapshots")
+    is_disqualified = models.BooleanField(default=False,
+        help_text="F on a disqualifying value")
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         verbose_name_plural = "companies"
         ordering = ['name']
+        indexes = [
+            # Keyset pagination order (core.pagination.CompanyCursorPagination)
+            models.Index(fields=['name', 'id'], name='core_company_name_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.ticker} - {self.name}" if self.ticker else self.name
@@ -245,7 +263,11 @@ class BrandMapping(models.Model):
 
 
 class BarcodeCache(models.Model):
-    """Cache of barcode -> product data from external APIs."""
+    """Cache of barcode -> product data from external APIs.
+
+    Rows with is_miss=True record that no provider knew the barcode; they
+    short-circuit repeat lookups until expires_at.
+    """
     barcode = models.CharField(max_length=20, unique=True, db_index=True)
     product_name = models.CharField(max_length=300, blank=True)
     brands = models.CharField(max_length=500, blank=True,
@@ -254,10 +276,16 @@ class BarcodeCache(models.Model):
         help_text="Owner/manufacturer field from product data")
     categories = models.CharField(max_length=500, blank=True)
     image_url = models.URLField(max_length=500, blank=True)
-    provider = models.CharField(max_length=50,
+    provider = models.CharField(max_length=50, blank=True,
         help_text="Which API provided this: open_food_facts, open_beauty_facts, etc.")
     raw_response = models.JSONField(default=dict,
         help_text="Full API response for debugging")
+    is_miss = models.BooleanField(default=False, db_index=True,
+        help_text="No provider had this barcode (negative cache entry)")
+    provider_results = models.JSONField(default=dict, blank=True,
+        help_text="Per-provider outcome of the lookup: miss, error or timeout")
+    expires_at = models.DateTimeField(null=True, blank=True,
+        help_text="When a miss entry stops short-circuiting lookups")
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -290,6 +318,13 @@ class Product(models.Model):
 
     class Meta:
         ordering = ['category', 'name']
+        indexes = [
+            # Trigram indexes on UPPER(col) serve both icontains (rendered as
+            # UPPER(col) LIKE '%Q%') and the word-similarity lookups in core.search
+            GinIndex(OpClass(Upper('name'), name='gin_trgm_ops'), name='core_product_name_trgm'),
+            GinIndex(OpClass(Upper('brand_name'), name='gin_trgm_ops'),
+                     name='core_product_brand_name_trgm'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.company.name})"
@@ -329,3 +364,106 @@ class UnmatchedProduct(models.Model):
 
     def __str__(self):
         return f"{self.product_name} ({self.brand_name}) - seen {self.seen_count}x"
+
+
+class CompanyAlternative(models.Model):
+    """Precomputed better-rated alternative for a company, in rank order.
+
+    Maintained by core.alternatives whenever snapshots in the company's
+    sector change, so the scan path reads a ranked list instead of
+    scoring the whole sector per request.
+    """
+    company = models.ForeignKey(Company, on_delete=models.CASCADE,
+        related_name='ranked_alternatives')
+    alternative = models.ForeignKey(Company, on_delete=models.CASCADE,
+        related_name='ranked_as_alternative')
+    rank = models.PositiveSmallIntegerField(help_text="0 = best alternative")
+    average_score = models.FloatField(help_text="Alternative's mean snapshot score")
+    animal_welfare_bonus = models.FloatField(default=0)
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['company', 'rank']
+        ordering = ['company', 'rank']
+
+    def __str__(self):
+        return f"{self.company.name} #{self.rank}: {self.alternative.name}"
+
+
+class PendingRescore(models.Model):
+    """A (company, value) pair whose snapshot is stale.
+
+    Queued when a Claim is inserted or a ScoringRule version is published;
+    drained by `manage.py process_rescore_queue` (see core.scoring).
+    Re-queuing an already pending pair just bumps enqueued_at.
+    """
+    REASONS = [
+        ('claim', 'New claim'),
+        ('rule', 'New scoring rule'),
+    ]
+
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='pending_rescores')
+    value = models.ForeignKey(Value, on_delete=models.CASCADE, related_name='pending_rescores')
+    reason = models.CharField(max_length=10, choices=REASONS)
+    enqueued_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        unique_together = ['company', 'value']
+        ordering = ['enqueued_at']
+
+    def __str__(self):
+        return f"{self.company.name} / {self.value_id} ({self.reason})"
+
+
+class DataVersion(models.Model):
+    """Single-row counter bumped on every catalog data write.
+
+    Drives ETag/Last-Modified on read-mostly endpoints; see core.data_version.
+    """
+    SINGLETON_ID = 1
+
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"v{self.version}"
+
+
+def receipt_upload_storage():
+    """Multipart receipt uploads; kept outside any publicly served directory."""
+    return FileSystemStorage(location=settings.RECEIPT_UPLOAD_DIR)
+
+
+class ReceiptJob(models.Model):
+    """One queued receipt analysis (POST /api/receipt/analyze/).
+
+    Created by the view and run by `manage.py process_receipt_jobs`, which
+    advances status through the pipeline stages; clients poll
+    /api/receipt/jobs/<id>/ for the result.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('ocr', 'Reading text'),
+        ('parsing', 'Parsing items'),
+        ('matching', 'Matching companies'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    FINISHED = ('done', 'failed')
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued', db_index=True)
+    image_base64 = models.TextField(blank=True, help_text="Upload; cleared once the job finishes")
+    upload = models.FileField(upload_to='%Y/%m/%d/', storage=receipt_upload_storage, blank=True,
+                              help_text="Multipart upload; deleted once the job finishes")
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Receipt job {self.id} ({self.status})"
@@ -0,0 +1,24 @@
+from rest_framework.pagination import CursorPagination
+
+
+class CompanyCursorPagination(CursorPagination):
+    """Cursor pagination ordered by (name, id).
+
+    DRF keys the cursor on the first ordering field only: it holds the
+    last name on the page plus an offset over the companies sharing that
+    name. The next page filters name >= that name (a range scan on the
+    (name, id) index) and skips the offset, so its cost doesn't grow
+    with the page number, only with how many companies share the boundary
+    name. id just makes the ordering total.
+    Page size comes from REST_FRAMEWORK['PAGE_SIZE'].
+    """
+    ordering = ('name', 'id')
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page = super().paginate_queryset(queryset, request, view)
+        # Relative next/previous links, so pages in core.response_cache
+        # are valid whatever host they're served from
+        self.base_url = request.get_full_path()
+        return page
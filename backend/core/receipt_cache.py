@@ -0,0 +1,80 @@
+"""Content-addressed cache for the receipt pipeline.
+
+Client retries, double-taps and shared receipts upload the same file
+again. OCR and the Claude call are the slow and costly steps, so their
+results are kept by SHA-256 digest:
+
+- file contents → extracted text (receipt_ocr.extract_text_from_file)
+- normalized text → parsed receipt (receipt_parser.parse_receipt_with_claude)
+- item line, price stripped → the product on it, so lines Claude has
+  already read are left out of later requests
+
+Keys also carry whatever changes the output (OCR preprocessing, Claude
+model and prompt version). The backend is the Django cache named by
+settings.RECEIPT_CACHE_ALIAS, whose TIMEOUT and MAX_ENTRIES bound age
+and size. Failures are never cached.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def _cache():
+    return caches[settings.RECEIPT_CACHE_ALIAS]
+
+
+def digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace and blank lines, which OCR output varies in."""
+    lines = (' '.join(line.split()) for line in text.splitlines())
+    return '\n'.join(line for line in lines if line)
+
+
+def file_digest(file) -> str:
+    """digest() of a binary file's contents, read in chunks; rewinds it."""
+    file.seek(0)
+    sha = hashlib.sha256()
+    for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+        sha.update(chunk)
+    file.seek(0)
+    return sha.hexdigest()
+
+
+def text_key(contents_digest: str, variant: str) -> str:
+    return f"receipt:text:{variant}:{contents_digest}"
+
+
+def parse_key(text: str, variant: str) -> str:
+    return f"receipt:parse:{variant}:{digest(normalize_text(text).encode())}"
+
+
+def line_key(line: str, variant: str) -> str:
+    return f"receipt:line:{variant}:{digest(line.encode())}"
+
+
+def get(key):
+    return _cache().get(key)
+
+
+def get_many(keys):
+    return _cache().get_many(keys)
+
+
+def set_many(values):
+    _cache().set_many(values)
+
+
+def get_or_compute(key, compute):
+    """Cached value for key, else compute() (stored unless it raises)."""
+    cache = _cache()
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value)
+    return value
@@ -0,0 +1,183 @@
+"""Receipt photo preprocessing ahead of OCR.
+
+Phone photos arrive as ~12-megapixel colour JPEGs, mostly table and
+background, with text several times taller than EasyOCR needs.
+prepare_image() decodes the upload once, straight to grayscale (and at
+a reduced scale when the photo is far larger than EasyOCR's detection
+canvas), then works on that one numpy array:
+
+1. crop to the receipt: the largest bright region, when there is one,
+2. downscale so characters are about `text_height` pixels tall,
+3. deskew by the median angle of the text lines.
+
+The result goes straight to reader.readtext(); nothing is re-encoded.
+"""
+import io
+
+import cv2
+import numpy as np
+
+# EasyOCR's default detection canvas: it shrinks anything larger to this
+# anyway, so decoding never goes below it before the text height is known
+CANVAS_SIZE = 2560
+
+# Working size for the layout analysis (crop, text height, skew)
+ANALYSIS_SIZE = 1000
+
+# Skew beyond this is more likely a misread layout than a tilted photo
+MAX_SKEW_DEGREES = 15.0
+
+
+def _reduced_decode_flag(image_bytes: bytes) -> int:
+    """Grayscale decode flag, reduced 2/4/8x if the photo stays above CANVAS_SIZE."""
+    from PIL import Image
+
+    try:
+        # Reads only the header
+        longest = max(Image.open(io.BytesIO(image_bytes)).size)
+    except Exception:
+        return cv2.IMREAD_GRAYSCALE
+    for factor, flag in ((8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+                         (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+                         (2, cv2.IMREAD_REDUCED_GRAYSCALE_2)):
+        if longest // factor >= CANVAS_SIZE:
+            return flag
+    return cv2.IMREAD_GRAYSCALE
+
+
+def decode(image_bytes: bytes) -> np.ndarray:
+    """Decode an uploaded image to a grayscale array (EXIF rotation applied)."""
+    buffer = np.frombuffer(image_bytes, dtype=np.uint8)
+    gray = cv2.imdecode(buffer, _reduced_decode_flag(image_bytes))
+    if gray is None:
+        raise ValueError("Unsupported or corrupt image")
+    return gray
+
+
+def _analysis_copy(gray: np.ndarray):
+    """(small copy for layout analysis, its scale relative to gray)."""
+    scale = min(1.0, ANALYSIS_SIZE / max(gray.shape))
+    if scale == 1.0:
+        return gray, scale
+    small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return small, scale
+
+
+def crop_to_receipt(gray: np.ndarray) -> np.ndarray:
+    """Crop to the paper, if it stands out from a darker background.
+
+    Scans and screenshots (no clear paper edge) come back unchanged.
+    Returns a view, not a copy.
+    """
+    small, scale = _analysis_copy(gray)
+    blurred = cv2.GaussianBlur(small, (5, 5), 0)
+    _, paper = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    # Close over the printed text so the receipt is one solid blob
+    paper = cv2.morphologyEx(paper, cv2.MORPH_CLOSE, np.ones((15, 15), np.uint8))
+    contours, _ = cv2.findContours(paper, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return gray
+    largest = max(contours, key=cv2.contourArea)
+    share = cv2.contourArea(largest) / small.size
+    if not 0.1 <= share <= 0.9:
+        return gray
+
+    x, y, w, h = cv2.boundingRect(largest)
+    margin = 4
+    height, width = gray.shape
+    top = max(0, int((y - margin) / scale))
+    left = max(0, int((x - margin) / scale))
+    bottom = min(height, int((y + h + margin) / scale))
+    right = min(width, int((x + w + margin) / scale))
+    return gray[top:bottom, left:right]
+
+
+def _ink(small: np.ndarray) -> np.ndarray:
+    """Binary mask of dark (printed) pixels."""
+    _, ink = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    # Background left in the corners around a tilted receipt touches the
+    # edges; printed text doesn't
+    _, labels = cv2.connectedComponents(ink)
+    edge = np.unique(np.concatenate([labels[0], labels[-1], labels[:, 0], labels[:, -1]]))
+    ink[np.isin(labels, edge[edge > 0])] = 0
+    return ink
+
+
+def estimate_text_height(gray: np.ndarray):
+    """Median character height in pixels, or None if too little text is found."""
+    small, scale = _analysis_copy(gray)
+    count, _, stats, _ = cv2.connectedComponentsWithStats(_ink(small))
+    heights = stats[1:count, cv2.CC_STAT_HEIGHT]
+    widths = stats[1:count, cv2.CC_STAT_WIDTH]
+    # Character-sized blobs: not specks, rules, logos or the background
+    glyphs = heights[(heights >= 3) & (heights <= small.shape[0] / 10) &
+                     (widths <= small.shape[1] / 4)]
+    if len(glyphs) < 20:
+        return None
+    return float(np.median(glyphs)) / scale
+
+
+def downscale(gray: np.ndarray, text_height: int) -> np.ndarray:
+    """Shrink so text is about text_height px tall (never enlarges).
+
+    Without measurable text, only caps the longest side at CANVAS_SIZE.
+    """
+    measured = estimate_text_height(gray)
+    if measured:
+        scale = text_height / measured
+    else:
+        scale = CANVAS_SIZE / max(gray.shape)
+    scale = min(scale, CANVAS_SIZE / max(gray.shape), 1.0)
+    if scale >= 0.95:
+        return gray
+    return cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+
+def estimate_skew(gray: np.ndarray) -> float:
+    """Angle of the text lines in degrees (positive = rotated clockwise)."""
+    small, _ = _analysis_copy(gray)
+    # Smear characters sideways into one blob per text line
+    lines = cv2.dilate(_ink(small), np.ones((3, 25), np.uint8))
+    contours, _ = cv2.findContours(lines, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    angles = []
+    for contour in contours:
+        _, (w, h), angle = cv2.minAreaRect(contour)
+        if w < h:
+            w, h, angle = h, w, angle - 90
+        # Long, thin blobs only: text lines rather than logos or barcodes
+        if w < 50 or w < 5 * h:
+            continue
+        # minAreaRect's angle range differs across OpenCV versions
+        angles.append((angle + 45) % 90 - 45)
+    if len(angles) < 3:
+        return 0.0
+    return float(np.median(angles))
+
+
+def deskew(gray: np.ndarray) -> np.ndarray:
+    angle = estimate_skew(gray)
+    if abs(angle) < 0.5 or abs(angle) > MAX_SKEW_DEGREES:
+        return gray
+    height, width = gray.shape
+    rotation = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    return cv2.warpAffine(gray, rotation, (width, height),
+                          flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+
+def prepare_image(image_bytes: bytes, text_height: int) -> np.ndarray:
+    """Decode, crop, downscale and deskew a receipt photo for EasyOCR.
+
+    Args:
+        image_bytes: Raw image file bytes (JPEG, PNG, etc.)
+        text_height: Target character height in pixels
+
+    Returns:
+        Grayscale uint8 array, accepted as-is by reader.readtext()
+
+    Raises:
+        ValueError: If the image can't be decoded
+    """
+    gray = decode(image_bytes)
+    gray = crop_to_receipt(gray)
+    gray = downscale(gray, text_height)
+    return deskew(gray)
@@ -0,0 +1,232 @@
+"""Background receipt analysis: OCR → Claude AI → company matching.
+
+POST /api/receipt/analyze/ only stores a ReceiptJob (base64 JSON, or a
+multipart upload streamed to RECEIPT_UPLOAD_DIR) and returns its id.
+`manage.py process_receipt_jobs` claims queued jobs and runs run_job() in
+worker threads, so a slow OCR or Claude call never holds a web worker;
+OCR itself goes to the warm process pool in core.receipt_ocr. Each job
+records the stage it's in; clients poll /api/receipt/jobs/<id>/
+(optionally long-polling with ?wait=).
+
+A receipt whose OCR text and parse are both cached (core.receipt_cache)
+needs only the database matching, so the view finishes it inline via
+analyze_if_cached().
+"""
+import base64
+import binascii
+import io
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.utils import timezone
+
+from .models import Company, ReceiptJob
+from .receipt_ocr import OCRPoolBusy, cached_text, extract_text_from_file
+from .receipt_parser import cached_parse, match_items_to_database, parse_receipt_with_claude
+from .serializers_mobile import MobileCompanySerializer
+
+logger = logging.getLogger(__name__)
+
+
+class ReceiptError(Exception):
+    """The receipt itself couldn't be processed; the message is user-facing."""
+
+
+def decode_receipt(image_base64):
+    """A base64 upload as a binary file object."""
+    try:
+        return io.BytesIO(base64.b64decode(image_base64))
+    except binascii.Error as e:
+        raise ReceiptError(f'Could not read receipt: invalid base64 ({e})')
+
+
+def analyze_receipt(receipt, on_stage=lambda stage: None):
+    """Run the whole pipeline and return the API result.
+
+    receipt is the file's path or a binary file object (JPEG, PNG or PDF).
+    on_stage(status) is called as each ReceiptJob stage starts.
+
+    Returns:
+    - receipt_metadata: store, date, total
+    - items: list of products with matched companies and grades
+    - summary: overall statistics
+    """
+    # Step 1: Extract text from image using EasyOCR
+    on_stage('ocr')
+    try:
+        extracted_text = extract_text_from_file(receipt)
+    except ValueError as e:
+        raise ReceiptError(f'Could not read receipt: {str(e)}')
+
+    # Step 2: Parse receipt with Claude AI
+    on_stage('parsing')
+    try:
+        parsed_data = parse_receipt_with_claude(extracted_text)
+    except ValueError as e:
+        raise ReceiptError(f'Could not parse receipt: {str(e)}')
+
+    # Step 3: Match all items to companies in database at once
+    on_stage('matching')
+    items = parsed_data.get('items', [])
+    matches = match_items_to_database(items)
+
+    # Fetch and serialize each matched company once
+    company_ids = {company.pk for company, confidence, _ in matches
+                   if company and confidence >= 0.8}
+    companies = Company.objects.prefetch_related(
+        'value_snapshots', 'value_snapshots__value', 'badges'
+    ).in_bulk(company_ids)
+    company_data = {pk: MobileCompanySerializer(company).data for pk, company in companies.items()}
+
+    matched_items = []
+    total_items = len(items)
+    matched_count = 0
+    total_spending = 0.0
+    matched_spending = 0.0
+
+    for item, (company, confidence, method) in zip(items, matches):
+        parent_company = item.get('parent_company', '')
+        brand = item.get('brand', '')
+        price = item.get('price')
+
+        # Only include if confidence >= 80%
+        if company and confidence >= 0.8:
+            matched_items.append({
+                'product_name': item.get('product_name', ''),
+                'brand': brand,
+                'price': price,
+                'company': company_data[company.pk],
+                'match_confidence': confidence,
+                'match_method': method,
+            })
+
+            matched_count += 1
+            if price:
+                matched_spending += price
+        else:
+            # Item not matched or low confidence
+            matched_items.append({
+                'product_name': item.get('product_name', ''),
+                'brand': brand,
+                'price': price,
+                'company': None,
+                'match_confidence': confidence,
+                'match_method': method,
+                'unmatched_reason': f'Could not match "{parent_company}" or "{brand}" to database',
+            })
+
+        if price:
+            total_spending += price
+
+    return {
+        'receipt_metadata': {
+            'store_name': parsed_data.get('store_name', ''),
+            'date': parsed_data.get('date'),
+            'total': parsed_data.get('total'),
+        },
+        'items': matched_items,
+        'summary': {
+            'total_items': total_items,
+            'matched_items': matched_count,
+            'total_spending': total_spending,
+            'matched_spending': matched_spending,
+        }
+    }
+
+
+def analyze_if_cached(receipt):
+    """analyze_receipt() result if OCR and parsing are both cached, else None."""
+    text = cached_text(receipt)
+    if text is None or cached_parse(text) is None:
+        return None
+    return analyze_receipt(receipt)
+
+
+def job_data(job):
+    """Status payload for GET /api/receipt/jobs/<id>/."""
+    data = {
+        'job_id': str(job.id),
+        'status': job.status,
+        'created_at': job.created_at,
+        'finished_at': job.finished_at,
+    }
+    if job.status == 'done':
+        data['result'] = job.result
+    elif job.status == 'failed':
+        data['error'] = job.error
+    return data
+
+
+# --- worker side ---
+
+def claim_jobs(limit):
+    """Mark up to `limit` queued jobs as started and return their ids.
+
+    The conditional UPDATE makes claiming safe with several workers.
+    """
+    claimed = []
+    for job_id in ReceiptJob.objects.filter(status='queued').order_by(
+            'created_at').values_list('pk', flat=True)[:limit * 2]:
+        if ReceiptJob.objects.filter(pk=job_id, status='queued').update(
+                status='ocr', started_at=timezone.now()):
+            claimed.append(job_id)
+            if len(claimed) == limit:
+                break
+    return claimed
+
+
+def run_job(job_id):
+    """Run one claimed job to completion (in a worker thread)."""
+    close_old_connections()
+    try:
+        return _run_job(job_id)
+    finally:
+        connection.close()
+
+
+def _run_job(job_id):
+    job = ReceiptJob.objects.get(pk=job_id)
+
+    def on_stage(stage):
+        ReceiptJob.objects.filter(pk=job_id).update(status=stage)
+
+    try:
+        receipt = job.upload.path if job.upload else decode_receipt(job.image_base64)
+        job.result = analyze_receipt(receipt, on_stage)
+        job.status = 'done'
+    except OCRPoolBusy:
+        # Backpressure: put it back for the next free slot
+        ReceiptJob.objects.filter(pk=job_id).update(status='queued', started_at=None)
+        return 'queued'
+    except ReceiptError as e:
+        job.status, job.error = 'failed', str(e)
+    except Exception:
+        logger.exception("Receipt job %s crashed", job_id)
+        job.status, job.error = 'failed', 'Internal error while analyzing receipt'
+    job.image_base64 = ''
+    if job.upload:
+        job.upload.delete(save=False)
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'result', 'error', 'image_base64', 'upload', 'finished_at'])
+    return job.status
+
+
+def fail_stale_jobs():
+    """Fail jobs whose worker died mid-run (started too long ago)."""
+    cutoff = timezone.now() - timedelta(seconds=settings.RECEIPT_JOB_TIMEOUT)
+    return ReceiptJob.objects.filter(
+        status__in=['ocr', 'parsing', 'matching'], started_at__lt=cutoff,
+    ).update(status='failed', error='Receipt analysis timed out',
+             image_base64='', finished_at=timezone.now())
+
+
+def purge_old_jobs():
+    cutoff = timezone.now() - timedelta(seconds=settings.RECEIPT_JOB_RETENTION)
+    old_jobs = ReceiptJob.objects.filter(created_at__lt=cutoff)
+    # Uploads left behind by stale jobs
+    for job in old_jobs.exclude(upload=''):
+        job.upload.delete(save=False)
+    deleted, _ = old_jobs.delete()
+    return deleted
@@ -1,11 +1,32 @@
 """Receipt OCR module.
 
-Supports both images (EasyOCR) and PDFs (pypdf) for receipt text extraction.
-Text parsing will be handled by Claude AI in a separate step.
+Supports both images (EasyOCR) and PDFs (pypdf, see core.receipt_pdf) for
+receipt text extraction. Text parsing will be handled by Claude AI in a
+separate step.
+
+With settings.OCR_POOL_WORKERS > 0, image OCR runs in an OCRPool: worker
+processes that each load an EasyOCR reader once at start-up, behind a
+bounded queue. Otherwise it runs in the calling process.
+
+Photos are cropped, deskewed and downscaled to settings.OCR_TEXT_HEIGHT
+(core.receipt_image) before EasyOCR sees them. Extracted text is cached
+by file digest (core.receipt_cache), so a re-upload skips OCR entirely.
 """
 
 import base64
 import io
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
 
 # Global EasyOCR reader (initialized once)
 _easyocr_reader = None
@@ -27,50 +48,202 @@ def _get_easyocr_reader():
     return _easyocr_reader
 
 
-def _is_pdf(file_bytes: bytes) -> bool:
-    """Check if file is a PDF by looking at magic bytes."""
-    return file_bytes.startswith(b'%PDF')
+class OCRPoolBusy(RuntimeError):
+    """The OCR queue stayed full for the whole queue timeout."""
 
 
-def _extract_text_from_pdf(pdf_bytes: bytes) -> str:
-    """Extract text from PDF using pypdf.
+class _OCRTimeout(Exception):
+    pass
 
-    Args:
-        pdf_bytes: Raw PDF file bytes
 
-    Returns:
-        Full text extracted from all pages
+def _raise_timeout(signum, frame):
+    raise _OCRTimeout()
 
-    Raises:
-        ValueError: If PDF is invalid or text extraction fails
+
+def _warm_worker():
+    """Pool initializer: load the reader before the first image arrives."""
+    signal.signal(signal.SIGALRM, _raise_timeout)
+    _get_easyocr_reader()
+
+
+def _worker_pid():
+    # Linger so one warm worker can't drain every warm-up task alone
+    time.sleep(0.1)
+    return os.getpid()
+
+
+def _readtext(image_bytes: bytes, text_height: int):
+    """OCR text lines for an image; text_height=0 skips preprocessing."""
+    if text_height:
+        from .receipt_image import prepare_image
+
+        image = prepare_image(image_bytes, text_height)
+    else:
+        image = image_bytes
+    # detail=0 returns just text, detail=1 returns [bbox, text, confidence]
+    return _get_easyocr_reader().readtext(image, detail=0)
+
+
+def _pool_readtext(image_bytes: bytes, text_height: int, timeout: float):
+    """Run OCR in a pool worker; returns (lines, seconds).
+
+    The alarm interrupts a runaway image inside the worker, so one bad
+    upload can't hold a process forever.
     """
+    started = time.perf_counter()
+    signal.setitimer(signal.ITIMER_REAL, timeout)
     try:
-        from pypdf import PdfReader
-    except ImportError:
-        raise ImportError(
-            "pypdf not installed. "
-            "Run: pip install pypdf"
-        )
+        lines = _readtext(image_bytes, text_height)
+    except _OCRTimeout:
+        raise TimeoutError(f"OCR took longer than {timeout:g}s")
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+    return lines, time.perf_counter() - started
 
-    try:
-        # Create PDF reader from bytes
-        pdf_file = io.BytesIO(pdf_bytes)
-        reader = PdfReader(pdf_file)
 
-        # Extract text from all pages
-        full_text = []
-        for page in reader.pages:
-            text = page.extract_text()
-            if text:
-                full_text.append(text)
+class OCRPool:
+    """Worker processes holding warm EasyOCR readers behind a bounded queue.
+
+    At most max_pending images are queued or running; further callers
+    wait up to queue_timeout for a slot and then get OCRPoolBusy. Each
+    image gets `timeout` seconds of OCR.
 
-        if not full_text:
-            raise ValueError("No text found in PDF")
+    A worker that dies (killed for memory, segfault in torch) breaks the
+    whole executor, so it is replaced and warmed again, and the image
+    retried once.
+    """
 
-        return '\n'.join(full_text)
+    def __init__(self, workers: int, max_pending: int, timeout: float, queue_timeout: float):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self._executor = self._new_executor()
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._completed = 0
+        self._failed = 0
+        self._timeouts = 0
+        self._restarts = 0
+        self._latencies = deque(maxlen=200)
+
+    def _new_executor(self):
+        # spawn: torch doesn't survive fork, and workers need no Django state
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_warm_worker,
+        )
 
-    except Exception as e:
-        raise ValueError(f"Failed to extract text from PDF: {str(e)}")
+    def _rebuild(self, broken):
+        """Replace a broken executor, unless another caller already has."""
+        with self._lock:
+            if self._executor is not broken:
+                return
+            logger.warning("OCR worker died; restarting the OCR pool")
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._executor = self._new_executor()
+            self._restarts += 1
+            self.warm()
+
+    def _submit(self, image_bytes: bytes, text_height: int):
+        """(lines, seconds) from a worker, retried once on a new pool if one died."""
+        for attempt in range(2):
+            executor = self._executor
+            try:
+                future = executor.submit(_pool_readtext, image_bytes, text_height, self.timeout)
+                # The worker enforces the timeout itself; this covers a worker
+                # stuck outside Python (or still warming up)
+                return future.result(timeout=self.timeout + self.queue_timeout)
+            except BrokenProcessPool:
+                if attempt:
+                    raise
+                self._rebuild(executor)
+
+    def warm(self, timeout: float = 600):
+        """Start every worker and wait until each has loaded its reader.
+
+        Returns the worker pids seen.
+        """
+        deadline = time.monotonic() + timeout
+        pids = set()
+        while len(pids) < self.workers and time.monotonic() < deadline:
+            futures = [self._executor.submit(_worker_pid) for _ in range(self.workers)]
+            pids.update(future.result() for future in futures)
+        return pids
+
+    def readtext(self, image_bytes: bytes, text_height: int):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise OCRPoolBusy(f"OCR queue full ({self.max_pending} images pending)")
+        with self._lock:
+            self._pending += 1
+            depth = self._pending
+        try:
+            lines, seconds = self._submit(image_bytes, text_height)
+        except (TimeoutError, FutureTimeout):
+            with self._lock:
+                self._timeouts += 1
+            raise ValueError(f"OCR timed out after {self.timeout:g}s")
+        except Exception:
+            with self._lock:
+                self._failed += 1
+            raise
+        finally:
+            with self._lock:
+                self._pending -= 1
+            self._slots.release()
+
+        with self._lock:
+            self._completed += 1
+            self._latencies.append(seconds)
+        logger.info("OCR %.0f ms, queue depth %d", seconds * 1000, depth)
+        return lines
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            return {
+                'workers': self.workers,
+                'queue_depth': self._pending,
+                'max_pending': self.max_pending,
+                'completed': self._completed,
+                'failed': self._failed,
+                'timeouts': self._timeouts,
+                'restarts': self._restarts,
+                'latency_ms_avg': round(1000 * sum(latencies) / len(latencies)) if latencies else None,
+                'latency_ms_p95': round(1000 * latencies[int(0.95 * (len(latencies) - 1))]) if latencies else None,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_ocr_pool():
+    """The process-wide OCRPool, or None when OCR_POOL_WORKERS is 0."""
+    global _pool
+    from django.conf import settings
+
+    if settings.OCR_POOL_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = OCRPool(
+                workers=settings.OCR_POOL_WORKERS,
+                max_pending=settings.OCR_POOL_MAX_PENDING,
+                timeout=settings.OCR_TIMEOUT,
+                queue_timeout=settings.OCR_QUEUE_TIMEOUT,
+            )
+    return _pool
+
+
+def _is_pdf(file_bytes: bytes) -> bool:
+    """Check if file is a PDF by looking at magic bytes."""
+    return file_bytes.startswith(b'%PDF')
 
 
 def _extract_text_from_image_ocr(image_bytes: bytes) -> str:
@@ -85,13 +258,14 @@ def _extract_text_from_image_ocr(image_bytes: bytes) -> str:
     Raises:
         ValueError: If OCR fails
     """
-    try:
-        # Get EasyOCR reader
-        reader = _get_easyocr_reader()
+    from django.conf import settings
 
-        # Perform text detection
-        # detail=0 returns just text, detail=1 returns [bbox, text, confidence]
-        result = reader.readtext(image_bytes, detail=0)
+    try:
+        pool = get_ocr_pool()
+        if pool is not None:
+            result = pool.readtext(image_bytes, settings.OCR_TEXT_HEIGHT)
+        else:
+            result = _readtext(image_bytes, settings.OCR_TEXT_HEIGHT)
 
         if not result:
             raise ValueError("No text detected in image")
@@ -99,37 +273,103 @@ def _extract_text_from_image_ocr(image_bytes: bytes) -> str:
         # Join all text lines with newlines
         return '\n'.join(result)
 
+    except OCRPoolBusy:
+        raise
     except Exception as e:
         raise ValueError(f"Failed to process image with OCR: {str(e)}")
 
 
-def extract_text_from_image(image_base64: str) -> str:
-    """Extract text from receipt (supports both images and PDFs).
+@contextmanager
+def _opened(receipt):
+    """Binary file object for a path, or the given file object rewound."""
+    if isinstance(receipt, (str, os.PathLike)):
+        with open(receipt, 'rb') as file:
+            yield file
+    else:
+        receipt.seek(0)
+        yield receipt
+
+
+def _text_cache_key(file) -> str:
+    from django.conf import settings
+    from .receipt_cache import file_digest, text_key
+
+    header = file.read(4)
+    if _is_pdf(header):
+        return text_key(file_digest(file), 'pdf')
+    # Preprocessing changes what OCR reads
+    return text_key(file_digest(file), f'ocr{settings.OCR_TEXT_HEIGHT}')
+
+
+def cached_text(receipt):
+    """Previously extracted text for this file (path or file object), or None."""
+    from . import receipt_cache
+
+    with _opened(receipt) as file:
+        return receipt_cache.get(_text_cache_key(file))
+
+
+def extract_text_from_file(receipt) -> str:
+    """Extract text from a receipt file (supports both images and PDFs).
 
     Automatically detects file type and uses appropriate extraction method:
-    - PDF files: pypdf text extraction
+    - PDF files: pypdf text extraction, page by page (core.receipt_pdf)
     - Image files: EasyOCR
 
+    Results are cached by file digest; a repeat upload returns at once.
+
     Args:
-        image_base64: Base64-encoded file (JPEG, PNG, or PDF)
+        receipt: Path of the file, or a binary file object (JPEG, PNG, or PDF)
 
     Returns:
         Full text extracted from the file
 
     Raises:
         ValueError: If file is invalid or extraction fails
+        OCRPoolBusy: If the OCR pool's queue stayed full; retry later
     """
+    from .receipt_cache import get_or_compute
+    from .receipt_pdf import extract_text_from_pdf
+
     try:
-        # Decode base64
-        file_bytes = base64.b64decode(image_base64)
+        with _opened(receipt) as file:
+            def extract():
+                file.seek(0)
+                # Check if PDF or image
+                if _is_pdf(file.read(4)):
+                    # Extract text from PDF, reading pages straight from the file
+                    path = receipt if isinstance(receipt, (str, os.PathLike)) else None
+                    return extract_text_from_pdf(file, path)
+                else:
+                    # Extract text from image using OCR
+                    file.seek(0)
+                    return _extract_text_from_image_ocr(file.read())
+
+            return get_or_compute(_text_cache_key(file), extract)
+
+    except OCRPoolBusy:
+        raise
+    except Exception as e:
+        raise ValueError(f"Failed to process file: {str(e)}")
 
-        # Check if PDF or image
-        if _is_pdf(file_bytes):
-            # Extract text from PDF
-            return _extract_text_from_pdf(file_bytes)
-        else:
-            # Extract text from image using OCR
-            return _extract_text_from_image_ocr(file_bytes)
 
-    except Exception as e:
+def extract_text_from_image(image_base64: str) -> str:
+    """Extract text from a base64-encoded receipt (image or PDF).
+
+    See extract_text_from_file().
+
+    Args:
+        image_base64: Base64-encoded file (JPEG, PNG, or PDF)
+
+    Returns:
+        Full text extracted from the file
+
+    Raises:
+        ValueError: If file is invalid or extraction fails
+        OCRPoolBusy: If the OCR pool's queue stayed full; retry later
+    """
+    try:
+        file_bytes = base64.b64decode(image_base64)
+    except ValueError as e:
         raise ValueError(f"Failed to process file: {str(e)}")
+    return extract_text_from_file(io.BytesIO(file_bytes))
@@ -5,14 +5,80 @@ from receipt text, then matches to existing database.
 """
 
 import json
+import re
+import string
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from functools import reduce
+from operator import or_
 from typing import List, Dict, Optional
 from decouple import config
 import anthropic
+from django.conf import settings
+from django.db.models import Q
+from django.db.models.functions import Upper
+
+from . import receipt_cache
+from .receipt_pdf import LINE_ITEMS_END
+
+_Item = namedtuple('_Item', 'parent_company brand product_name price')
+
+CLAUDE_MODEL = "claude-3-haiku-20240307"  # Claude 3 Haiku (available with current API key)
+
+# Bump when the prompt changes so cached parses from the old one are ignored
+PROMPT_VERSION = 3
+
+# Output tokens per request; chunking keeps each response well under it
+MAX_TOKENS = 4096
+
+# Opening lines: sent as context ahead of the item lines, searched for the store name
+HEADER_LINES = 5
+
+# Price at the end of an item line: "3.99", "$3.99 F", "-1.00 N"
+_LINE_PRICE = re.compile(r'\s+(-?)[$€£]?(\d+[.,]\d{2})(?:\s+[A-Z]{1,2})?$')
+
+# Priced lines that are not items: "SUBTOTAL 12.40", "TAX 0.99", "VISA 13.39"
+_SUMMARY_LINE = re.compile(
+    r'(?:sub\s*-?total|total|(?:sales\s+)?tax\s*\d?|change(?:\s+due)?|tender(?:ed)?'
+    r'|cash|credit|debit|visa|mastercard|amex|(?:balance|amount|total)\s+due)\s*:?',
+    re.IGNORECASE,
+)
+
+# 2026-01-31, 01/31/2026, 1-31-26 (US order)
+_ISO_DATE = re.compile(r'\b(\d{4})-(\d{1,2})-(\d{1,2})\b')
+_US_DATE = re.compile(r'\b(\d{1,2})[/-](\d{1,2})[/-](\d{4}|\d{2})\b')
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def _variant() -> str:
+    return f'{CLAUDE_MODEL}:p{PROMPT_VERSION}'
+
+
+def _parse_cache_key(receipt_text: str) -> str:
+    return receipt_cache.parse_key(receipt_text, _variant())
+
+
+def cached_parse(receipt_text: str):
+    """Previously parsed result for this receipt text, or None."""
+    return receipt_cache.get(_parse_cache_key(receipt_text))
 
 
 def parse_receipt_with_claude(receipt_text: str) -> Dict:
     """Use Claude AI to extract products and companies from receipt text.
 
+    Results are cached by the digest of the normalized text, so the same
+    receipt is only sent to Claude once. Store name, date and total are
+    read from the text locally. Item lines starting with a brand in the
+    database ("CHEERIOS 18OZ 3.99") are resolved locally too
+    (core.brand_matcher), and lines Claude has read before are answered
+    from a per-line cache. Only the remaining item lines go to Claude, in
+    chunks parsed concurrently and merged in line order; when none remain,
+    Claude isn't called at all.
+
     Args:
         receipt_text: Raw text extracted from receipt (OCR output)
 
@@ -35,32 +101,210 @@ def parse_receipt_with_claude(receipt_text: str) -> Dict:
     Raises:
         ValueError: If Claude API call fails or returns invalid data
     """
-    # Get API key from environment
-    api_key = config('ANTHROPIC_API_KEY', default=None)
-    if not api_key:
-        raise ValueError(
-            "ANTHROPIC_API_KEY not found in environment. "
-            "Add it to your .env file or set as environment variable."
-        )
+    return receipt_cache.get_or_compute(
+        _parse_cache_key(receipt_text), lambda: _parse_lines(receipt_text))
 
-    # Initialize Claude client
-    client = anthropic.Anthropic(api_key=api_key)
+
+def _item_line_text(line: str) -> Optional[str]:
+    """Per-line cache key text: the line without its price, uppercased.
+
+    None for lines without a trailing price or a word, which are not
+    (self-contained) item lines.
+    """
+    match = _LINE_PRICE.search(line)
+    if not match:
+        return None
+    text = line[:match.start()].strip().upper()
+    if sum(char.isalpha() for char in text) < 3 or _SUMMARY_LINE.fullmatch(text):
+        return None
+    return text
+
+
+def _line_price(line: str) -> Optional[float]:
+    match = _LINE_PRICE.search(line)
+    if not match:
+        return None
+    sign, amount = match.groups()
+    return float(sign + amount.replace(',', '.'))
+
+
+def _store_name(lines) -> Optional[str]:
+    """The first opening line with a word that isn't an item line."""
+    for line in lines[:HEADER_LINES]:
+        name = line.strip()
+        if sum(char.isalpha() for char in name) >= 3 and not _LINE_PRICE.search(name):
+            return string.capwords(name.lower()) if name.isupper() else name
+    return None
+
+
+def _receipt_date(lines) -> Optional[str]:
+    """The first valid date on the receipt, as YYYY-MM-DD."""
+    for line in lines:
+        for match in _ISO_DATE.finditer(line):
+            year, month, day = map(int, match.groups())
+            try:
+                return date(year, month, day).isoformat()
+            except ValueError:
+                pass
+        for match in _US_DATE.finditer(line):
+            month, day, year = map(int, match.groups())
+            try:
+                return date(year if year > 99 else 2000 + year, month, day).isoformat()
+            except ValueError:
+                pass
+    return None
+
+
+def _receipt_total(lines) -> Optional[float]:
+    """The amount on the first total line (the one that ends the items)."""
+    for line in lines:
+        if LINE_ITEMS_END.search(line):
+            return _line_price(line)
+    return None
+
+
+def _parse_lines(receipt_text: str) -> Dict:
+    from .brand_matcher import brand_index
+
+    variant = _variant()
+    lines = receipt_cache.normalize_text(receipt_text).splitlines()
+    items = []  # (line number, item)
+    line_keys = {}
+    for number, line in enumerate(lines, 1):
+        text = _item_line_text(line)
+        if not text or LINE_ITEMS_END.search(line):
+            continue
+        # Lines starting with a brand we know need no Claude at all
+        brand = brand_index.receipt_brand(text)
+        if brand:
+            brand_name, company = brand
+            items.append((number, {
+                'product_name': text,
+                'brand': brand_name,
+                'parent_company': company.name,
+                'price': _line_price(line),
+            }))
+        else:
+            line_keys[number] = receipt_cache.line_key(text, variant)
+    known = receipt_cache.get_many(set(line_keys.values()))
+
+    to_send = []
+    for number, key in line_keys.items():
+        line = lines[number - 1]
+        item = known.get(key)
+        if item:
+            items.append((number, dict(item, price=_line_price(line))))
+        else:
+            to_send.append((number, line))
+
+    parsed = {
+        'store_name': _store_name(lines),
+        'date': _receipt_date(lines),
+        'total': _receipt_total(lines),
+    }
+    learned = {}
+    for chunk, part in _parse_chunks(to_send, lines[:HEADER_LINES]):
+        sent = dict(chunk)
+        per_line = {}
+        for item in part['items']:
+            if not isinstance(item, dict):
+                continue
+            number = item.pop('line', None)
+            if number not in sent:
+                number = None
+            items.append((number, item))
+            per_line.setdefault(number, []).append(item)
+        # Remember the item on each priced line, unless the line held several
+        for number, found in per_line.items():
+            if number in line_keys and len(found) == 1:
+                learned[line_keys[number]] = {
+                    field: found[0].get(field)
+                    for field in ('product_name', 'brand', 'parent_company')
+                }
+    if learned:
+        receipt_cache.set_many(learned)
+
+    # Receipt order; items Claude gave no line for go last
+    items.sort(key=lambda entry: entry[0] if entry[0] is not None else len(lines) + 1)
+    parsed['items'] = [item for _, item in items]
+    return parsed
+
+
+def _parse_chunks(lines, header):
+    """Yield (chunk, Claude's parse of it) for (number, line) pairs.
+
+    Up to settings.CLAUDE_PARSE_CHUNK_LINES lines go in one request; more
+    are split evenly and parsed settings.CLAUDE_PARSE_CONCURRENCY requests
+    at a time. Each request gets the header lines as context (the store
+    decides store brands), unless its lines start the receipt.
+    """
+    if not lines:
+        return
+    count = -(-len(lines) // max(1, settings.CLAUDE_PARSE_CHUNK_LINES))
+    size = -(-len(lines) // count)
+    chunks = [lines[start:start + size] for start in range(0, len(lines), size)]
+
+    def parse(chunk):
+        return _call_claude(chunk, header if chunk[0][0] > 1 else None)
+
+    if len(chunks) == 1:
+        yield chunks[0], parse(chunks[0])
+        return
+
+    workers = max(1, min(settings.CLAUDE_PARSE_CONCURRENCY, len(chunks)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        yield from zip(chunks, pool.map(parse, chunks))
+
+
+def _get_client():
+    """The shared Anthropic client; its connection pool is reused across calls."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            # Get API key from environment
+            api_key = config('ANTHROPIC_API_KEY', default=None)
+            if not api_key:
+                raise ValueError(
+                    "ANTHROPIC_API_KEY not found in environment. "
+                    "Add it to your .env file or set as environment variable."
+                )
+            _client = anthropic.Anthropic(
+                api_key=api_key,
+                base_url=settings.ANTHROPIC_BASE_URL,
+                timeout=settings.CLAUDE_TIMEOUT,
+            )
+    return _client
+
+
+def _numbered(lines) -> str:
+    return '\n'.join(f"{number}: {line}" for number, line in lines)
+
+
+def _call_claude(lines, header=None) -> Dict:
+    """Claude's items on (number, line) pairs; header = opening lines for context."""
+    client = _get_client()
+
+    context = ''
+    if header:
+        context = (
+            "These are item lines from a receipt that starts with:\n"
+            f"{_numbered(enumerate(header, 1))}\n\n"
+            "Extract only the items on the lines below.\n\n"
+        )
 
     # Construct prompt for Claude
     prompt = f"""You are analyzing a receipt to extract product information and identify parent companies.
 
-Receipt text:
-{receipt_text}
+{context}Receipt text (each line starts with its line number):
+{_numbered(lines)}
 
 Your task:
-1. Identify the store name
-2. Extract the date (if visible)
-3. Extract the total amount (if visible)
-4. For each product line item:
+For each product line item:
    - Extract the product name
    - Identify the brand
    - Deduce the parent company (the corporation that owns the brand)
    - Extract the price (if visible)
+   - Give the number of the line the product is on
 
 Important:
 - For brands like "Tide", "Pampers", "Bounty" → parent company is "Procter & Gamble"
@@ -71,15 +315,13 @@ Important:
 
 Return ONLY a JSON object (no markdown, no explanation) in this exact format:
 {{
-    "store_name": "Store Name",
-    "date": "YYYY-MM-DD" or null,
-    "total": 123.45 or null,
     "items": [
         {{
             "product_name": "Product Name",
             "brand": "Brand Name",
             "parent_company": "Parent Company Name",
-            "price": 12.99 or null
+            "price": 12.99 or null,
+            "line": 12
         }}
     ]
 }}"""
@@ -87,13 +329,16 @@ Return ONLY a JSON object (no markdown, no explanation) in this exact format:
     try:
         # Call Claude API
         message = client.messages.create(
-            model="claude-3-haiku-20240307",  # Claude 3 Haiku (available with current API key)
-            max_tokens=2000,
+            model=CLAUDE_MODEL,
+            max_tokens=MAX_TOKENS,
             messages=[
                 {"role": "user", "content": prompt}
             ]
         )
 
+        if message.stop_reason == 'max_tokens':
+            raise ValueError("Claude response was truncated")
+
         # Extract response text
         response_text = message.content[0].text.strip()
 
@@ -129,14 +374,8 @@ Return ONLY a JSON object (no markdown, no explanation) in this exact format:
 def match_company_to_database(parent_company_name: str, brand_name: str, product_name: str = '', price: float = None):
     """Match extracted company/brand to existing database.
 
-    Tries multiple strategies (in order):
-    1. Exact product name match (Product model)
-    2. Brand name match (Product model)
-    3. Direct company name match
-    4. BrandMapping lookup
-    5. Fuzzy company/brand match
-
-    If no match found or confidence < 80%, saves to UnmatchedProduct for review.
+    Single-item form of match_items_to_database(); see there for the
+    strategies. A whole receipt should go through that instead.
 
     Args:
         parent_company_name: Company name from Claude
@@ -147,93 +386,197 @@ def match_company_to_database(parent_company_name: str, brand_name: str, product
     Returns:
         tuple: (Company object or None, confidence: float, method: str)
     """
-    from .models import Company, BrandMapping, Product, UnmatchedProduct
-    from django.db.models import F
+    return match_items_to_database([{
+        'parent_company': parent_company_name,
+        'brand': brand_name,
+        'product_name': product_name,
+        'price': price,
+    }])[0]
 
-    parent_company_name = parent_company_name.strip()
-    brand_name = brand_name.strip()
-    product_name = product_name.strip()
 
-    parent_company_name_lower = parent_company_name.lower()
-    brand_name_lower = brand_name.lower()
+def match_items_to_database(items: List[Dict]) -> List[tuple]:
+    """Match every parsed receipt item to the database in a few queries.
+
+    Tries multiple strategies (in order), each one query for all items
+    still unmatched:
+    1. Exact product name match (Product model)
+    2. Brand name match (Product model)
+    3. Direct company name match
+    4. BrandMapping lookup
+    5. Fuzzy company/brand match
+
+    Items matched fuzzily or not at all are saved to UnmatchedProduct for
+    review, in bulk.
+
+    Args:
+        items: Claude's parsed items (product_name, brand, parent_company, price)
+
+    Returns:
+        list: (Company object or None, confidence: float, method: str) per item, in order
+    """
+    from .models import Company, BrandMapping, Product
+
+    entries = [_Item(
+        (item.get('parent_company') or '').strip(),
+        (item.get('brand') or '').strip(),
+        (item.get('product_name') or '').strip(),
+        item.get('price'),
+    ) for item in items]
+    results = [None] * len(entries)
+
+    def pending(field, min_length=1):
+        """Distinct non-empty values of field among items not matched yet."""
+        return {getattr(entry, field) for i, entry in enumerate(entries)
+                if results[i] is None and len(getattr(entry, field)) >= min_length}
+
+    def resolve(strategy, found, key, match):
+        """Record match(found[key(item)]) -> (company, confidence) for unmatched items."""
+        for i, entry in enumerate(entries):
+            if results[i] is None and key(entry) in found:
+                company, confidence = match(found[key(entry)])
+                results[i] = (company, confidence, strategy)
 
     # Strategy 1: Exact product name match (BEST - 95% confidence)
-    if product_name:
-        product = Product.objects.filter(
-            name__iexact=product_name
-        ).select_related('company').first()
-        if product:
-            return product.company, 0.95, 'exact_product_name'
+    names = {name.upper() for name in pending('product_name')}
+    if names:
+        products = _first_per_key(
+            Product.objects.alias(name_upper=Upper('name')).filter(
+                name_upper__in=names).select_related('company'),
+            lambda product: product.name.upper())
+        resolve('exact_product_name', products, lambda entry: entry.product_name.upper(),
+                lambda product: (product.company, 0.95))
 
     # Strategy 2: Brand name match in Product model (90% confidence)
-    if brand_name:
-        product = Product.objects.filter(
-            brand_name__iexact=brand_name
-        ).select_related('company').first()
-        if product:
-            return product.company, 0.90, 'product_brand_match'
+    brands = {brand.upper() for brand in pending('brand')}
+    if brands:
+        products = _first_per_key(
+            Product.objects.alias(brand_upper=Upper('brand_name')).filter(
+                brand_upper__in=brands).select_related('company'),
+            lambda product: product.brand_name.upper())
+        resolve('product_brand_match', products, lambda entry: entry.brand.upper(),
+                lambda product: (product.company, 0.90))
 
     # Strategy 3: Direct company name match (85% confidence)
-    if parent_company_name:
-        company = Company.objects.filter(name__iexact=parent_company_name).first()
-        if company:
-            return company, 0.85, 'exact_company_name'
+    parents = {parent.upper() for parent in pending('parent_company')}
+    if parents:
+        companies = _first_per_key(
+            Company.objects.alias(name_upper=Upper('name')).filter(name_upper__in=parents),
+            lambda company: company.name.upper())
+        resolve('exact_company_name', companies, lambda entry: entry.parent_company.upper(),
+                lambda company: (company, 0.85))
 
     # Strategy 4: BrandMapping lookup (exact brand match)
-    if brand_name:
-        brand_mapping = BrandMapping.objects.filter(
-            brand_name_normalized=brand_name_lower
-        ).select_related('company').first()
-        if brand_mapping:
-            return brand_mapping.company, brand_mapping.confidence, 'brand_mapping_exact'
+    brands = {brand.lower() for brand in pending('brand')}
+    if brands:
+        mappings = _first_per_key(
+            BrandMapping.objects.filter(brand_name_normalized__in=brands).select_related('company'),
+            lambda mapping: mapping.brand_name_normalized)
+        resolve('brand_mapping_exact', mappings, lambda entry: entry.brand.lower(),
+                lambda mapping: (mapping.company, mapping.confidence))
 
     # Strategy 5: Fuzzy company name match (70% confidence)
-    if len(parent_company_name) >= 3:
-        company = Company.objects.filter(
-            name__icontains=parent_company_name
-        ).first()
-        if company:
-            # Save to unmatched (low confidence)
-            _save_unmatched_product(product_name, brand_name, parent_company_name, price)
-            return company, 0.70, 'fuzzy_company_name'
+    parents = pending('parent_company', min_length=3)
+    if parents:
+        candidates = Company.objects.filter(
+            reduce(or_, (Q(name__icontains=parent) for parent in parents)))
+        companies = _first_containing(candidates, parents, lambda company: company.name)
+        resolve('fuzzy_company_name', companies, lambda entry: entry.parent_company,
+                lambda company: (company, 0.70))
 
     # Strategy 6: Fuzzy brand match (lower confidence)
-    if len(brand_name) >= 3:
-        brand_mapping = BrandMapping.objects.filter(
-            brand_name_normalized__icontains=brand_name_lower
-        ).select_related('company').first()
-        if brand_mapping:
-            # Save to unmatched (low confidence)
-            _save_unmatched_product(product_name, brand_name, parent_company_name, price)
-            return brand_mapping.company, brand_mapping.confidence * 0.7, 'brand_mapping_fuzzy'
-
-    # No match found - save to unmatched for review
-    _save_unmatched_product(product_name, brand_name, parent_company_name, price)
-    return None, 0.0, 'not_found'
-
-
-def _save_unmatched_product(product_name: str, brand_name: str, parent_company_guess: str, price: float = None):
-    """Save unmatched product for admin review, or increment seen_count if exists."""
+    brands = pending('brand', min_length=3)
+    if brands:
+        candidates = BrandMapping.objects.filter(
+            reduce(or_, (Q(brand_name_normalized__icontains=brand.lower()) for brand in brands))
+        ).select_related('company')
+        mappings = _first_containing(candidates, brands, lambda mapping: mapping.brand_name_normalized)
+        resolve('brand_mapping_fuzzy', mappings, lambda entry: entry.brand,
+                lambda mapping: (mapping.company, mapping.confidence * 0.7))
+
+    # No match found - save to unmatched for review (low confidence too)
+    unmatched = []
+    for i, entry in enumerate(entries):
+        if results[i] is None:
+            results[i] = (None, 0.0, 'not_found')
+        if results[i][2] in ('fuzzy_company_name', 'brand_mapping_fuzzy', 'not_found'):
+            unmatched.append((entry.product_name, entry.brand, entry.parent_company, entry.price))
+    _save_unmatched_products(unmatched)
+    return results
+
+
+def _first_per_key(queryset, key):
+    """{key(obj): first obj in queryset order}, like .first() per key."""
+    found = {}
+    for obj in queryset:
+        found.setdefault(key(obj), obj)
+    return found
+
+
+def _first_containing(candidates, terms, text):
+    """{term: first candidate whose text(candidate) contains it, ignoring case}."""
+    candidates = list(candidates)
+    found = {}
+    for term in terms:
+        term_lower = term.lower()
+        match = next((c for c in candidates if term_lower in text(c).lower()), None)
+        if match is not None:
+            found[term] = match
+    return found
+
+
+def _save_unmatched_products(entries):
+    """Save unmatched products for admin review, or increment seen_count if they exist.
+
+    entries: (product_name, brand_name, parent_company_guess, price) tuples.
+    One query finds the known ones; new rows are bulk-created and known
+    ones bulk-updated.
+    """
     from .models import UnmatchedProduct
     from django.db.models import F
-
-    if not product_name or not brand_name:
-        return  # Skip if missing critical info
-
-    # Check if this product already exists
-    unmatched, created = UnmatchedProduct.objects.get_or_create(
-        product_name=product_name,
-        brand_name=brand_name,
-        defaults={
-            'parent_company_guess': parent_company_guess or '',
-            'typical_price': price,
-        }
-    )
-
-    if not created:
-        # Already exists - increment seen count and update price
-        unmatched.seen_count = F('seen_count') + 1
-        if price and (not unmatched.typical_price or abs(price - unmatched.typical_price) < 2):
-            # Update typical price if close to existing
-            unmatched.typical_price = price
-        unmatched.save(update_fields=['seen_count', 'typical_price', 'last_seen_at'])
+    from django.utils import timezone
+
+    sightings = {}
+    for product_name, brand_name, parent_company_guess, price in entries:
+        if not product_name or not brand_name:
+            continue  # Skip if missing critical info
+        sightings.setdefault((product_name, brand_name), []).append((parent_company_guess, price))
+    if not sightings:
+        return
+
+    existing = {
+        (unmatched.product_name, unmatched.brand_name): unmatched
+        for unmatched in UnmatchedProduct.objects.filter(reduce(or_, (
+            Q(product_name=product_name, brand_name=brand_name)
+            for product_name, brand_name in sightings)))
+    }
+    now = timezone.now()
+    to_create, to_update = [], []
+    for (product_name, brand_name), seen in sightings.items():
+        unmatched = existing.get((product_name, brand_name))
+        if unmatched is None:
+            parent_company_guess, price = seen[0]
+            unmatched = UnmatchedProduct(
+                product_name=product_name,
+                brand_name=brand_name,
+                parent_company_guess=parent_company_guess or '',
+                typical_price=price,
+                seen_count=len(seen),
+            )
+            seen = seen[1:]
+            to_create.append(unmatched)
+        else:
+            unmatched.seen_count = F('seen_count') + len(seen)
+            unmatched.last_seen_at = now
+            to_update.append(unmatched)
+
+        for _, price in seen:
+            typical_price = unmatched.typical_price
+            if price and (not typical_price or abs(price - float(typical_price)) < 2):
+                # Update typical price if close to existing
+                unmatched.typical_price = price
+
+    if to_create:
+        # A concurrent receipt may have just created the same product
+        UnmatchedProduct.objects.bulk_create(to_create, ignore_conflicts=True)
+    if to_update:
+        UnmatchedProduct.objects.bulk_update(to_update, ['seen_count', 'typical_price', 'last_seen_at'])
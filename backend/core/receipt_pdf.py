@@ -0,0 +1,163 @@
+"""PDF receipt text extraction.
+
+Pages are read lazily from the file (a temp file for multipart uploads),
+never from a decoded copy of the whole document:
+
+- pypdf extracts text page by page, in order;
+- a page with (almost) no text is a scan, so its embedded images are
+  OCR'd instead (core.receipt_ocr);
+- extraction stops after the page where the line items end (a total or
+  amount due line), skipping terms, returns policies and ads;
+- with settings.PDF_EXTRACT_WORKERS > 0, long PDFs on disk are split
+  into page ranges extracted by a process pool, batch by batch so the
+  early stop still saves work.
+"""
+import multiprocessing
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# A line closing the line-item section: "Total 12.34", "Amount due: $5.00"
+LINE_ITEMS_END = re.compile(
+    r'^\s*(?:(?:grand|order|invoice)\s+total|total(?:\s+due)?|(?:amount|balance)\s+due)'
+    r'\s*:?\s*(?:[A-Z]{3}\s*)?[$€£]?\s*-?\d[\d,]*[.,]\d{2}\s*$',
+    re.IGNORECASE | re.MULTILINE,
+)
+
+# Pages with less text than this are treated as scans and OCR'd
+MIN_PAGE_TEXT = 20
+
+# Parallel extraction only pays off past this many pages: every task
+# re-opens the PDF
+PARALLEL_MIN_PAGES = 16
+
+# Pages per parallel extraction task
+PAGES_PER_TASK = 4
+
+
+def _pdf_reader(pdf):
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise ImportError(
+            "pypdf not installed. "
+            "Run: pip install pypdf"
+        )
+    return PdfReader(pdf)
+
+
+def _extract_page_range(path: str, start: int, stop: int):
+    """Pool task: text of pages [start, stop) of the PDF at path."""
+    reader = _pdf_reader(path)
+    return [reader.pages[index].extract_text() or '' for index in range(start, stop)]
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    """The process pool for page ranges, or None when PDF_EXTRACT_WORKERS is 0."""
+    global _pool
+    from django.conf import settings
+
+    if settings.PDF_EXTRACT_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.PDF_EXTRACT_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+    return _pool
+
+
+def _page_texts(reader, path):
+    """Yield (index, text) for every page, in order.
+
+    Long PDFs on disk go to the pool one batch of page ranges at a time;
+    when the caller stops early, later batches are never submitted.
+    """
+    from django.conf import settings
+
+    count = len(reader.pages)
+    pool = _get_pool() if path and count >= PARALLEL_MIN_PAGES else None
+    if pool is None:
+        for index, page in enumerate(reader.pages):
+            yield index, page.extract_text() or ''
+        return
+
+    batch_pages = PAGES_PER_TASK * settings.PDF_EXTRACT_WORKERS
+    for batch_start in range(0, count, batch_pages):
+        batch_stop = min(batch_start + batch_pages, count)
+        futures = [
+            pool.submit(_extract_page_range, path, start, min(start + PAGES_PER_TASK, batch_stop))
+            for start in range(batch_start, batch_stop, PAGES_PER_TASK)
+        ]
+        try:
+            index = batch_start
+            for future in futures:
+                for text in future.result():
+                    yield index, text
+                    index += 1
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+def _ocr_page(page) -> str:
+    """Text of a scanned page, from OCR of its embedded images."""
+    from .receipt_ocr import _extract_text_from_image_ocr
+
+    try:
+        images = list(page.images)
+    except Exception:
+        return ''
+    texts = []
+    for image in images:
+        try:
+            texts.append(_extract_text_from_image_ocr(image.data))
+        except ValueError:
+            continue  # Not decodable, or no text in it
+    return '\n'.join(texts)
+
+
+def extract_text_from_pdf(pdf_file, path=None) -> str:
+    """Extract receipt text from a PDF, page by page.
+
+    Args:
+        pdf_file: Binary file object positioned anywhere (it is seeked)
+        path: Filesystem path of the same PDF, if any; enables parallel
+            page extraction
+
+    Returns:
+        Text of every page up to the end of the line items
+
+    Raises:
+        ValueError: If PDF is invalid or no text could be extracted
+        OCRPoolBusy: If a scanned page couldn't get an OCR slot
+    """
+    from .receipt_ocr import OCRPoolBusy
+
+    try:
+        reader = _pdf_reader(pdf_file)
+        full_text = []
+        for index, text in _page_texts(reader, path):
+            if len(text.strip()) < MIN_PAGE_TEXT:
+                # Scanned page: fall back to OCR
+                text = _ocr_page(reader.pages[index]) or text
+            if text.strip():
+                full_text.append(text)
+            if LINE_ITEMS_END.search(text):
+                break
+
+        if not full_text:
+            raise ValueError("No text found in PDF")
+
+        return '\n'.join(full_text)
+
+    except OCRPoolBusy:
+        raise
+    except Exception as e:
+        raise ValueError(f"Failed to extract text from PDF: {str(e)}")
+
@@ -0,0 +1,104 @@
+"""Versioned cache of serialized /api/companies/ payloads.
+
+Keys combine the global data version (core.data_version) with the
+request path and sorted query params, so a write makes every old entry
+unreachable; nothing is ever purged, entries just age out. The backend is
+the Django cache named by settings.API_CACHE_ALIAS: local memory by
+default, or a file/Redis cache shared between workers.
+
+warm() fills the cache for the pages the web frontend loads first. It
+runs after bulk writes commit (core.data_version.deferred), so the first
+visitor after an import gets a cache hit. Warming a process-local cache
+(the LocMemCache default) from a management command would help no one,
+so it's skipped, with a warning saying so once per process.
+"""
+import hashlib
+import logging
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import RequestFactory
+from django.urls import get_script_prefix, reverse
+from rest_framework.response import Response
+
+from . import data_version
+
+logger = logging.getLogger(__name__)
+
+# Company list queries to pre-warm, every page of each. Keep the card
+# params in sync with COMPANY_CARD_PARAMS in frontend/src/lib/api.ts.
+WARM_QUERIES = [
+    {},
+    {'fields': 'id,uri,ticker,name,sector,website', 'expand': 'badges,value_snapshots'},
+]
+
+
+def _cache():
+    return caches[settings.API_CACHE_ALIAS]
+
+
+def cache_key(version, path_info, query_params):
+    query = urlencode(sorted(query_params.lists()), doseq=True)
+    digest = hashlib.sha1(f"{path_info}?{query}".encode()).hexdigest()
+    return f"api:v{version}:{digest}"
+
+
+def cached(request, view_method, *args, **kwargs):
+    """Serve view_method's response data from the cache when possible.
+
+    Only 200 responses are stored. The data is cached before rendering,
+    so JSON and the browsable API share an entry.
+    """
+    version, _ = data_version.for_request(request)
+    key = cache_key(version, request.path_info, request.query_params)
+    data = _cache().get(key)
+    if data is not None:
+        return Response(data)
+
+    response = view_method(request, *args, **kwargs)
+    if response.status_code == 200:
+        _cache().set(key, response.data)
+    return response
+
+
+def _path_info(url):
+    # RequestFactory paths go below FORCE_SCRIPT_NAME, links include it
+    prefix = get_script_prefix()
+    return '/' + url[len(prefix):] if url.startswith(prefix) else url
+
+
+def _warm_host():
+    # Pagination builds absolute URIs, which validates the Host header
+    return next((host for host in settings.ALLOWED_HOSTS
+                 if host and not host.startswith(('*', '.'))), 'localhost')
+
+
+_skip_reported = False
+
+
+def warm() -> int:
+    """Pre-render every page of WARM_QUERIES; returns pages cached."""
+    global _skip_reported
+    if isinstance(_cache(), LocMemCache):
+        if not _skip_reported:
+            logger.warning("Skipped pre-warming the API cache: it is process-local (LocMemCache). "
+                           "Set API_CACHE_BACKEND to a shared cache to warm it after imports.")
+            _skip_reported = True
+        return 0
+    from .views import CompanyViewSet
+
+    view = CompanyViewSet.as_view({'get': 'list'})
+    factory = RequestFactory(HTTP_HOST=_warm_host())
+    pages = 0
+    for params in WARM_QUERIES:
+        url = f"{reverse('company-list')}?{urlencode(params)}"
+        while url:
+            response = view(factory.get(_path_info(url), HTTP_ACCEPT='application/json'))
+            if response.status_code != 200:
+                logger.warning("Cache warm-up of %s got HTTP %s", url, response.status_code)
+                break
+            pages += 1
+            url = response.data.get('next')
+    return pages
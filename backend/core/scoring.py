@@ -0,0 +1,449 @@
+"""Scoring engine: Claims + ScoringRule.config -> CompanyValueSnapshot.
+
+Each scored value is described by a ValueSpec (which claim type feeds it,
+how several claims for one company combine, how the card text reads).
+score_values() loads every relevant claim and the latest ScoringRule for
+each value up front, grades whole columns at once with NumPy, and writes
+all snapshots with one bulk upsert, so a full rescore is a handful of
+queries regardless of how many companies there are.
+
+Supported ScoringRule.config types:
+    threshold / threshold_inverse  {"thresholds": [{"min": ..., ...}]}
+                                   first entry with value >= min wins
+                                   (or value <= max for "max" entries)
+    categorical / label            {"mapping": {label: {grade, score}}}
+    label_map                      {"labels": {label: {grade, score}}}
+
+To score a new value, add a ValueSpec to VALUE_SPECS.
+
+Incremental rescoring: inserting a Claim or publishing a ScoringRule
+version queues the affected (company, value) pairs as PendingRescore rows
+(core.signals -> enqueue_claims / enqueue_rule). process_queue() drains
+them through score_values() restricted to those companies and brings the
+matching CompanyBadges up to date.
+"""
+from collections import defaultdict
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+
+from . import data_version, derived
+from .models import Claim, Company, CompanyBadge, CompanyValueSnapshot, PendingRescore, ScoringRule
+
+
+# Grade for a label missing from a categorical/label mapping
+DEFAULT_LABEL_GRADE = {'grade': 'F', 'score': -1.0}
+
+
+@dataclass
+class ScoreInput:
+    """What a value's display function sees for one company."""
+    company_id: int
+    amount: Optional[Decimal]   # first claim's amt, or the mean for aggregate='mean'
+    label: str                  # first claim's label
+    claim_uris: List[str]
+    grade: str = ''
+    score: float = 0.0
+
+
+@dataclass(frozen=True)
+class ValueSpec:
+    value_slug: str
+    claim_type: str
+    # (display_text, display_icon) for one scored company
+    display: Callable[[ScoreInput], Tuple[str, str]]
+    highlight_priority: int = 0
+    highlight_on_card: bool = True
+    # 'first' scores the company's earliest claim; 'mean' averages all of them
+    aggregate: str = 'first'
+    # Vectorized per-claim normalization: (amounts, units) -> amounts
+    normalize: Optional[Callable[[np.ndarray, np.ndarray], np.ndarray]] = None
+    # Card badge label; defaults to the snapshot's display_text
+    badge_label: Optional[str] = None
+
+
+def _format_usd(amt):
+    amt_float = float(amt)
+    if amt_float >= 1000000:
+        return f"${amt_float / 1000000:.1f}M"
+    if amt_float >= 1000:
+        return f"${amt_float / 1000:.0f}K"
+    return f"${amt_float:,.0f}"
+
+
+def _normalize_esg(amounts, units):
+    # S&P: 0-100, higher = better -> invert to sustainalytics-like scale.
+    # Sustainalytics-style: lower = better, already on 0-50 scale.
+    return np.where(units == 'spglobal_score', (100 - amounts) / 2, amounts)
+
+
+def _esg_display(row):
+    text = f"ESG Risk: {float(row.amount):.1f}"
+    if len(row.claim_uris) > 1:
+        text += f" ({len(row.claim_uris)} sources)"
+    return text, 'leaf'
+
+
+_CRUELTY_FREE_TEXT = {
+    'cruelty_free_vegan': 'Cruelty-free & Vegan',
+    'cruelty_free': 'Cruelty-free',
+    'working_toward': 'Working toward cruelty-free',
+    'tests_on_animals': 'Tests on animals',
+}
+
+_CRUELTY_FREE_ICON = {
+    'cruelty_free_vegan': 'rabbit',
+    'cruelty_free': 'rabbit',
+    'working_toward': 'clock',
+    'tests_on_animals': 'alert',
+}
+
+
+VALUE_SPECS: List[ValueSpec] = [
+    ValueSpec(
+        'corporate_lobbying', 'LOBBYING_SPEND',
+        lambda r: (f"Lobbying: {_format_usd(r.amount)} (2024)", 'megaphone'),
+        highlight_priority=3,
+    ),
+    ValueSpec(
+        'farm_animal_welfare', 'FARM_WELFARE_TIER',
+        lambda r: (f"BBFAW Tier {r.label}", 'cow'),
+        highlight_priority=1,
+    ),
+    ValueSpec(
+        'cage_free_eggs', 'CAGE_FREE_PERCENT',
+        lambda r: (f"{int(r.amount)}% cage-free", 'egg'),
+        highlight_priority=2,
+    ),
+    ValueSpec(
+        'ice_contracts', 'ICE_CONTRACT',
+        lambda r: (f"ICE contracts: ${r.amount}M", 'warning'),
+    ),
+    ValueSpec(
+        'ice_detention', 'ICE_DETENTION_OPERATOR',
+        lambda r: ('ICE detention operator', 'alert'),
+    ),
+    ValueSpec(
+        'esg_score', 'ESG_SCORE', _esg_display,
+        highlight_priority=3, aggregate='mean', normalize=_normalize_esg,
+    ),
+    ValueSpec(
+        'cruelty_free', 'CRUELTY_FREE_STATUS',
+        lambda r: (_CRUELTY_FREE_TEXT.get(r.label, r.label), _CRUELTY_FREE_ICON.get(r.label, 'rabbit')),
+        highlight_priority=2,
+    ),
+    ValueSpec(
+        'tobacco_products', 'tobacco_manufacturer',
+        lambda r: ('Tobacco manufacturer', 'cigarette'),
+        highlight_priority=100, badge_label='Tobacco',
+    ),
+]
+
+SPECS_BY_VALUE: Dict[str, ValueSpec] = {spec.value_slug: spec for spec in VALUE_SPECS}
+
+
+def grade_amounts(config: dict, amounts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Apply a threshold/threshold_inverse config to a column of amounts.
+
+    Returns (grades, scores) arrays aligned with amounts.
+    """
+    thresholds = config['thresholds']
+    grades = np.array([t['grade'] for t in thresholds], dtype=object)
+    scores = np.array([t['score'] for t in thresholds], dtype=float)
+
+    if 'max' in thresholds[0]:
+        bounds = np.array([t['max'] for t in thresholds], dtype=float)
+        hits = amounts[:, None] <= bounds[None, :]
+        fallback_grade, fallback_score = DEFAULT_LABEL_GRADE['grade'], DEFAULT_LABEL_GRADE['score']
+    else:
+        bounds = np.array([t['min'] for t in thresholds], dtype=float)
+        hits = amounts[:, None] >= bounds[None, :]
+        fallback_grade, fallback_score = grades[-1], scores[-1]
+
+    # First matching threshold per row; rows matching none use the fallback
+    first = hits.argmax(axis=1)
+    matched = hits.any(axis=1)
+    return (
+        np.where(matched, grades[first], fallback_grade),
+        np.where(matched, scores[first], fallback_score),
+    )
+
+
+def grade_labels(mapping: dict, labels: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Apply a label -> {grade, score} mapping to a column of labels."""
+    uniques, inverse = np.unique(labels.astype(str), return_inverse=True)
+    graded = [mapping.get(label, DEFAULT_LABEL_GRADE) for label in uniques]
+    grades = np.array([g['grade'] for g in graded], dtype=object)
+    scores = np.array([g['score'] for g in graded], dtype=float)
+    return grades[inverse], scores[inverse]
+
+
+def _grade(config: dict, amounts: np.ndarray, labels: np.ndarray):
+    rule_type = config.get('type')
+    if rule_type in ('threshold', 'threshold_inverse'):
+        return grade_amounts(config, amounts)
+    if rule_type in ('categorical', 'label'):
+        return grade_labels(config['mapping'], labels)
+    if rule_type == 'label_map':
+        return grade_labels(config['labels'], labels)
+    raise ValueError(f"Unsupported scoring rule type: {rule_type!r}")
+
+
+def latest_rules(value_slugs: Iterable[str]) -> Dict[str, ScoringRule]:
+    """Highest-version ScoringRule per value, in one query."""
+    rules = {}
+    for rule in ScoringRule.objects.filter(value_id__in=list(value_slugs)).order_by('value_id', 'version'):
+        rules[rule.value_id] = rule
+    return rules
+
+
+def score_values(
+    value_slugs: Optional[Sequence[str]] = None,
+    company_ids: Optional[Iterable[int]] = None,
+    batch_size: int = 1000,
+) -> Dict[str, int]:
+    """Recompute snapshots for the given values (default: all VALUE_SPECS).
+
+    Restrict to company_ids to rescore only some companies. Values with no
+    ScoringRule are skipped. Returns {value_slug: snapshots written}.
+
+    Writes with bulk_create(update_conflicts=True), which bypasses model
+    signals, so the touched companies are marked dirty in core.derived
+    explicitly. Queued PendingRescore rows these snapshots satisfy are
+    cleared.
+    """
+    started = timezone.now()
+    specs = [SPECS_BY_VALUE[slug] for slug in value_slugs] if value_slugs else VALUE_SPECS
+    rules = latest_rules(spec.value_slug for spec in specs)
+    specs = [spec for spec in specs if spec.value_slug in rules]
+    if not specs:
+        return {}
+
+    companies = Company.objects.all()
+    if company_ids is not None:
+        companies = companies.filter(pk__in=list(company_ids))
+    company_by_uri = dict(companies.values_list('uri', 'id'))
+
+    claims = Claim.objects.filter(claim_type__in={spec.claim_type for spec in specs})
+    if company_ids is not None:
+        claims = claims.filter(subject__in=list(company_by_uri))
+    by_type: Dict[str, list] = {}
+    for row in claims.order_by('pk').values_list('claim_type', 'subject', 'uri', 'amt', 'label', 'unit'):
+        if row[1] in company_by_uri:
+            by_type.setdefault(row[0], []).append(row)
+
+    snapshots = []
+    written = {}
+    for spec in specs:
+        rows = by_type.get(spec.claim_type, [])
+        inputs = _build_inputs(spec, rows, company_by_uri)
+        if not inputs:
+            written[spec.value_slug] = 0
+            continue
+
+        rule = rules[spec.value_slug]
+        amounts = np.array([float(i.amount) if i.amount is not None else np.nan for i in inputs])
+        labels = np.array([i.label for i in inputs], dtype=object)
+        grades, scores = _grade(rule.config, amounts, labels)
+
+        for item, grade, score in zip(inputs, grades, scores):
+            item.grade, item.score = str(grade), float(score)
+            display_text, display_icon = spec.display(item)
+            snapshots.append(CompanyValueSnapshot(
+                company_id=item.company_id,
+                value_id=spec.value_slug,
+                score=item.score,
+                grade=item.grade,
+                claim_uris=item.claim_uris,
+                highlight_on_card=spec.highlight_on_card,
+                highlight_priority=spec.highlight_priority,
+                display_text=display_text,
+                display_icon=display_icon,
+                scoring_rule_version=rule.version,
+            ))
+        written[spec.value_slug] = len(inputs)
+
+    CompanyValueSnapshot.objects.bulk_create(
+        snapshots,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['company', 'value'],
+        update_fields=['score', 'grade', 'claim_uris', 'highlight_on_card',
+                       'highlight_priority', 'display_text', 'display_icon',
+                       'scoring_rule_version'],
+    )
+    derived.mark_companies_dirty({snapshot.company_id for snapshot in snapshots})
+
+    # Anything queued after we started reading claims stays queued
+    satisfied = PendingRescore.objects.filter(
+        value_id__in=[spec.value_slug for spec in specs], enqueued_at__lte=started)
+    if company_ids is not None:
+        satisfied = satisfied.filter(company_id__in=company_by_uri.values())
+    satisfied.delete()
+    return written
+
+
+def _build_inputs(spec: ValueSpec, rows: list, company_by_uri: Dict[str, int]) -> List[ScoreInput]:
+    """Group one claim type's rows (ordered by pk) into one input per company."""
+    if not rows:
+        return []
+
+    subjects = np.array([r[1] for r in rows], dtype=object)
+    uniq_subjects, first_idx, group = np.unique(subjects, return_index=True, return_inverse=True)
+
+    if spec.aggregate == 'mean':
+        amounts = np.array([float(r[3]) if r[3] is not None else np.nan for r in rows])
+        if spec.normalize:
+            units = np.array([r[5] for r in rows], dtype=object)
+            amounts = spec.normalize(amounts, units)
+        means = np.bincount(group, weights=amounts) / np.bincount(group)
+
+    uris_by_group: List[List[str]] = [[] for _ in uniq_subjects]
+    for g, row in zip(group, rows):
+        uris_by_group[g].append(row[2])
+
+    inputs = []
+    for g, subject in enumerate(uniq_subjects):
+        first = rows[first_idx[g]]
+        if spec.aggregate == 'mean':
+            amount = Decimal(repr(float(means[g])))
+            claim_uris = uris_by_group[g]
+        else:
+            amount = first[3]
+            claim_uris = [first[2]]
+        inputs.append(ScoreInput(
+            company_id=company_by_uri[subject],
+            amount=amount,
+            label=first[4],
+            claim_uris=claim_uris,
+        ))
+    return inputs
+
+
+def _badge_type(score: float) -> str:
+    return 'positive' if score > 0.3 else ('negative' if score < -0.3 else 'neutral')
+
+
+def sync_badges(pairs: Iterable[Tuple[int, str]]) -> int:
+    """Bring each (company_id, value_slug) pair's CompanyBadge in line with its snapshot.
+
+    One badge per company and value, matching what the import commands
+    create. Returns the number of badges created or updated.
+    """
+    pairs = {(cid, slug) for cid, slug in pairs if slug in SPECS_BY_VALUE}
+    if not pairs:
+        return 0
+    company_ids = {cid for cid, _ in pairs}
+    value_slugs = {slug for _, slug in pairs}
+
+    snapshots = {
+        (s.company_id, s.value_id): s
+        for s in CompanyValueSnapshot.objects.filter(
+            company_id__in=company_ids, value_id__in=value_slugs, highlight_on_card=True)
+        if (s.company_id, s.value_id) in pairs
+    }
+    badges = {}
+    for badge in CompanyBadge.objects.filter(
+            company_id__in=company_ids, value_id__in=value_slugs).order_by('pk'):
+        badges.setdefault((badge.company_id, badge.value_id), badge)
+
+    fields = ['label', 'badge_type', 'source_claim_uri', 'priority']
+    to_create, to_update = [], []
+    for key, snapshot in snapshots.items():
+        spec = SPECS_BY_VALUE[snapshot.value_id]
+        wanted = {
+            'label': spec.badge_label or snapshot.display_text,
+            'badge_type': _badge_type(snapshot.score),
+            'source_claim_uri': snapshot.claim_uris[0] if snapshot.claim_uris else '',
+            'priority': snapshot.highlight_priority,
+        }
+        badge = badges.get(key)
+        if badge is None:
+            to_create.append(CompanyBadge(
+                company_id=snapshot.company_id, value_id=snapshot.value_id, **wanted))
+        elif any(getattr(badge, field) != wanted[field] for field in fields):
+            for field in fields:
+                setattr(badge, field, wanted[field])
+            to_update.append(badge)
+
+    CompanyBadge.objects.bulk_create(to_create)
+    CompanyBadge.objects.bulk_update(to_update, fields)
+    if to_create or to_update:
+        data_version.mark_changed()
+    return len(to_create) + len(to_update)
+
+
+def _scored_value_slugs() -> Dict[str, List[str]]:
+    """claim_type -> value slugs it feeds, for values that have a ScoringRule."""
+    with_rules = set(ScoringRule.objects.values_list('value_id', flat=True).distinct())
+    by_type: Dict[str, List[str]] = defaultdict(list)
+    for spec in VALUE_SPECS:
+        if spec.value_slug in with_rules:
+            by_type[spec.claim_type].append(spec.value_slug)
+    return by_type
+
+
+def _enqueue(pairs: Iterable[Tuple[int, str]], reason: str) -> int:
+    rows = [PendingRescore(company_id=cid, value_id=slug, reason=reason) for cid, slug in pairs]
+    PendingRescore.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['company', 'value'],
+        update_fields=['reason', 'enqueued_at'],
+    )
+    return len(rows)
+
+
+def enqueue_claims(claims: Iterable[Claim]) -> int:
+    """Queue the (company, value) pairs that newly inserted claims feed."""
+    values_by_type = _scored_value_slugs()
+    claims = [claim for claim in claims if claim.claim_type in values_by_type]
+    if not claims:
+        return 0
+    company_by_uri = dict(Company.objects.filter(
+        uri__in={claim.subject for claim in claims}).values_list('uri', 'id'))
+    return _enqueue({
+        (company_by_uri[claim.subject], slug)
+        for claim in claims if claim.subject in company_by_uri
+        for slug in values_by_type[claim.claim_type]
+    }, 'claim')
+
+
+def enqueue_rule(rule: ScoringRule) -> int:
+    """Queue every company with claims for the rule's value, if it's the latest version."""
+    spec = SPECS_BY_VALUE.get(rule.value_id)
+    if spec is None or ScoringRule.objects.filter(
+            value_id=rule.value_id, version__gt=rule.version).exists():
+        return 0
+    subjects = Claim.objects.filter(claim_type=spec.claim_type).values('subject')
+    company_ids = Company.objects.filter(uri__in=subjects).values_list('pk', flat=True)
+    return _enqueue({(cid, spec.value_slug) for cid in company_ids}, 'rule')
+
+
+def process_queue(limit: int = 500) -> int:
+    """Rescore up to `limit` of the oldest queued pairs; returns how many were taken.
+
+    The pairs stay locked until the rescore commits: overlapping runs skip
+    them, and a re-queue of one waits and then inserts it afresh.
+    """
+    with transaction.atomic():
+        pending = list(PendingRescore.objects.select_for_update(skip_locked=True).order_by(
+            'enqueued_at').values_list('pk', 'company_id', 'value_id')[:limit])
+        if not pending:
+            return 0
+
+        companies_by_value: Dict[str, Set[int]] = defaultdict(set)
+        for _, cid, slug in pending:
+            companies_by_value[slug].add(cid)
+        for slug, company_ids in companies_by_value.items():
+            if slug in SPECS_BY_VALUE:
+                score_values([slug], company_ids)
+        sync_badges((cid, slug) for _, cid, slug in pending)
+
+        # Values score_values() skipped (no spec or rule) would never clear
+        PendingRescore.objects.filter(pk__in=[pk for pk, _, _ in pending]).delete()
+    return len(pending)
@@ -0,0 +1,56 @@
+"""Ranked product search for products_list.
+
+UPPER(name) and UPPER(brand_name) carry pg_trgm GIN indexes (see
+Product.Meta.indexes). Matching uses icontains, which Django renders as
+UPPER(col) LIKE, plus trigram word similarity on the same expressions,
+so both are served by those indexes without a sequential scan. Results
+are ranked by similarity, with a boost for prefix matches, so partial
+input while typing ("chee") puts "Cheerios" first.
+
+Other backends fall back to icontains matching with the same
+prefix-first ordering.
+"""
+from django.db import connection
+from django.db.models import Case, FloatField, Q, Value, When
+from django.db.models.functions import Greatest, Upper
+
+
+def _prefix_boost(q):
+    """1.0 when name or brand starts with the query, else 0."""
+    return Case(
+        When(Q(brand_name__istartswith=q) | Q(name__istartswith=q), then=Value(1.0)),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+
+
+def search_products(queryset, q):
+    """Filter a Product queryset to matches for q, best first."""
+    q = q.strip()
+    terms = q.split()
+    if not terms:
+        return queryset
+
+    if connection.vendor == 'postgresql':
+        from django.contrib.postgres.search import TrigramWordSimilarity
+
+        # Every term must hit name or brand, exactly or fuzzily (typos).
+        # Trigrams are case-insensitive; UPPER() just matches the indexes.
+        queryset = queryset.alias(name_upper=Upper('name'), brand_upper=Upper('brand_name'))
+        for term in terms:
+            queryset = queryset.filter(
+                Q(name__icontains=term) | Q(brand_name__icontains=term) |
+                Q(name_upper__trigram_word_similar=term) | Q(brand_upper__trigram_word_similar=term)
+            )
+        similarity = Greatest(
+            TrigramWordSimilarity(q, 'name'),
+            TrigramWordSimilarity(q, 'brand_name'),
+        )
+    else:
+        for term in terms:
+            queryset = queryset.filter(Q(name__icontains=term) | Q(brand_name__icontains=term))
+        similarity = Value(0.0, output_field=FloatField())
+
+    return queryset.annotate(
+        search_rank=_prefix_boost(q) + similarity,
+    ).order_by('-search_rank', 'name')
@@ -35,7 +35,29 @@ class ClaimSerializer(serializers.ModelSerializer):
                   'created_at']
 
 
-class CompanySerializer(serializers.ModelSerializer):
+def _csv_param(request, name):
+    return {part.strip() for part in request.query_params.get(name, '').split(',') if part.strip()}
+
+
+class FieldSelectionMixin:
+    """Trim output with the request's ?fields= and ?expand= params.
+
+    ?fields=id,name limits output to those fields; nested relations in
+    Meta.expandable are then left out unless also named in ?expand=.
+    Without ?fields= every field is returned.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        requested = _csv_param(request, 'fields') if request else set()
+        if not requested:
+            return fields
+        keep = requested | (_csv_param(request, 'expand') & set(self.Meta.expandable))
+        return {name: field for name, field in fields.items() if name in keep}
+
+
+class CompanySerializer(FieldSelectionMixin, serializers.ModelSerializer):
     scores = CompanyScoreSerializer(many=True, read_only=True)
     badges = CompanyBadgeSerializer(many=True, read_only=True)
     value_snapshots = CompanyValueSnapshotSerializer(many=True, read_only=True)
@@ -43,6 +65,7 @@ class CompanySerializer(serializers.ModelSerializer):
     class Meta:
         model = Company
         fields = '__all__'
+        expandable = ['scores', 'badges', 'value_snapshots']
 
 
 class ValueSerializer(serializers.ModelSerializer):
@@ -0,0 +1,91 @@
+"""Model signal handlers that keep in-process caches and derived data in sync with the DB."""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import alternatives, data_version, derived, scoring
+from .barcode_providers import product_cache
+from .brand_matcher import brand_index
+from .models import (BarcodeCache, BrandMapping, Claim, Company, CompanyBadge,
+                     CompanyScore, CompanyValueSnapshot, Product, ScoringRule, Value)
+
+
+@receiver(post_save, sender=BrandMapping)
+@receiver(post_delete, sender=BrandMapping)
+@receiver(post_save, sender=Company)
+@receiver(post_delete, sender=Company)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_brand_index(sender, **kwargs):
+    transaction.on_commit(brand_index.invalidate)
+
+
+@receiver(post_save, sender=BarcodeCache)
+@receiver(post_delete, sender=BarcodeCache)
+def evict_cached_product(sender, instance, **kwargs):
+    barcode = instance.barcode
+    transaction.on_commit(lambda: product_cache.evict(barcode))
+
+
+@receiver(post_save, sender=CompanyValueSnapshot)
+@receiver(post_delete, sender=CompanyValueSnapshot)
+def refresh_derived(sender, instance, **kwargs):
+    derived.mark_companies_dirty([instance.company_id])
+
+
+@receiver(pre_save, sender=Company)
+def remember_company_sector(sender, instance, update_fields=None, **kwargs):
+    if instance.pk is not None and (update_fields is None or 'sector' in update_fields):
+        instance._sector_before_save = Company.objects.filter(
+            pk=instance.pk).values_list('sector', flat=True).first()
+
+
+@receiver(post_save, sender=Company)
+def refresh_derived_for_company(sender, instance, created, **kwargs):
+    # Of a company's own fields only the sector feeds derived data, so
+    # website or name edits don't rebuild its sector's alternatives
+    sector_before = instance.__dict__.pop('_sector_before_save', instance.sector)
+    if created or sector_before != instance.sector:
+        derived.mark_companies_dirty([instance.pk])
+
+
+@receiver(post_save, sender=Value)
+def refresh_derived_for_value(sender, instance, created, **kwargs):
+    # is_disqualifying may have changed
+    if not created:
+        derived.mark_value_dirty(instance.slug)
+
+
+@receiver(post_delete, sender=Company)
+def refresh_alternatives_for_deleted_company(sender, instance, **kwargs):
+    sector = instance.sector
+    transaction.on_commit(lambda: alternatives.refresh_sectors([sector]))
+
+
+@receiver(post_save, sender=Claim)
+def enqueue_rescore_for_claim(sender, instance, created, **kwargs):
+    if created:
+        scoring.enqueue_claims([instance])
+
+
+@receiver(post_save, sender=ScoringRule)
+def enqueue_rescore_for_rule(sender, instance, **kwargs):
+    scoring.enqueue_rule(instance)
+
+
+@receiver(post_save, sender=Company)
+@receiver(post_delete, sender=Company)
+@receiver(post_save, sender=CompanyValueSnapshot)
+@receiver(post_delete, sender=CompanyValueSnapshot)
+@receiver(post_save, sender=CompanyBadge)
+@receiver(post_delete, sender=CompanyBadge)
+@receiver(post_save, sender=CompanyScore)
+@receiver(post_delete, sender=CompanyScore)
+@receiver(post_save, sender=Value)
+@receiver(post_delete, sender=Value)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=BrandMapping)
+@receiver(post_delete, sender=BrandMapping)
+def bump_data_version(sender, **kwargs):
+    data_version.mark_changed()
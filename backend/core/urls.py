@@ -3,7 +3,8 @@ from rest_framework.routers import DefaultRouter
 from .views import (CompanyViewSet, ValueViewSet, current_user, user_weights,
                      sectors_list, company_claims, vote_for_company, vote_leaderboard,
                      products_list, product_categories)
-from .views_mobile import barcode_scan, alternatives_for_company, brand_mappings_list, receipt_analyze
+from .views_mobile import (barcode_scan, barcode_scan_batch, alternatives_for_company,
+                           brand_mappings_list, receipt_analyze, receipt_job_status)
 
 router = DefaultRouter()
 router.register(r'companies', CompanyViewSet, basename='company')
@@ -19,7 +20,9 @@ urlpatterns = [
     path('votes/leaderboard/', vote_leaderboard, name='vote-leaderboard'),
     # Mobile app endpoints
     path('scan/', barcode_scan, name='barcode-scan'),
+    path('scan/batch/', barcode_scan_batch, name='barcode-scan-batch'),
     path('receipt/analyze/', receipt_analyze, name='receipt-analyze'),
+    path('receipt/jobs/<uuid:job_id>/', receipt_job_status, name='receipt-job'),
     path('alternatives/<str:ticker>/', alternatives_for_company, name='alternatives'),
     path('brands/', brand_mappings_list, name='brand-mappings'),
     # Product endpoints
@@ -1,12 +1,17 @@
-from django.db import models
+from django.utils.decorators import method_decorator
 from rest_framework import viewsets, status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
+from . import response_cache
+from .data_version import versioned
 from .models import Claim, Company, CompanyVote, Value, UserValueWeight, Product
+from .pagination import CompanyCursorPagination
+from .search import search_products
 from .serializers import ClaimSerializer, CompanySerializer, ValueSerializer, UserValueWeightSerializer, ProductSerializer
 
 
+@versioned
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def sectors_list(request):
@@ -15,13 +20,34 @@ def sectors_list(request):
     return Response([s for s in sectors if s])
 
 
+@method_decorator(versioned, name='list')
+@method_decorator(versioned, name='retrieve')
 class CompanyViewSet(viewsets.ReadOnlyModelViewSet):
+    """Companies, cursor-paginated by name.
+
+    Responses are cached per data version (core.response_cache).
+
+    Query params:
+      ?sector=Retail             - filter by sector
+      ?value=esg_score           - only companies graded on this value
+      ?fields=id,ticker,name     - only these fields (see FieldSelectionMixin)
+      ?expand=badges             - with ?fields=, also include these relations
+      ?page_size=50              - page size (max CompanyCursorPagination.max_page_size)
+    """
     serializer_class = CompanySerializer
     lookup_field = 'ticker'
-    pagination_class = None
+    pagination_class = CompanyCursorPagination
 
     def get_queryset(self):
-        qs = Company.objects.prefetch_related('scores', 'badges', 'value_snapshots', 'value_snapshots__value')
+        # Only prefetch the relations this request will serialize
+        fields = self.get_serializer().fields
+        qs = Company.objects.all()
+        if 'scores' in fields:
+            qs = qs.prefetch_related('scores')
+        if 'badges' in fields:
+            qs = qs.prefetch_related('badges')
+        if 'value_snapshots' in fields:
+            qs = qs.prefetch_related('value_snapshots', 'value_snapshots__value')
         sector = self.request.query_params.get('sector')
         value = self.request.query_params.get('value')
         if sector:
@@ -30,7 +56,15 @@ class CompanyViewSet(viewsets.ReadOnlyModelViewSet):
             qs = qs.filter(value_snapshots__value__slug=value).distinct()
         return qs
 
+    def list(self, request, *args, **kwargs):
+        return response_cache.cached(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return response_cache.cached(request, super().retrieve, *args, **kwargs)
+
 
+@method_decorator(versioned, name='list')
+@method_decorator(versioned, name='retrieve')
 class ValueViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Value.objects.all()
     serializer_class = ValueSerializer
@@ -149,7 +183,8 @@ def products_list(request):
     """Search products by name, brand, or category.
 
     Query params:
-      ?q=cheerios       - search name or brand_name (case-insensitive)
+      ?q=cheerios       - search name or brand_name, best match first
+                          (typo-tolerant and prefix-aware, see core.search)
       ?category=cereal  - filter by category
       ?brand=Tide       - exact brand match
     """
@@ -158,10 +193,7 @@ def products_list(request):
     category = request.query_params.get('category')
     brand = request.query_params.get('brand')
     if q:
-        qs = qs.filter(
-            models.Q(name__icontains=q) |
-            models.Q(brand_name__icontains=q)
-        )
+        qs = search_products(qs, q)
     if category:
         qs = qs.filter(category=category)
     if brand:
@@ -170,6 +202,7 @@ def products_list(request):
     return Response(serializer.data)
 
 
+@versioned
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def product_categories(request):
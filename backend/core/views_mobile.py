@@ -1,19 +1,28 @@
 """API views for the mobile barcode scanner app."""
+import math
+import time
+
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework import status
-
-from .models import Company, Value, BrandMapping
-from .barcode_providers import lookup_barcode
-from .brand_matcher import match_brand_to_company
+from django.conf import settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Company, Value, BrandMapping, ReceiptJob
+from .alternatives import ANIMAL_WELFARE_VALUES
+from .data_version import versioned
+from .barcode_providers import lookup_barcode, lookup_barcodes
+from .brand_matcher import brand_index, match_brand_to_company
 from .serializers_mobile import (
     MobileCompanySerializer,
     BrandMappingSerializer,
-    compute_overall_grade_server,
 )
-from .receipt_ocr import extract_text_from_image
-from .receipt_parser import parse_receipt_with_claude, match_company_to_database
+from .receipt_jobs import ReceiptError, analyze_if_cached, decode_receipt, job_data
+
+# Seconds between status checks while long-polling a receipt job
+RECEIPT_POLL_INTERVAL = 0.5
 
 
 @api_view(['POST'])
@@ -43,17 +52,10 @@ def barcode_scan(request):
             'match_method': 'product_not_found',
         })
 
-    product_data = {
-        'name': product_info.product_name,
-        'brands': product_info.brands,
-        'categories': product_info.categories,
-        'image_url': product_info.image_url,
-        'ecoscore_grade': product_info.ecoscore_grade,
-        'provider': product_info.provider,
-    }
+    product_data = _product_data(product_info)
 
     # Step 2: Match brand to company
-    company, confidence, method = match_brand_to_company(product_info)
+    company, confidence, method = _match_companies({barcode: product_info})[barcode]
 
     if not company:
         return Response({
@@ -65,11 +67,6 @@ def barcode_scan(request):
             'match_method': method,
         })
 
-    # Prefetch related data for serialization
-    company = Company.objects.prefetch_related(
-        'value_snapshots', 'value_snapshots__value', 'badges'
-    ).get(pk=company.pk)
-
     company_data = MobileCompanySerializer(company).data
 
     # Step 3: Find better alternatives
@@ -86,6 +83,93 @@ def barcode_scan(request):
     })
 
 
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def barcode_scan_batch(request):
+    """Scan many barcodes at once, e.g. replaying an offline scan queue.
+
+    POST /api/scan/batch/
+    Body: {"barcodes": ["3017620422003", "0037000127857", ...]}
+
+    Returns one entry per barcode, in request order, with the same fields
+    as /api/scan/ except that 'company' is a company id and
+    'alternatives' a list of ids. Each company (matched or alternative)
+    is serialized once into the shared 'companies' map keyed by id.
+    """
+    barcodes = request.data.get('barcodes')
+    if not isinstance(barcodes, list) or not barcodes:
+        return Response(
+            {'error': 'barcodes must be a non-empty list'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    if len(barcodes) > settings.BARCODE_BATCH_MAX:
+        return Response(
+            {'error': f'at most {settings.BARCODE_BATCH_MAX} barcodes per request'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    barcodes = [str(b).strip() for b in barcodes]
+    if not all(barcodes):
+        return Response(
+            {'error': 'barcodes must not be empty'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    # Step 1: Look up all products (one cache query, concurrent provider calls)
+    product_infos = lookup_barcodes(barcodes)
+
+    # Step 2: Match brands, once per distinct barcode
+    matches = _match_companies({
+        barcode: info for barcode, info in product_infos.items() if info
+    })
+
+    # Step 3: Fetch alternatives once per matched company
+    companies = {company.pk: company for company, _, _ in matches.values() if company}
+
+    alternative_ids = {}
+    payload_companies = dict(companies)
+    for company in companies.values():
+        alternatives = _get_alternatives(company)
+        alternative_ids[company.pk] = [alt.pk for alt in alternatives]
+        for alt in alternatives:
+            payload_companies.setdefault(alt.pk, alt)
+
+    companies_data = {
+        str(pk): data for pk, data in zip(
+            payload_companies,
+            MobileCompanySerializer(list(payload_companies.values()), many=True).data,
+        )
+    }
+
+    items = []
+    for barcode in barcodes:
+        info = product_infos.get(barcode)
+        if not info:
+            items.append({
+                'barcode': barcode,
+                'product': None,
+                'company': None,
+                'alternatives': [],
+                'match_confidence': 0,
+                'match_method': 'product_not_found',
+            })
+            continue
+
+        company, confidence, method = matches[barcode]
+        items.append({
+            'barcode': barcode,
+            'product': _product_data(info),
+            'company': company.pk if company else None,
+            'alternatives': alternative_ids[company.pk] if company else [],
+            'match_confidence': confidence if company else 0,
+            'match_method': method,
+        })
+
+    return Response({
+        'items': items,
+        'companies': companies_data,
+    })
+
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def alternatives_for_company(request, ticker):
@@ -117,6 +201,7 @@ def alternatives_for_company(request, ticker):
     })
 
 
+@versioned
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def brand_mappings_list(request):
@@ -132,155 +217,161 @@ def brand_mappings_list(request):
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def receipt_analyze(request):
-    """Analyze receipt: OCR → Claude AI → Match companies → Return grades.
+    """Queue a receipt for analysis: OCR → Claude AI → Match companies → Grades.
+
+    POST /api/receipt/analyze/
+    Body: {"image": "base64_encoded_jpeg_png_or_pdf"}
+      or multipart/form-data with the file in "image" (streamed to disk;
+      preferred for large PDFs)
 
-    POST /api/receipt/analyze
-    Body: {"image": "base64_encoded_jpeg_or_png"}
+    Returns 202 with {"job_id", "status", "status_url"} right away; the
+    analysis runs in `manage.py process_receipt_jobs`. Poll status_url for
+    the result (see receipt_job_status).
 
-    Returns:
-    - receipt_metadata: store, date, total
-    - items: list of products with matched companies and grades
-    - summary: overall statistics
+    A receipt seen before (same file, OCR and parse cached) is finished
+    inline: 200 with the job already "done" and its "result".
     """
-    image_base64 = request.data.get('image', '').strip()
-    if not image_base64:
-        return Response(
-            {'error': 'image is required (base64-encoded JPEG or PNG)'},
-            status=status.HTTP_400_BAD_REQUEST,
-        )
+    upload = request.FILES.get('image')
+    if upload is not None:
+        if upload.size > settings.RECEIPT_UPLOAD_MAX_BYTES:
+            return Response(
+                {'error': f'File too large (max {settings.RECEIPT_UPLOAD_MAX_BYTES // (1024 * 1024)} MB)'},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            )
+        image_base64 = ''
+        # Large uploads are already in a temp file; small ones in memory
+        if hasattr(upload, 'temporary_file_path'):
+            receipt = upload.temporary_file_path()
+        else:
+            receipt = upload
+    else:
+        image_base64 = request.data.get('image', '').strip()
+        if not image_base64:
+            return Response(
+                {'error': 'image is required (base64-encoded JPEG, PNG or PDF)'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            receipt = decode_receipt(image_base64)
+        except ReceiptError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    result = analyze_if_cached(receipt)
+    if result is not None:
+        now = timezone.now()
+        job = ReceiptJob.objects.create(
+            status='done', result=result, started_at=now, finished_at=now)
+        return Response({
+            **job_data(job),
+            'status_url': reverse('receipt-job', args=[job.id]),
+        })
 
-    # Step 1: Extract text from image using EasyOCR
-    try:
-        extracted_text = extract_text_from_image(image_base64)
-    except ValueError as e:
-        return Response(
-            {'error': f'Could not read receipt: {str(e)}'},
-            status=status.HTTP_400_BAD_REQUEST,
-        )
+    job = ReceiptJob(image_base64=image_base64)
+    if upload is not None:
+        job.upload.save(upload.name, upload, save=False)
+    job.save()
+    return Response({
+        'job_id': str(job.id),
+        'status': job.status,
+        'status_url': reverse('receipt-job', args=[job.id]),
+    }, status=status.HTTP_202_ACCEPTED)
 
-    # Step 2: Parse receipt with Claude AI
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def receipt_job_status(request, job_id):
+    """Status, and once done the result, of a receipt analysis job.
+
+    GET /api/receipt/jobs/<job_id>/
+    GET /api/receipt/jobs/<job_id>/?wait=10   (long-poll up to 10s)
+
+    status: queued → ocr → parsing → matching → done | failed.
+    When done, "result" holds receipt_metadata, items (each with the
+    matched company and grades) and summary; when failed, "error".
+    """
     try:
-        parsed_data = parse_receipt_with_claude(extracted_text)
-    except ValueError as e:
+        wait = float(request.query_params.get('wait', 0))
+    except ValueError:
+        wait = math.nan
+    if not math.isfinite(wait):
         return Response(
-            {'error': f'Could not parse receipt: {str(e)}'},
+            {'error': 'wait must be a number of seconds'},
             status=status.HTTP_400_BAD_REQUEST,
         )
+    wait = min(max(wait, 0.0), settings.RECEIPT_JOB_MAX_WAIT)
+    deadline = time.monotonic() + wait
 
-    # Step 3: Match each item to companies in database
-    matched_items = []
-    total_items = len(parsed_data.get('items', []))
-    matched_count = 0
-    total_spending = 0.0
-    matched_spending = 0.0
-
-    for item in parsed_data.get('items', []):
-        parent_company = item.get('parent_company', '')
-        brand = item.get('brand', '')
-        product_name = item.get('product_name', '')
-        price = item.get('price')
-
-        # Match to database (tries Product model first, then Company/BrandMapping)
-        company, confidence, method = match_company_to_database(
-            parent_company, brand, product_name, price
-        )
+    while True:
+        job = ReceiptJob.objects.filter(pk=job_id).first()
+        if job is None:
+            return Response({'error': 'Receipt job not found'}, status=status.HTTP_404_NOT_FOUND)
+        if job.status in ReceiptJob.FINISHED or time.monotonic() >= deadline:
+            return Response(job_data(job))
+        time.sleep(RECEIPT_POLL_INTERVAL)
 
-        # Only include if confidence >= 80%
-        if company and confidence >= 0.8:
-            # Prefetch related data
-            company_full = Company.objects.prefetch_related(
-                'value_snapshots', 'value_snapshots__value', 'badges'
-            ).get(pk=company.pk)
-
-            matched_items.append({
-                'product_name': item.get('product_name', ''),
-                'brand': brand,
-                'price': price,
-                'company': MobileCompanySerializer(company_full).data,
-                'match_confidence': confidence,
-                'match_method': method,
-            })
 
-            matched_count += 1
-            if price:
-                matched_spending += price
-        else:
-            # Item not matched or low confidence
-            matched_items.append({
-                'product_name': item.get('product_name', ''),
-                'brand': brand,
-                'price': price,
-                'company': None,
-                'match_confidence': confidence,
-                'match_method': method,
-                'unmatched_reason': f'Could not match "{parent_company}" or "{brand}" to database',
-            })
+# --- helpers ---
 
-        if price:
-            total_spending += price
+def _product_data(product_info):
+    """Product fields returned by the scan endpoints."""
+    return {
+        'name': product_info.product_name,
+        'brands': product_info.brands,
+        'categories': product_info.categories,
+        'image_url': product_info.image_url,
+        'ecoscore_grade': product_info.ecoscore_grade,
+        'provider': product_info.provider,
+    }
 
-    # Step 4: Return results
-    return Response({
-        'receipt_metadata': {
-            'store_name': parsed_data.get('store_name', ''),
-            'date': parsed_data.get('date'),
-            'total': parsed_data.get('total'),
-        },
-        'items': matched_items,
-        'summary': {
-            'total_items': total_items,
-            'matched_items': matched_count,
-            'total_spending': total_spending,
-            'matched_spending': matched_spending,
-        }
-    })
 
+def _load_companies(company_ids):
+    """{id: Company} with related data prefetched for serialization."""
+    return Company.objects.prefetch_related(
+        'value_snapshots', 'value_snapshots__value', 'badges'
+    ).in_bulk(company_ids)
 
-# --- helpers ---
 
-ANIMAL_WELFARE_VALUES = {'farm_animal_welfare', 'cage_free_eggs', 'cruelty_free'}
+def _match_companies(product_infos):
+    """match_brand_to_company() per key, with the matched companies loaded.
+
+    The brand index can hand back a company another process deleted (for
+    up to BRAND_INDEX_TTL). The index is then rebuilt and those products
+    matched once more; a company still missing counts as not found.
+    """
+    matches = {key: match_brand_to_company(info) for key, info in product_infos.items()}
+    companies = _load_companies({company.pk for company, _, _ in matches.values() if company})
+    stale = [key for key, (company, _, _) in matches.items()
+             if company and company.pk not in companies]
+    if stale:
+        brand_index.invalidate()
+        for key in stale:
+            matches[key] = match_brand_to_company(product_infos[key])
+        companies.update(_load_companies(
+            {matches[key][0].pk for key in stale if matches[key][0]} - companies.keys()))
+
+    loaded = {}
+    for key, (company, confidence, method) in matches.items():
+        if company and company.pk in companies:
+            loaded[key] = (companies[company.pk], confidence, method)
+        else:
+            loaded[key] = (None, 0.0, 'not_found')
+    return loaded
 
 
 def _get_alternatives(company, limit=5):
     """Find better-rated companies in the same sector.
 
-    Prioritizes companies with better animal welfare scores.
+    Reads the ranking precomputed by core.alternatives, which prioritizes
+    companies with better animal welfare scores.
     """
     if not company.sector:
         return []
 
-    same_sector = Company.objects.filter(
-        sector=company.sector
-    ).exclude(
-        pk=company.pk
-    ).prefetch_related('value_snapshots', 'value_snapshots__value', 'badges')
-
-    input_snapshots = list(company.value_snapshots.all())
-    if not input_snapshots:
-        input_avg = 0
-    else:
-        input_avg = sum(s.score for s in input_snapshots) / len(input_snapshots)
-
-    candidates = []
-    for alt in same_sector:
-        alt_snapshots = list(alt.value_snapshots.all())
-        if not alt_snapshots:
-            continue
-        alt_avg = sum(s.score for s in alt_snapshots) / len(alt_snapshots)
-        if alt_avg <= input_avg:
-            continue
-
-        # Bonus for animal welfare values
-        animal_bonus = 0
-        for snap in alt_snapshots:
-            if snap.value_id in ANIMAL_WELFARE_VALUES and snap.score > 0.3:
-                animal_bonus += 0.2
-
-        candidates.append((alt, alt_avg, animal_bonus))
-
-    # Sort by animal welfare bonus first, then overall score
-    candidates.sort(key=lambda x: (x[2], x[1]), reverse=True)
-    return [c[0] for c in candidates[:limit]]
+    return list(
+        Company.objects.filter(ranked_as_alternative__company=company)
+        .order_by('ranked_as_alternative__rank')
+        .prefetch_related('value_snapshots', 'value_snapshots__value', 'badges')[:limit]
+    )
 
 
 def _animal_welfare_highlight(company, alternatives):
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+"""Benchmark OCR on original vs. preprocessed receipt photos.
+
+Runs every image in a fixture directory through EasyOCR twice, once as
+uploaded and once after core.receipt_image.prepare_image(), and reports
+OCR time, peak memory and accuracy per receipt. Accuracy is character
+similarity to `<image name>.txt` when that ground truth file exists,
+otherwise agreement between the two runs.
+
+Each mode runs in its own process so the reader load and memory peaks
+don't leak between them.
+
+Usage:
+    python tests/benchmark_ocr_preprocessing.py example-receipts/
+    python tests/benchmark_ocr_preprocessing.py example-receipts/ --text-height 24
+    python tests/benchmark_ocr_preprocessing.py /tmp/receipts --synthetic 10
+"""
+
+import argparse
+import difflib
+import io
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# Add backend to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+IMAGE_SUFFIXES = {'.jpg', '.jpeg', '.png', '.webp'}
+
+
+def _peak_rss_reset():
+    """Reset the peak RSS counter (Linux); False if unsupported."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _rss_mb(field):
+    """VmRSS / VmHWM of this process in MB (Linux), else ru_maxrss."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_mode(paths, text_height):
+    """OCR every path in this (fresh) process; text_height=0 = original images."""
+    from core.receipt_ocr import _get_easyocr_reader, _readtext
+
+    _get_easyocr_reader()
+    results = []
+    for path in paths:
+        image_bytes = Path(path).read_bytes()
+        _peak_rss_reset()
+        before = _rss_mb('VmRSS')
+        started = time.perf_counter()
+        lines = _readtext(image_bytes, text_height)
+        seconds = time.perf_counter() - started
+        results.append({
+            'seconds': seconds,
+            'peak_mb': max(0.0, _rss_mb('VmHWM') - before),
+            'text': '\n'.join(lines),
+        })
+    return results
+
+
+def _normalize(text):
+    return ' '.join(text.upper().split())
+
+
+def similarity(a, b):
+    return difflib.SequenceMatcher(None, _normalize(a), _normalize(b)).ratio()
+
+
+def make_synthetic_corpus(directory, count):
+    """Write `count` phone-photo-like receipts (with ground truth) to directory."""
+    from PIL import Image, ImageDraw, ImageFont
+
+    directory.mkdir(parents=True, exist_ok=True)
+    products = ['CHEERIOS 12OZ', 'KRAFT MAC CHEESE', 'TIDE PODS 42CT', 'COCA COLA 2L',
+                'DORITOS NACHO', 'OREO COOKIES', 'HEINZ KETCHUP', 'DOVE SOAP 4PK',
+                'QUAKER OATS', 'PRINGLES ORIG', 'NUTELLA 13OZ', 'COLGATE TOTAL']
+    rng = random.Random(17)
+    for n in range(count):
+        font_px = rng.randint(36, 64)
+        font = ImageFont.load_default(size=font_px)
+        lines = ['WHOLE FOODS MARKET', f'STORE {rng.randint(100, 999)}']
+        lines += [f'{rng.choice(products):<18} {rng.randint(1, 19)}.{rng.randint(10, 99)}'
+                  for _ in range(rng.randint(8, 25))]
+        lines.append(f'TOTAL {rng.randint(20, 199)}.{rng.randint(10, 99)}')
+
+        paper = Image.new('L', (font_px * 16, int(font_px * 1.5 * (len(lines) + 2))), 235)
+        draw = ImageDraw.Draw(paper)
+        for i, line in enumerate(lines):
+            draw.text((font_px, font_px + i * font_px * 1.5), line, fill=25, font=font)
+        paper = paper.rotate(rng.uniform(-8, 8), expand=True, fillcolor=70)
+
+        # 12 MP photo of the receipt lying on a table
+        photo = Image.new('RGB', (3024, 4032), (70, 55, 45))
+        photo.paste(paper.convert('RGB'), ((photo.width - paper.width) // 2,
+                                           (photo.height - paper.height) // 2))
+        buffer = io.BytesIO()
+        photo.save(buffer, 'JPEG', quality=90)
+        (directory / f'synthetic-{n:02d}.jpg').write_bytes(buffer.getvalue())
+        (directory / f'synthetic-{n:02d}.txt').write_text('\n'.join(lines))
+
+
+def benchmark(directory, text_height):
+    paths = sorted(str(p) for p in directory.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+    if not paths:
+        print(f"No images in {directory}")
+        return False
+
+    print("=" * 60)
+    print("OCR Preprocessing Benchmark")
+    print(f"Corpus: {directory} ({len(paths)} images), text height {text_height}px")
+    print("=" * 60)
+
+    context = multiprocessing.get_context('spawn')
+    runs = {}
+    for mode, height in (('original', 0), ('preprocessed', text_height)):
+        print(f"\nRunning {mode}...")
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            runs[mode] = pool.submit(run_mode, paths, height).result()
+
+    print(f"\n{'receipt':<24} {'time (s)':>15} {'peak MB':>15} {'accuracy':>15}")
+    totals = {mode: {'seconds': 0.0, 'peak_mb': 0.0, 'accuracy': 0.0} for mode in runs}
+    for i, path in enumerate(paths):
+        truth_path = Path(path).with_suffix('.txt')
+        truth = truth_path.read_text() if truth_path.exists() else None
+        row = {}
+        for mode, results in runs.items():
+            result = results[i]
+            if truth is not None:
+                accuracy = similarity(result['text'], truth)
+            else:
+                # No ground truth: how closely preprocessing reproduces the original
+                accuracy = similarity(result['text'], runs['original'][i]['text'])
+            row[mode] = (result['seconds'], result['peak_mb'], accuracy)
+            totals[mode]['seconds'] += result['seconds']
+            totals[mode]['peak_mb'] += result['peak_mb']
+            totals[mode]['accuracy'] += accuracy
+        print(f"{Path(path).name[:24]:<24} "
+              f"{row['original'][0]:>7.2f} → {row['preprocessed'][0]:<5.2f} "
+              f"{row['original'][1]:>7.0f} → {row['preprocessed'][1]:<5.0f} "
+              f"{row['original'][2]:>7.1%} → {row['preprocessed'][2]:<5.1%}")
+
+    count = len(paths)
+    original, preprocessed = totals['original'], totals['preprocessed']
+    print("-" * 60)
+    print(f"Mean OCR time:   {original['seconds'] / count:.2f}s → {preprocessed['seconds'] / count:.2f}s")
+    print(f"Mean peak RSS:   {original['peak_mb'] / count:.0f} MB → {preprocessed['peak_mb'] / count:.0f} MB")
+    print(f"Mean accuracy:   {original['accuracy'] / count:.1%} → {preprocessed['accuracy'] / count:.1%}")
+    return True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('directory', type=Path, help="Receipt images (+ optional .txt ground truth)")
+    parser.add_argument('--text-height', type=int, default=32,
+                        help="Target character height in pixels (OCR_TEXT_HEIGHT)")
+    parser.add_argument('--synthetic', type=int, metavar='N',
+                        help="First write N synthetic 12 MP receipt photos to the directory")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        make_synthetic_corpus(args.directory, args.synthetic)
+    elif not args.directory.is_dir():
+        print(f"Directory not found: {args.directory}")
+        sys.exit(1)
+
+    sys.exit(0 if benchmark(args.directory, args.text_height) else 1)
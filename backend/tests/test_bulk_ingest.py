@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+"""Test bulk and streamed ingestion (core.ingest) against the database.
+
+Everything runs inside a transaction that is rolled back at the end, so
+the database is left as it was. Checks that:
+
+- BulkIngest resolves companies like the import commands always have: an
+  existing company with the same ticker wins over the slug, otherwise the
+  company at urn:company:<slug> is updated or created;
+- fill_sector only fills a missing sector of a company found by ticker;
+- claims whose URI is already stored (or staged twice) are skipped;
+- ingest_records() with a ClaimMapping skips invalid rows (missing
+  columns, bad or out-of-range numbers, bad dates, too long values) and
+  reports them by line, without aborting the import;
+- RecordReader reads gzipped JSONL and reports lines that aren't JSON
+  objects, and saves in batches of the given size.
+
+Usage:
+    python tests/test_bulk_ingest.py
+"""
+
+import gzip
+import json
+import os
+import sys
+import tempfile
+from decimal import Decimal
+
+# Add backend to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+# Tickers and URIs no real data uses
+PREFIX = 'zzingest'
+
+MAPPING = {
+    'required': ['ticker', 'score'],
+    'fill_sector': True,
+    'company': {
+        'slug': f'{PREFIX}_{{ticker|lower}}',
+        'name': ['{name}', '{ticker}'],
+        'ticker': '{ticker}',
+        'sector': '{sector}',
+    },
+    'claim': {
+        'uri': f'urn:{PREFIX}:{{ticker|lower}}:score',
+        'claim_type': 'ZZ_TEST_SCORE',
+        'amt': '{score}',
+        'effective_date': '{date}',
+        'label': '{label}',
+    },
+}
+
+CSV_ROWS = [
+    'ticker,name,sector,score,date,label',
+    'ZZA,Alpha,Tech,12.5,2024-01-01,ok',          # line 2: valid
+    'ZZB,Beta,,7,2024-01-01,ok',                  # line 3: valid, no sector
+    ',No Ticker,Tech,3,2024-01-01,ok',            # line 4: missing ticker
+    'ZZC,Gamma,Tech,lots,2024-01-01,ok',          # line 5: not a number
+    'ZZD,Delta,Tech,1e30,2024-01-01,ok',          # line 6: too many digits
+    'ZZE,Epsilon,Tech,4,01/02/2024,ok',           # line 7: not an ISO date
+    f'ZZF,Phi,Tech,4,2024-01-01,{"x" * 101}',     # line 8: label too long
+    'ZZG,Eta,Tech,1.005,2024-01-01,ok',           # line 9: valid, rounded
+]
+
+
+def check(label, ok):
+    print(f"   {'OK  ' if ok else 'FAIL'} {label}")
+    return ok
+
+
+def run():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alonovo.settings')
+    import django
+    django.setup()
+    from django.db import transaction
+
+    with tempfile.TemporaryDirectory() as tmp, transaction.atomic():
+        passed = run_checks(tmp)
+        transaction.set_rollback(True)
+    return passed
+
+
+def run_checks(tmp):
+    from core.ingest import BulkIngest, ClaimMapping, RecordReader, ingest_records
+    from core.models import Claim, Company
+
+    def claim_fields(uri):
+        return dict(uri=uri, claim_type='ZZ_TEST_SCORE', amt=Decimal('1'),
+                    source_uri='https://example.org', how_known='test')
+
+    print("=" * 60)
+    print("Bulk Ingest (rolled back)")
+    print("=" * 60)
+    passed = True
+
+    print("\nCompany resolution:")
+    by_ticker = Company.objects.create(uri=f'urn:company:{PREFIX}_old', name='Old Name', ticker='ZZT')
+    by_uri = Company.objects.create(uri=f'urn:company:{PREFIX}_slug', name='Slug Co', ticker=None,
+                                    sector='Retail')
+    with_sector = Company.objects.create(uri=f'urn:company:{PREFIX}_kept', name='Kept', ticker='ZZK',
+                                         sector='Energy')
+    ingest = BulkIngest(fill_sector=True)
+    ticker_row = ingest.company(f'{PREFIX}_new', 'New Name', 'ZZT', 'Tech')
+    uri_row = ingest.company(f'{PREFIX}_slug', 'Slug Co Renamed', 'ZZS', 'Retail')
+    kept_row = ingest.company(f'{PREFIX}_kept2', 'Kept Again', 'ZZK', 'Tech')
+    new_row = ingest.company(f'{PREFIX}_fresh', 'Fresh', 'ZZN', 'Tech')
+    again = ingest.company(f'{PREFIX}_fresh_dup', 'Fresh Dup', 'ZZN', None)
+    for i, row in enumerate([ticker_row, uri_row, kept_row, new_row]):
+        ingest.claim(row, **claim_fields(f'urn:{PREFIX}:resolve:{i}'))
+    result = ingest.save()
+
+    by_ticker.refresh_from_db()
+    by_uri.refresh_from_db()
+    with_sector.refresh_from_db()
+    passed &= check("same ticker: existing company wins over the slug",
+                    ticker_row.instance.pk == by_ticker.pk
+                    and not Company.objects.filter(uri=f'urn:company:{PREFIX}_new').exists()
+                    and by_ticker.name == 'Old Name')
+    passed &= check("fill_sector fills a missing sector", by_ticker.sector == 'Tech')
+    passed &= check("fill_sector keeps an existing sector", with_sector.sector == 'Energy')
+    passed &= check("same slug: company updated",
+                    uri_row.instance.pk == by_uri.pk
+                    and (by_uri.name, by_uri.ticker) == ('Slug Co Renamed', 'ZZS'))
+    passed &= check("staged twice by ticker: created once",
+                    again is new_row and Company.objects.filter(ticker='ZZN').count() == 1)
+    passed &= check("claims point at the resolved companies",
+                    Claim.objects.get(uri=f'urn:{PREFIX}:resolve:0').subject == by_ticker.uri)
+    passed &= check(f"counts: {result.companies_created} created, {result.companies_updated} updated",
+                    (result.companies_created, result.companies_updated) == (1, 2))
+
+    ingest = BulkIngest(fill_sector=False)
+    ingest.company(f'{PREFIX}_nofill', 'No Fill', 'ZZB2', None)
+    ingest.save()
+    ingest = BulkIngest(fill_sector=False)
+    ingest.company(f'{PREFIX}_nofill2', 'No Fill', 'ZZB2', 'Tech')
+    ingest.save()
+    passed &= check("without fill_sector the sector stays empty",
+                    Company.objects.get(ticker='ZZB2').sector is None)
+
+    print("\nExisting claim URIs:")
+    ingest = BulkIngest()
+    company = ingest.company(f'{PREFIX}_fresh', 'Fresh', 'ZZN', 'Tech')
+    ingest.claim(company, **claim_fields(f'urn:{PREFIX}:resolve:0'))
+    ingest.claim(company, **claim_fields(f'urn:{PREFIX}:new'))
+    ingest.claim(company, **dict(claim_fields(f'urn:{PREFIX}:new'), amt=Decimal('2')))
+    result = ingest.save()
+    passed &= check("stored URI skipped, repeated URI staged once",
+                    result.claims_existing == 1 and result.created_uris == {f'urn:{PREFIX}:new'}
+                    and Claim.objects.get(uri=f'urn:{PREFIX}:new').amt == Decimal('1'))
+
+    print("\nCSV with invalid rows:")
+    csv_path = os.path.join(tmp, 'claims.csv')
+    with open(csv_path, 'w') as f:
+        f.write('\n'.join(CSV_ROWS) + '\n')
+    mapping = ClaimMapping(MAPPING)
+    with RecordReader(csv_path) as reader:
+        stats = ingest_records(reader, mapping)
+    for error in stats.errors:
+        print(f"   skipped {error}")
+    stored = dict(Claim.objects.filter(uri__startswith=f'urn:{PREFIX}:zz').values_list('uri', 'amt'))
+    passed &= check(f"{stats.rows} rows: {stats.claims_created} created, {stats.invalid} invalid",
+                    (stats.rows, stats.claims_created, stats.invalid) == (8, 3, 5))
+    passed &= check("invalid rows reported by line",
+                    [error.split(':')[0] for error in stats.errors]
+                    == ['line 4', 'line 5', 'line 6', 'line 7', 'line 8'])
+    passed &= check("out-of-range amount skipped, not raised", 'line 6: amt' in ' '.join(stats.errors))
+    passed &= check("valid rows stored, amounts rounded to the field",
+                    stored == {f'urn:{PREFIX}:zza:score': Decimal('12.50'),
+                               f'urn:{PREFIX}:zzb:score': Decimal('7.00'),
+                               f'urn:{PREFIX}:zzg:score': Decimal('1.00')})
+
+    with RecordReader(csv_path) as reader:
+        stats = ingest_records(reader, mapping)
+    passed &= check("second run: all claims already present",
+                    (stats.claims_created, stats.claims_existing) == (0, 3))
+
+    print("\nGzipped JSONL:")
+    jsonl_path = os.path.join(tmp, 'claims.jsonl.gz')
+    with gzip.open(jsonl_path, 'wt') as f:
+        for i in range(5):
+            f.write(json.dumps({'ticker': f'ZZJ{i}', 'name': f'Json {i}', 'score': i,
+                                'date': '2024-02-01', 'label': 'ok'}) + '\n')
+        f.write('{not json\n')
+        f.write('[1, 2]\n')
+        f.write('\n')
+        f.write(json.dumps({'ticker': 'ZZJ9', 'score': {'nested': 1}}) + '\n')
+    batches = []
+    with RecordReader(jsonl_path) as reader:
+        stats = ingest_records(reader, mapping, batch_size=2,
+                               on_batch=lambda stats: batches.append(stats.rows))
+    for error in stats.errors:
+        print(f"   skipped {error}")
+    passed &= check(f"{stats.claims_created} claims from the gzipped file", stats.claims_created == 5)
+    passed &= check("bad JSON and non-object lines reported",
+                    stats.errors[:2] == ['line 6: invalid JSON: Expecting property name enclosed in double quotes',
+                                         'line 7: not a JSON object'])
+    passed &= check("nested value that isn't a number rejected",
+                    len(stats.errors) == 3 and stats.errors[2].startswith('line 9: amt'))
+    passed &= check(f"saved in batches of 2 ({batches})", batches == [2, 4, 6, 8])
+    return passed
+
+
+if __name__ == '__main__':
+    if run():
+        print("\nBULK INGEST TEST PASSED")
+    else:
+        print("\nBULK INGEST TEST FAILED")
+        sys.exit(1)
@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+"""Test chunked Claude parsing against a local stand-in for the Messages API.
+
+Starts an HTTP server on localhost that answers POST /v1/messages the way
+Claude would for simple "NAME PRICE" receipt lines, points the shared
+client at it (ANTHROPIC_BASE_URL) and checks that:
+
+- only item lines are sent: store, date and total are read locally;
+- a long receipt is split into chunks, parsed concurrently and merged in
+  line order;
+- the chunks share a few keep-alive connections;
+- a second receipt with the same products (new prices and date) makes no
+  request at all: known item lines come from the line cache;
+- lines starting with a brand in the database are resolved locally and
+  never sent, except single-word brands that are everyday words; the
+  brands are created in a transaction that is rolled back.
+
+No API key or network access needed.
+
+Usage:
+    python tests/test_claude_chunking.py
+    python tests/test_claude_chunking.py --items 300 --latency 0.5
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add backend to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+# Unbranded products, so only Claude (the stand-in) can parse them
+PRODUCTS = ['BANANAS', 'WHOLE MILK GAL', 'LARGE EGGS 12CT', 'SOURDOUGH LOAF',
+            'BABY SPINACH', 'ROMA TOMATOES', 'CHEDDAR BLOCK', 'GROUND BEEF',
+            'AVOCADOS 4CT', 'ORANGE JUICE', 'BROWN RICE 2LB', 'RED ONIONS']
+
+# Made-up brands the known-brands check stores, as Products and BrandMappings
+PRODUCT_BRANDS = ['Zorbly', 'Crunchara', 'Quenchwell Farms', 'Velvetine']
+MAPPED_BRANDS = ['Mornglow', 'Brisket Brothers']
+# A brand that is also an everyday word, so its lines must still go to Claude
+COMMON_WORD_BRAND = 'All'
+COMMON_WORD_LINE = 'ALL PURPOSE FLOUR'
+
+NUMBERED_LINE = re.compile(r'^(\d+): (.*)$', re.MULTILINE)
+PRICED_LINE = re.compile(r'^(.*?)\s+(\d+\.\d{2})$')
+
+
+class StandIn:
+    """Records what the fake Messages API was sent."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.connections = set()
+        self.lines_sent = []
+
+    def reply(self, prompt):
+        """Claude-like JSON for the numbered receipt lines in the prompt."""
+        section = prompt.split('Receipt text', 1)[1].split('Your task:', 1)[0]
+        parsed = {'items': []}
+        for number, line in NUMBERED_LINE.findall(section):
+            self.lines_sent.append(line)
+            match = PRICED_LINE.match(line)
+            if not match:
+                continue
+            name, price = match.groups()
+            parsed['items'].append({
+                'product_name': name.title(),
+                'brand': 'Store Brand',
+                'parent_company': 'Corner Grocery',
+                'price': float(price),
+                'line': int(number),
+            })
+        return parsed
+
+
+def make_handler(stand_in):
+    class MessagesHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # Keep-alive, like the real API
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            with stand_in.lock:
+                stand_in.requests += 1
+                stand_in.in_flight += 1
+                stand_in.max_in_flight = max(stand_in.max_in_flight, stand_in.in_flight)
+                stand_in.connections.add(self.client_address)
+                parsed = stand_in.reply(body['messages'][0]['content'])
+            time.sleep(stand_in.latency)
+            with stand_in.lock:
+                stand_in.in_flight -= 1
+
+            response = json.dumps({
+                'id': f'msg_{stand_in.requests}',
+                'type': 'message',
+                'role': 'assistant',
+                'model': body['model'],
+                'content': [{'type': 'text', 'text': json.dumps(parsed)}],
+                'stop_reason': 'end_turn',
+                'stop_sequence': None,
+                'usage': {'input_tokens': 0, 'output_tokens': 0},
+            }).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(response)))
+            self.end_headers()
+            self.wfile.write(response)
+
+        def log_message(self, format, *args):
+            pass
+
+    return MessagesHandler
+
+
+def make_receipt(items, seed, products=PRODUCTS):
+    lines = ['CORNER GROCERY', '123 MAIN ST', f'2026-01-{seed:02d}', 'CASHIER 7']
+    total = 0.0
+    for i in range(items):
+        price = 1 + (i * 37 + seed * 11) % 900 / 100
+        total += price
+        lines.append(f'{products[i % len(products)]} #{i // len(products)} {price:.2f}')
+    lines += [f'SUBTOTAL {total:.2f}', 'TAX 0.00', f'TOTAL {total:.2f}']
+    return '\n'.join(lines), round(total, 2)
+
+
+def check(label, ok):
+    print(f"   {'OK  ' if ok else 'FAIL'} {label}")
+    return ok
+
+
+def check_known_brands(stand_in, parse_receipt_with_claude):
+    """Lines starting with a brand in the database are resolved locally."""
+    from core.brand_matcher import brand_index
+    from core.models import BrandMapping, Company, Product
+
+    company = Company.objects.create(uri='urn:company:zz_chunking_test', name='Chunking Test Foods')
+    for brand in PRODUCT_BRANDS:
+        Product.objects.create(name=f'{brand} Item', brand_name=brand, company=company, category='test')
+    for brand in MAPPED_BRANDS + [COMMON_WORD_BRAND]:
+        BrandMapping.objects.create(brand_name=brand, brand_name_normalized=brand.lower(), company=company)
+    # Signals invalidate the index on commit, which never comes here
+    brand_index.invalidate()
+
+    brands = PRODUCT_BRANDS + MAPPED_BRANDS
+    stand_in.requests, stand_in.lines_sent = 0, []
+    products = [f'{brand.upper()} ITEM' for brand in brands] + [COMMON_WORD_LINE] + PRODUCTS[:3]
+    text, total = make_receipt(len(products) * 3, seed=3, products=products)
+    started = time.perf_counter()
+    parsed = parse_receipt_with_claude(text)
+    seconds = time.perf_counter() - started
+    item_lines = [line for line in stand_in.lines_sent if '#' in line]
+    branded = [item for item in parsed['items'] if item['brand'] in brands]
+    print(f"   {len(branded)}/{len(parsed['items'])} items resolved locally, "
+          f"{len(item_lines)} item lines sent, {seconds:.2f}s")
+    passed = check("branded lines never sent",
+                   all(line.split(' #')[0] in PRODUCTS + [COMMON_WORD_LINE] for line in item_lines))
+    passed &= check("all items, with brands and company from the database",
+                    len(parsed['items']) == len(products) * 3
+                    and len(branded) == len(brands) * 3
+                    and all(item['parent_company'] == company.name for item in branded))
+    passed &= check(f"\"{COMMON_WORD_LINE}\" sent to Claude despite brand \"{COMMON_WORD_BRAND}\"",
+                    sum(line.startswith(COMMON_WORD_LINE) for line in item_lines) == 3)
+    return passed
+
+
+def run(item_count, latency):
+    stand_in = StandIn(latency)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(stand_in))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    os.environ['ANTHROPIC_BASE_URL'] = f'http://127.0.0.1:{server.server_port}'
+    os.environ['ANTHROPIC_API_KEY'] = 'stand-in'
+    # Fresh in-memory receipt cache, so earlier runs can't answer for Claude
+    os.environ['RECEIPT_CACHE_BACKEND'] = 'django.core.cache.backends.locmem.LocMemCache'
+    os.environ['RECEIPT_CACHE_LOCATION'] = 'claude-chunking-test'
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alonovo.settings')
+    import django
+    django.setup()
+    from django.conf import settings
+    from django.db import transaction
+    from core.brand_matcher import brand_index
+    from core.receipt_parser import parse_receipt_with_claude
+
+    print("=" * 60)
+    print("Chunked Claude Parsing (local Messages API stand-in)")
+    print(f"{item_count} items, {latency:.2f}s per request, "
+          f"{settings.CLAUDE_PARSE_CHUNK_LINES} lines per chunk, "
+          f"{settings.CLAUDE_PARSE_CONCURRENCY} concurrent")
+    print("=" * 60)
+    passed = True
+
+    print("\nLong receipt, nothing cached:")
+    text, total = make_receipt(item_count, seed=1)
+    chunks = -(-item_count // settings.CLAUDE_PARSE_CHUNK_LINES)
+    started = time.perf_counter()
+    parsed = parse_receipt_with_claude(text)
+    seconds = time.perf_counter() - started
+    names = [item['product_name'] for item in parsed['items']]
+    expected = [f'{PRODUCTS[i % len(PRODUCTS)]} #{i // len(PRODUCTS)}'.title()
+                for i in range(item_count)]
+    print(f"   {stand_in.requests} requests in {seconds:.2f}s "
+          f"(one at a time: ~{chunks * latency:.2f}s)")
+    passed &= check(f"{chunks} chunks for {item_count} item lines", stand_in.requests == chunks)
+    passed &= check("only item lines sent",
+                    sorted(stand_in.lines_sent) == sorted(text.splitlines()[4:4 + item_count]))
+    passed &= check("all items, in receipt order", names == expected)
+    passed &= check("store, date and total read locally",
+                    (parsed['store_name'], parsed['date'], parsed['total'])
+                    == ('Corner Grocery', '2026-01-01', total))
+    if chunks > 1 and settings.CLAUDE_PARSE_CONCURRENCY > 1:
+        passed &= check("chunks sent concurrently", stand_in.max_in_flight > 1)
+    passed &= check(f"{len(stand_in.connections)} connection(s) reused",
+                    len(stand_in.connections) <= settings.CLAUDE_PARSE_CONCURRENCY)
+
+    print("\nSame products, new prices and date:")
+    stand_in.requests, stand_in.lines_sent = 0, []
+    text, total = make_receipt(item_count, seed=2)
+    parsed = parse_receipt_with_claude(text)
+    print(f"   {stand_in.requests} request(s), {len(stand_in.lines_sent)} lines sent")
+    passed &= check("no request: every item line known", stand_in.requests == 0)
+    passed &= check("all items, with this receipt's prices",
+                    [item['product_name'] for item in parsed['items']] == expected
+                    and abs(sum(item['price'] for item in parsed['items']) - total) < 0.01)
+    passed &= check("date and total from this receipt",
+                    (parsed['date'], parsed['total']) == ('2026-01-02', total))
+
+    print("\nKnown brands (rolled back):")
+    with transaction.atomic():
+        passed &= check_known_brands(stand_in, parse_receipt_with_claude)
+        transaction.set_rollback(True)
+    brand_index.invalidate()
+
+    server.shutdown()
+    return passed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--items', type=int, default=150, help="Line items on the receipt")
+    parser.add_argument('--latency', type=float, default=0.3,
+                        help="Seconds the stand-in takes per request")
+    args = parser.parse_args()
+
+    if run(args.items, args.latency):
+        print("\nCHUNKED PARSING TEST PASSED")
+    else:
+        print("\nCHUNKED PARSING TEST FAILED")
+        sys.exit(1)
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+"""Test the NZDPU fetch of import_ghg_data against a local stub server.
+
+Starts an HTTP server on localhost that answers the NZDPU search API with
+generated disclosures, points NZDPU_SEARCH_URL at it and checks that:
+
+- every page is requested exactly once, the pages after the first
+  concurrently, and the merged companies match a sequential merge;
+- the raw pages are saved to a gzipped snapshot that the next run reads
+  without any request;
+- --refresh (refresh=True) and a truncated snapshot fetch again;
+- a failing page fails the fetch and leaves the previous snapshot alone.
+
+No network access needed.
+
+Usage:
+    python tests/test_nzdpu_fetch.py
+    python tests/test_nzdpu_fetch.py --disclosures 20000 --latency 0.5
+"""
+
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Add backend to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+SECTORS = ['Oil & Gas', 'Utilities', 'Software', 'Food & Beverage', 'Mining']
+
+
+def make_disclosures(count):
+    """Several reporting years per company, like the real search results."""
+    return [{
+        'company_name': f'Company {i % (count // 3 + 1)}',
+        'sics_sector': SECTORS[i % len(SECTORS)],
+        'total_s1_emissions_ghg': float(i * 137 % 100000),
+        'reporting_year': 2019 + i % 5,
+        'jurisdiction': 'US',
+        'legal_entity_identifier': f'LEI{i:08d}',
+    } for i in range(count)]
+
+
+class Stub:
+    """Serves the disclosures and records what was asked for."""
+
+    def __init__(self, disclosures, latency):
+        self.disclosures = disclosures
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.starts = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.fail_start = None
+
+    def reset(self):
+        self.starts, self.max_in_flight = [], 0
+
+
+def make_handler(stub):
+    class SearchHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers['Content-Length']))
+            query = parse_qs(urlparse(self.path).query)
+            start, limit = int(query['start'][0]), int(query['limit'][0])
+            with stub.lock:
+                stub.starts.append(start)
+                stub.in_flight += 1
+                stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+            time.sleep(stub.latency)
+            with stub.lock:
+                stub.in_flight -= 1
+
+            if start == stub.fail_start:
+                self.send_error(503)
+                return
+            response = json.dumps({
+                'total_disclosures': len(stub.disclosures),
+                'items': stub.disclosures[start:start + limit],
+            }).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(response)))
+            self.end_headers()
+            self.wfile.write(response)
+
+        def log_message(self, format, *args):
+            pass
+
+    return SearchHandler
+
+
+def check(label, ok):
+    print(f"   {'OK  ' if ok else 'FAIL'} {label}")
+    return ok
+
+
+def run(disclosure_count, latency):
+    disclosures = make_disclosures(disclosure_count)
+    stub = Stub(disclosures, latency)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(stub))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    snapshot_dir = tempfile.TemporaryDirectory()
+
+    os.environ['NZDPU_SEARCH_URL'] = f'http://127.0.0.1:{server.server_port}/wis/search'
+    os.environ['NZDPU_SNAPSHOT_PATH'] = os.path.join(snapshot_dir.name, 'nzdpu.jsonl.gz')
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alonovo.settings')
+    import django
+    django.setup()
+    from django.conf import settings
+    from core.management.commands.import_ghg_data import NZDPU_PAGE_SIZE, Command
+
+    def fetch(refresh=False):
+        return Command(stdout=io.StringIO()).fetch_nzdpu_data(refresh)
+
+    expected = {}
+    for item in disclosures:
+        name = item['company_name']
+        if name not in expected or item['reporting_year'] > expected[name]['reporting_year']:
+            expected[name] = item
+    pages = -(-disclosure_count // NZDPU_PAGE_SIZE)
+    path = settings.NZDPU_SNAPSHOT_PATH
+
+    print("=" * 60)
+    print("NZDPU Fetch (local stub server)")
+    print(f"{disclosure_count} disclosures, {pages} pages, {latency:.2f}s per request, "
+          f"{settings.NZDPU_FETCH_WORKERS} workers")
+    print("=" * 60)
+    passed = True
+
+    print("\nNo snapshot:")
+    started = time.perf_counter()
+    companies = fetch()
+    seconds = time.perf_counter() - started
+    print(f"   {len(stub.starts)} requests in {seconds:.2f}s (one at a time: ~{pages * latency:.2f}s)")
+    passed &= check("every page requested once",
+                    sorted(stub.starts) == list(range(0, disclosure_count, NZDPU_PAGE_SIZE)))
+    if pages > 2 and settings.NZDPU_FETCH_WORKERS > 1:
+        passed &= check("pages fetched concurrently", stub.max_in_flight > 1)
+    passed &= check(f"{len(companies)} companies, latest year of each", companies == expected)
+    passed &= check("snapshot saved", os.path.exists(path))
+    print(f"   snapshot: {os.path.getsize(path):,} bytes")
+
+    print("\nRerun:")
+    stub.reset()
+    started = time.perf_counter()
+    companies = fetch()
+    print(f"   {len(stub.starts)} requests in {time.perf_counter() - started:.2f}s")
+    passed &= check("read from the snapshot, no request", not stub.starts and companies == expected)
+
+    print("\nRefresh:")
+    stub.reset()
+    passed &= check("every page fetched again",
+                    fetch(refresh=True) == expected and len(stub.starts) == pages)
+
+    print("\nTruncated snapshot:")
+    with open(path, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        f.write(data[:len(data) // 2])
+    stub.reset()
+    passed &= check("fetched again", fetch() == expected and len(stub.starts) == pages)
+
+    if pages > 1:
+        print("\nFailing page:")
+        with open(path, 'rb') as f:
+            before = f.read()
+        stub.reset()
+        stub.fail_start = NZDPU_PAGE_SIZE
+        try:
+            fetch(refresh=True)
+            failed = False
+        except Exception:
+            failed = True
+        stub.fail_start = None
+        passed &= check("fetch raises", failed)
+        with open(path, 'rb') as f:
+            passed &= check("previous snapshot kept", f.read() == before)
+
+    server.shutdown()
+    snapshot_dir.cleanup()
+    return passed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--disclosures', type=int, default=5200, help="Rows the stub serves")
+    parser.add_argument('--latency', type=float, default=0.2,
+                        help="Seconds the stub takes per request")
+    args = parser.parse_args()
+
+    if run(args.disclosures, args.latency):
+        print("\nNZDPU FETCH TEST PASSED")
+    else:
+        print("\nNZDPU FETCH TEST FAILED")
+        sys.exit(1)
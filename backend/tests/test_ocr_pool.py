@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""Test that the OCR pool (core.receipt_ocr.OCRPool) survives dead workers.
+
+The workers load a stand-in `easyocr` module written to a temp directory
+(no models or Django needed). The test checks that:
+
+- after a worker is killed, the next image is still read: the broken
+  executor is replaced, warmed again and the image retried;
+- an image whose worker dies on both attempts fails that one image only,
+  and the pool keeps working afterwards.
+
+Usage:
+    python tests/test_ocr_pool.py
+    python tests/test_ocr_pool.py --workers 4
+"""
+
+import argparse
+import os
+import signal
+import sys
+import tempfile
+import time
+
+# Add backend to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+# Kills its own process on b'crash', like a worker killed for memory mid-image
+STUB_EASYOCR = '''
+import os
+import signal
+
+
+class Reader:
+    def __init__(self, languages, gpu=True):
+        pass
+
+    def readtext(self, image, detail=1):
+        if image == b'crash':
+            os.kill(os.getpid(), signal.SIGKILL)
+        return [image.decode(), f'pid {os.getpid()}']
+'''
+
+
+def check(label, ok):
+    print(f"   {'OK  ' if ok else 'FAIL'} {label}")
+    return ok
+
+
+def run(workers):
+    stub_dir = tempfile.TemporaryDirectory()
+    with open(os.path.join(stub_dir.name, 'easyocr.py'), 'w') as f:
+        f.write(STUB_EASYOCR)
+    # Spawned workers get the parent's sys.path
+    sys.path.insert(0, stub_dir.name)
+    from core.receipt_ocr import OCRPool
+
+    print("=" * 60)
+    print(f"OCR Pool ({workers} workers, stand-in reader)")
+    print("=" * 60)
+    passed = True
+    pool = OCRPool(workers=workers, max_pending=4, timeout=30, queue_timeout=30)
+    try:
+        pids = pool.warm()
+        passed &= check(f"{len(pids)} workers warm", len(pids) == workers)
+        passed &= check("image read", pool.readtext(b'MILK 3.49', 0)[0] == 'MILK 3.49')
+
+        print("\nWorker killed while idle:")
+        os.kill(next(iter(pids)), signal.SIGKILL)
+        # Wait for the executor to notice, or the image may reach the live worker
+        deadline = time.monotonic() + 10
+        while not pool._executor._broken and time.monotonic() < deadline:
+            time.sleep(0.05)
+        try:
+            lines = pool.readtext(b'EGGS 4.99', 0)
+        except Exception as e:
+            lines = [f'{type(e).__name__}: {e}']
+        print(f"   got {lines}")
+        stats = pool.stats()
+        passed &= check("next image read after a restart",
+                        lines[0] == 'EGGS 4.99' and stats['restarts'] == 1)
+        passed &= check("not counted as a failure", stats['failed'] == 0)
+        new_pids = pool.warm()
+        passed &= check("new workers started", len(new_pids) == workers and not new_pids & pids)
+
+        print("\nWorker dies on the image itself:")
+        try:
+            pool.readtext(b'crash', 0)
+            failed = False
+        except Exception as e:
+            print(f"   raised {type(e).__name__}")
+            failed = True
+        stats = pool.stats()
+        passed &= check("retried once, then failed",
+                        failed and stats['restarts'] == 2 and stats['failed'] == 1)
+        passed &= check("pool restarted again for the next image",
+                        pool.readtext(b'BREAD 2.50', 0)[0] == 'BREAD 2.50' and pool.stats()['restarts'] == 3)
+        print(f"   stats: {pool.stats()}")
+    finally:
+        pool.shutdown()
+        stub_dir.cleanup()
+    return passed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--workers', type=int, default=2, help="Pool worker processes")
+    args = parser.parse_args()
+
+    if run(args.workers):
+        print("\nOCR POOL TEST PASSED")
+    else:
+        print("\nOCR POOL TEST FAILED")
+        sys.exit(1)
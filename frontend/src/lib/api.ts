@@ -9,13 +9,37 @@ function siteBase(): string {
     return base;
 }
 
-export async function fetchCompanies(): Promise<Company[]> {
-    const response = await fetch(`${apiBase()}/companies/`);
-    if (!response.ok) {
-        throw new Error('Failed to fetch companies');
+/** Just what a company card renders (see routes/+page.svelte). */
+export const COMPANY_CARD_PARAMS = {
+    fields: 'id,uri,ticker,name,sector,website',
+    expand: 'badges,value_snapshots',
+};
+
+/**
+ * Yield /companies/ one cursor page at a time, so callers can render the
+ * first page while the rest load.
+ */
+export async function* streamCompanies(params: Record<string, string> = COMPANY_CARD_PARAMS): AsyncGenerator<Company[]> {
+    let query: string | null = new URLSearchParams(params).toString();
+    while (query !== null) {
+        const response = await fetch(`${apiBase()}/companies/?${query}`);
+        if (!response.ok) {
+            throw new Error('Failed to fetch companies');
+        }
+        const data = await response.json();
+        yield data.results;
+        // Keep our own base path; only the cursor query comes from `next`
+        // (a relative link, see CompanyCursorPagination)
+        query = data.next ? new URL(data.next, window.location.href).search.slice(1) : null;
     }
-    const data = await response.json();
-    return data.results || data;
+}
+
+export async function fetchCompanies(params: Record<string, string> = COMPANY_CARD_PARAMS): Promise<Company[]> {
+    const companies: Company[] = [];
+    for await (const page of streamCompanies(params)) {
+        companies.push(...page);
+    }
+    return companies;
 }
 
 export async function fetchCompany(ticker: string): Promise<Company> {
@@ -44,12 +68,7 @@ export async function fetchCompanyClaims(ticker: string): Promise<ClaimData[]> {
 }
 
 export async function fetchCompaniesBySector(sector: string): Promise<Company[]> {
-    const response = await fetch(`${apiBase()}/companies/?sector=${encodeURIComponent(sector)}`);
-    if (!response.ok) {
-        throw new Error('Failed to fetch companies by sector');
-    }
-    const data = await response.json();
-    return data.results || data;
+    return fetchCompanies({ ...COMPANY_CARD_PARAMS, sector });
 }
 
 export async function fetchSectors(): Promise<string[]> {
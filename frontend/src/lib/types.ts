@@ -35,7 +35,7 @@ export interface Company {
     name: string;
     sector: string;
     website?: string;
-    scores: CompanyScore[];
+    scores?: CompanyScore[];
     badges?: Badge[];
     value_snapshots?: ValueSnapshot[];
 }